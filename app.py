@@ -4,266 +4,4133 @@ Méthode 90 jours - Version 2.0 Refactorisée
 """
 
 import streamlit as st
+from streamlit.logger import get_logger
 import json
 import sqlite3
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import date, datetime
 from pathlib import Path
 import random
 import math
 import re
+import os
+import codecs
+import hashlib
+import tempfile
+import threading
+import bisect
+import heapq
+import time
+import queue
+import itertools
+import mmap
+import struct
+import zlib
+import gzip
+import shutil
+import functools
+import numpy as np
+from collections import Counter, namedtuple
+from operator import itemgetter
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from content_dedup import KIND_CARD, MinHasher, card_text, item_entries, near_duplicate_groups
+from content_store import ContentError, ContentStore, ProcessLock, atomic_write_json, fsync_directory
+from text_normalize import normalize_key, normalize_text, tokenize
+
+try:
+    import ijson  # Parseur JSON en flux (optionnel, plus rapide)
+except ImportError:
+    ijson = None
+
+logger = get_logger(__name__)  # Journal du serveur (niveau réglé par --logger.level)
 
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
-DATA_FILE = Path("data.json")
-DB_FILE = Path("progress.db")
-APP_TITLE = "🇬🇧 Maîtrise l'Anglais en 90 Jours"
+DATA_FILE = Path("data.json")
+DB_FILE = Path("progress.db")
+DB_SHARDS = int(os.environ.get("PROGRESS_DB_SHARDS", "1"))  # Nombre de fichiers SQLite
+DB_POOL_SIZE = 4  # Connexions simultanées par shard
+SHARD_MAP_FILE = Path("shards.json")
+STORAGE_BACKEND = os.environ.get("PROGRESS_BACKEND", "sqlite")  # "sqlite" ou "memory"
+APP_TITLE = "🇬🇧 Maîtrise l'Anglais en 90 Jours"
+IMPORT_CHUNK_SIZE = 64 * 1024  # Taille des blocs lus lors d'un import JSON
+SEARCH_MAX_RESULTS = 10
+GENERATED_EXERCISES_FILE = Path("generated_exercises.json")  # Cache des exercices générés
+PRACTICE_SIZE = 5  # Exercices générés proposés à la fois
+EXPRESSIONS_PAGE_SIZE = 25  # Expressions affichées par page dans un chapitre
+GRAMMAR_CACHE_SIZE = 10000  # Phrases analysées gardées en mémoire
+SPELLING_WORDS_FILE = Path("words_en.txt")  # Dictionnaire anglais fourni
+SPELLING_INDEX_FILE = Path("spelling.idx")  # Index orthographique (généré)
+NLP_WORKERS = 2  # Threads de l'analyse nltk
+NLP_TIMEOUT = 0.5  # Attente maximale (s) de l'analyse nltk par le script
+NLP_CACHE_SIZE = 10000  # Phrases analysées par nltk gardées en mémoire
+LEADERBOARD_SIZE = 20  # Utilisateurs affichés dans le classement
+RECOMMEND_WEAK_QUALITY = 3  # Note SRS en dessous de laquelle la leçon du mot est reproposée
+RECOMMEND_REVIEW_BOOST = 10000  # Priorité ajoutée à une leçon à revoir (passe devant la suite)
+RECOMMEND_SIZE = 3  # Recommandations affichées sur le tableau de bord
+FORECAST_DAYS = 30  # Horizon de la prévision des révisions
+FORECAST_QUALITY = {0: 0.15, 3: 0.35, 5: 0.5}  # Notes supposées sans historique suffisant
+FORECAST_MIN_REVIEWS = 20  # Rappels minimum pour utiliser la distribution réelle des notes
+FORECAST_CACHE_SIZE = 1000  # Prévisions gardées en mémoire (une par utilisateur)
+ROWS_WRITTEN_PER_REVIEW = 6  # srs_cards, srs_reviews, row_changes (×2), due_counts, user_stats
+MIGRATION_BATCH_SIZE = 5000  # Lignes recopiées par transaction lors d'une migration
+DELTA_CHUNK_SIZE = 5000  # Modifications lues par transaction lors d'un export incrémental
+ARCHIVE_DIR = Path("archives")  # Données des utilisateurs inactifs (un fichier par utilisateur)
+ARCHIVE_AFTER_DAYS = 180  # Inactivité (jours) avant archivage
+VACUUM_PAGES_PER_STEP = 1000  # Pages libérées par étape de VACUUM incrémental
+BACKGROUND_JOBS = os.environ.get("BACKGROUND_JOBS", "1") == "1"  # Tâches de fond dans le serveur
+SCHEDULER_LOCK_FILE = Path("scheduler.lock")  # Élection du processus qui gère la base
+SCHEDULER_TICK = 5  # Intervalle (s) entre deux passages du planificateur de tâches
+CACHE_STATS_INTERVAL = 15 * 60  # Intervalle (s) entre deux traces des statistiques de cache
+BACKUP_DIR = Path("backups")
+BACKUP_KEEP = 7  # Sauvegardes complètes conservées (avec leurs incrémentales)
+BACKUP_PAGES_PER_STEP = 256  # Pages SQLite copiées par étape de sauvegarde
+BACKUP_STEP_PAUSE = 0.005  # Pause (s) entre deux étapes : laisse passer les écritures
+SRS_SCHEDULER = os.environ.get("SRS_SCHEDULER", "sm2")  # "sm2" ou "fsrs"
+FSRS_RETENTION = 0.9  # Probabilité de rappel visée par FSRS
+FSRS_MIN_REVIEWS = 50  # Rappels minimum avant d'ajuster les paramètres d'un apprenant
+FSRS_FIT_ITERATIONS = 100
+
+# =============================================================================
+# UTILITAIRES
+# =============================================================================
+
+def file_sha256(path):
+    """Empreinte sha256 (hexadécimale) d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+EPOCH_JULIAN = 2440587.5  # julianday('1970-01-01') dans SQLite
+
+def epoch_day(offset=0):
+    """Numéro du jour (jours depuis le 01/01/1970), décalé de offset jours"""
+    return date.today().toordinal() - EPOCH_ORDINAL + offset
+
+def epoch_seconds():
+    """Horodatage Unix courant (secondes)"""
+    return int(time.time())
+
+def day_from_iso(value):
+    """Convertit une date ISO (ancien format) en numéro de jour"""
+    if not value:
+        return 0  # Sans date : à réviser tout de suite
+    return date.fromisoformat(value[:10]).toordinal() - EPOCH_ORDINAL
+
+def seconds_from_iso(value):
+    """Convertit un horodatage ISO (ancien format) en secondes Unix"""
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value).timestamp())
+
+# =============================================================================
+# CLASSE : PLANIFICATEURS SRS
+# =============================================================================
+
+# État d'une carte utilisé par les planificateurs (stability/difficulty : FSRS)
+ReviewState = namedtuple("ReviewState", "interval easiness repetitions stability difficulty")
+
+def sm2_review(interval, easiness, repetitions, quality):
+    """
+    Applique l'algorithme SM-2 à une révision.
+    quality: 0-5 (0=échec total, 5=parfait)
+    Retourne (intervalle en jours, facteur d'aisance, répétitions)
+    """
+    # Calcul du nouveau facteur d'aisance (SM-2)
+    easiness = max(1.3, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    
+    # Si la réponse est incorrecte (quality < 3)
+    if quality < 3:
+        repetitions = 0
+        interval = 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = math.ceil(interval * easiness)
+    
+    return interval, easiness, repetitions
+
+def sm2_review_many(interval, easiness, repetitions, quality):
+    """Version vectorisée (tableaux NumPy) de sm2_review, même résultat carte par carte"""
+    easiness = np.maximum(1.3, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    failed = quality < 3
+    repetitions = np.where(failed, 0, repetitions + 1)
+    interval = np.where(
+        failed | (repetitions == 1), 1,
+        np.where(repetitions == 2, 6, np.ceil(interval * easiness))
+    )
+    return interval, easiness, repetitions
+
+class Scheduler(ABC):
+    """
+    Planificateur de révisions : calcule le nouvel état d'une carte après
+    une réponse. SM-2 par défaut, FSRS en option (SRS_SCHEDULER=fsrs).
+    """
+    
+    name = None
+    
+    @abstractmethod
+    def review(self, state, quality, elapsed_days, params=None):
+        """
+        state: ReviewState avant la révision, quality: 0-5,
+        elapsed_days: jours écoulés depuis la révision précédente,
+        params: paramètres propres à l'apprenant (ou None).
+        Retourne le nouveau ReviewState (interval : jours avant la prochaine révision)
+        """
+
+class SM2Scheduler(Scheduler):
+    """Algorithme SM-2 historique (facteur d'aisance)"""
+    
+    name = "sm2"
+    
+    def review(self, state, quality, elapsed_days, params=None):
+        interval, easiness, repetitions = sm2_review(
+            state.interval, state.easiness, state.repetitions, quality
+        )
+        return state._replace(interval=interval, easiness=easiness, repetitions=repetitions)
+
+class FSRSScheduler(Scheduler):
+    """
+    Modèle de mémoire FSRS : chaque carte a une stabilité (jours pour que la
+    probabilité de rappel tombe à 90 %) et une difficulté. L'intervalle vise
+    la rétention souhaitée, ce qui évite les révisions inutiles de SM-2.
+    Les formules acceptent des scalaires comme des tableaux NumPy : le même
+    code sert à planifier une carte et à rejouer tout un historique.
+    """
+    
+    name = "fsrs"
+    DECAY = -0.5
+    FACTOR = 19 / 81
+    MAX_INTERVAL = 36500
+    DEFAULT_PARAMS = np.array([
+        0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+        0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755,
+    ])
+    LOWER = np.array([0.1, 0.1, 0.1, 0.1, 1, 0.1, 0.1, 0, 0, 0, 0.01, 0.5, 0.01, 0.01, 0.01, 0, 1])
+    UPPER = np.array([100, 100, 100, 100, 10, 5, 5, 0.75, 4, 0.8, 3, 5, 0.2, 0.9, 3, 1, 6])
+    
+    def __init__(self, desired_retention=FSRS_RETENTION):
+        self.desired_retention = desired_retention
+    
+    @staticmethod
+    def grade(quality):
+        """Note 0-5 → note FSRS 1-4 (à revoir, difficile, bien, facile)"""
+        return np.clip(np.asarray(quality) - 1, 1, 4)
+    
+    @classmethod
+    def retrievability(cls, elapsed_days, stability):
+        """Probabilité de rappel après elapsed_days jours"""
+        return (1 + cls.FACTOR * elapsed_days / stability) ** cls.DECAY
+    
+    @staticmethod
+    def initial_stability(w, grade):
+        return sum(w[i] * (grade == i + 1) for i in range(4))
+    
+    @staticmethod
+    def initial_difficulty(w, grade):
+        return np.clip(w[4] - (grade - 3) * w[5], 1, 10)
+    
+    @staticmethod
+    def next_difficulty(w, difficulty, grade):
+        difficulty = difficulty - w[6] * (grade - 3)
+        # Retour progressif vers la difficulté initiale d'une carte « facile »
+        return np.clip(w[7] * (w[4] - w[5]) + (1 - w[7]) * difficulty, 1, 10)
+    
+    @staticmethod
+    def next_stability(w, difficulty, stability, retrievability, grade):
+        recalled = stability * (
+            1 + np.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+            * (np.exp((1 - retrievability) * w[10]) - 1)
+            * np.where(grade == 2, w[15], 1) * np.where(grade == 4, w[16], 1)
+        )
+        forgotten = (
+            w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1)
+            * np.exp((1 - retrievability) * w[14])
+        )
+        return np.where(grade > 1, recalled, np.minimum(forgotten, stability))
+    
+    def next_interval(self, stability):
+        """Jours avant que la probabilité de rappel atteigne la rétention souhaitée"""
+        interval = stability / self.FACTOR * (self.desired_retention ** (1 / self.DECAY) - 1)
+        return int(min(max(1, round(interval)), self.MAX_INTERVAL))
+    
+    def review(self, state, quality, elapsed_days, params=None):
+        w = self.DEFAULT_PARAMS if params is None else params
+        grade = int(self.grade(quality))
+        if state.stability is None:
+            # Première révision (ou carte planifiée jusque-là par SM-2)
+            stability = float(self.initial_stability(w, grade))
+            difficulty = float(self.initial_difficulty(w, grade))
+        else:
+            recall = self.retrievability(elapsed_days, state.stability)
+            stability = float(self.next_stability(w, state.difficulty, state.stability, recall, grade))
+            difficulty = float(self.next_difficulty(w, state.difficulty, grade))
+        return state._replace(
+            interval=self.next_interval(stability),
+            repetitions=0 if grade == 1 else state.repetitions + 1,
+            stability=stability,
+            difficulty=difficulty,
+        )
+
+SCHEDULERS = {"sm2": SM2Scheduler, "fsrs": FSRSScheduler}
+
+def get_scheduler(name=SRS_SCHEDULER):
+    """Instancie le planificateur choisi ("sm2" ou "fsrs")"""
+    if name not in SCHEDULERS:
+        raise ValueError(f"Planificateur inconnu : {name}")
+    return SCHEDULERS[name]()
+
+def fsrs_replay_loss(W, grades, elapsed, mask):
+    """
+    Rejoue l'historique de toutes les cartes d'un apprenant pour P jeux de
+    paramètres à la fois. W: (P, 17) ; grades, elapsed, mask: (cartes, révisions).
+    Retourne la perte logistique moyenne des rappels prédits, forme (P,).
+    """
+    w = W.T[:, :, None]  # w[i] : (P, 1), diffusé sur les cartes
+    stability = FSRSScheduler.initial_stability(w, grades[:, 0])
+    difficulty = FSRSScheduler.initial_difficulty(w, grades[:, 0])
+    loss = np.zeros(W.shape[0])
+    
+    for k in range(1, grades.shape[1]):
+        grade, valid = grades[:, k], mask[:, k]
+        recall = np.clip(FSRSScheduler.retrievability(elapsed[:, k], stability), 1e-6, 1 - 1e-6)
+        loss -= np.where(valid, np.where(grade > 1, np.log(recall), np.log(1 - recall)), 0).sum(axis=1)
+        new_stability = FSRSScheduler.next_stability(w, difficulty, stability, recall, grade)
+        difficulty = np.where(valid, FSRSScheduler.next_difficulty(w, difficulty, grade), difficulty)
+        stability = np.where(valid, np.clip(new_stability, 0.01, FSRSScheduler.MAX_INTERVAL), stability)
+    
+    return loss / max(mask[:, 1:].sum(), 1)
+
+def fit_fsrs_params(histories, iterations=FSRS_FIT_ITERATIONS, learning_rate=0.05, step=1e-3, l2=0.01):
+    """
+    Ajuste les paramètres FSRS d'un apprenant sur son historique.
+    histories: une liste par carte de (elapsed_days, quality), dans l'ordre.
+    Descente de gradient (Adam) sur les paramètres normalisés par les valeurs
+    par défaut, rappelés vers elles (l2) ; le gradient est estimé par
+    différences finies, les 18 jeux de paramètres rejoués en une seule passe.
+    Retourne (paramètres, perte, nombre de rappels prédits)
+    """
+    length = max(len(history) for history in histories)
+    qualities = np.full((len(histories), length), 4)
+    elapsed = np.ones((len(histories), length))
+    mask = np.zeros((len(histories), length), dtype=bool)
+    for i, history in enumerate(histories):
+        days, quality = zip(*history)
+        elapsed[i, :len(history)] = days
+        qualities[i, :len(history)] = quality
+        mask[i, :len(history)] = True
+    grades = FSRSScheduler.grade(qualities)
+    
+    prior = FSRSScheduler.DEFAULT_PARAMS
+    lower, upper = FSRSScheduler.LOWER / prior, FSRSScheduler.UPPER / prior
+    
+    def objective(X):
+        return fsrs_replay_loss(X * prior, grades, elapsed, mask) + l2 * ((X - 1) ** 2).sum(axis=1)
+    
+    x = np.ones_like(prior)
+    moment, velocity = np.zeros_like(x), np.zeros_like(x)
+    probes = np.eye(len(x)) * step
+    with np.errstate(all="ignore"):
+        for t in range(1, iterations + 1):
+            losses = objective(np.vstack([x, x + probes]))
+            gradient = np.nan_to_num((losses[1:] - losses[0]) / step)
+            moment = 0.9 * moment + 0.1 * gradient
+            velocity = 0.999 * velocity + 0.001 * gradient ** 2
+            x -= learning_rate * (moment / (1 - 0.9 ** t)) / (np.sqrt(velocity / (1 - 0.999 ** t)) + 1e-8)
+            x = np.clip(x, lower, upper)
+        loss = fsrs_replay_loss((x * prior)[None], grades, elapsed, mask)[0]
+    return x * prior, float(loss), int(mask[:, 1:].sum())
+
+def fit_user_params(job):
+    """Tâche du pool de processus : (username, historiques) → (username, params, perte, rappels)"""
+    username, histories = job
+    params, loss, reviews = fit_fsrs_params(histories)
+    return username, params.tolist(), loss, reviews
+
+# =============================================================================
+# PRÉVISION DE LA CHARGE DE RÉVISION
+# =============================================================================
+
+def quality_probabilities(counts, min_reviews=FORECAST_MIN_REVIEWS):
+    """Distribution des notes {note: probabilité} observée, ou FORECAST_QUALITY si trop peu de rappels"""
+    total = sum(counts.values())
+    if total < min_reviews:
+        counts, total = FORECAST_QUALITY, sum(FORECAST_QUALITY.values())
+    return {quality: count / total for quality, count in sorted(counts.items())}
+
+def forecast_reviews(schedule, days=FORECAST_DAYS, quality_probs=None, today=None, seed=0):
+    """
+    Simule days jours de planification SM-2 sur un paquet de cartes, toutes
+    les cartes d'un jour étant traitées d'un coup (NumPy) : le coût dépend du
+    nombre de jours, pas d'une boucle sur les cartes.
+    schedule : lignes (next_review, interval, easiness, repetitions).
+    Hypothèse : chaque carte due est révisée le jour même, avec une note
+    tirée selon quality_probs. Retourne le nombre de révisions par jour
+    (le premier jour inclut les cartes en retard).
+    """
+    today = epoch_day() if today is None else today
+    quality_probs = quality_probs or quality_probabilities({})
+    qualities = np.array(list(quality_probs), dtype=np.float64)
+    cumulative = np.cumsum(list(quality_probs.values()))
+    cumulative /= cumulative[-1]
+    
+    cards = np.asarray(schedule, dtype=np.float64).reshape(-1, 4)
+    interval, easiness, repetitions = cards[:, 1].copy(), cards[:, 2].copy(), cards[:, 3].copy()
+    # Échéances relatives à aujourd'hui (les cartes en retard tombent le jour 0),
+    # plafonnées après l'horizon : entiers 32 bits, comparaison rapide
+    next_day = np.clip(np.nan_to_num(cards[:, 0], nan=today) - today, 0, days).astype(np.int32)
+    
+    rng = np.random.default_rng(seed)
+    reviews = np.zeros(days, dtype=np.int64)
+    for day in range(days):
+        # Toutes les cartes dues sont révisées : la veille ne laisse aucun retard
+        due = np.flatnonzero(next_day == day)
+        reviews[day] = due.size
+        if not due.size:
+            continue
+        quality = qualities[np.searchsorted(cumulative, rng.random(due.size), side="right")]
+        new_interval, easiness[due], repetitions[due] = sm2_review_many(
+            interval[due], easiness[due], repetitions[due], quality
+        )
+        interval[due] = new_interval
+        next_day[due] = np.minimum(day + new_interval, days)
+    return reviews
+
+def schedule_from_export(rows):
+    """Lignes (next_review, interval, easiness, repetitions) d'un export de cartes SRS"""
+    return [(row[5], row[2], row[3], row[4]) for row in rows]
+
+class ForecastCache:
+    """
+    Dernière prévision de chaque utilisateur, recalculée seulement quand le
+    jour ou la version de son paquet (get_deck_version) change : afficher le
+    tableau de bord ne relit ni les cartes ni les notes.
+    """
+    
+    def __init__(self, max_users=FORECAST_CACHE_SIZE):
+        self.max_users = max_users
+        self.lock = threading.Lock()
+        self.entries = {}  # username -> ((jour, version du paquet), révisions par jour ou None)
+    
+    def get(self, db, username):
+        """Révisions prévues par jour (None si l'utilisateur n'a aucune carte)"""
+        key = (epoch_day(), db.get_deck_version(username))
+        with self.lock:
+            cached = self.entries.get(username)
+        if cached and cached[0] == key:
+            return cached[1]
+        
+        schedule = schedule_from_export(db.export_srs_cards(username))
+        reviews = None
+        if schedule:
+            quality_probs = quality_probabilities(db.get_quality_counts(username))
+            reviews = forecast_reviews(schedule, quality_probs=quality_probs, today=key[0])
+        with self.lock:
+            self.entries.pop(username, None)
+            self.entries[username] = (key, reviews)
+            # Ordre d'insertion : le premier est le moins récemment recalculé
+            while len(self.entries) > self.max_users:
+                del self.entries[next(iter(self.entries))]
+        return reviews
+
+# =============================================================================
+# CLASSE : GESTIONNAIRE DE BASE DE DONNÉES
+# =============================================================================
+
+class SrsCard:
+    """Carte SRS compacte (__slots__ : pas de dictionnaire par instance)"""
+    
+    __slots__ = ("front", "back", "interval", "easiness", "repetitions")
+    
+    def __init__(self, front, back, interval, easiness, repetitions):
+        self.front = front
+        self.back = back
+        self.interval = interval
+        self.easiness = easiness
+        self.repetitions = repetitions
+
+def user_stats_dict(lessons, score_total, reviews, streak, best_streak, last_active_day):
+    """Statistiques affichées d'un utilisateur à partir de ses totaux matérialisés"""
+    # La série n'est en cours que si l'utilisateur a été actif aujourd'hui ou hier
+    alive = last_active_day is not None and last_active_day >= epoch_day(-1)
+    return {
+        "completed_lessons": lessons,
+        "average_score": score_total / lessons if lessons else 0,
+        "reviews": reviews,
+        "streak": streak if alive else 0,
+        "best_streak": best_streak,
+        "active_today": last_active_day == epoch_day(),
+    }
+
+class ProgressRepository(ABC):
+    """
+    Interface de stockage de la progression, des cartes SRS et des tests.
+    Toutes les fonctions d'affichage passent par elle : SQLite en production,
+    mémoire pour les tests et les mesures de performance, et demain un
+    backend réseau sans toucher à l'interface utilisateur.
+    """
+    
+    @abstractmethod
+    def create_user(self, username):
+        """Crée un nouvel utilisateur"""
+    
+    @abstractmethod
+    def mark_lesson_complete(self, username, book_key, lesson_id, score=0):
+        """Marque une leçon comme complétée"""
+    
+    @abstractmethod
+    def is_lesson_completed(self, username, book_key, lesson_id):
+        """Vérifie si une leçon est complétée"""
+    
+    @abstractmethod
+    def get_user_stats(self, username):
+        """Récupère les statistiques de l'utilisateur"""
+    
+    @abstractmethod
+    def get_leaderboard(self, limit=LEADERBOARD_SIZE, by="lessons"):
+        """Meilleurs utilisateurs par leçons complétées ("lessons") ou meilleure série ("streak")"""
+    
+    @abstractmethod
+    def get_recommendations(self, username, limit=RECOMMEND_SIZE):
+        """
+        Leçons conseillées [(clé (livre, leçon), titre, raison)], d'après
+        l'index posé dans l'attribut recommendations (liste vide sans index)
+        """
+    
+    @abstractmethod
+    def get_due_cards(self, username):
+        """Récupère les cartes SRS à réviser aujourd'hui"""
+    
+    @abstractmethod
+    def count_due_cards(self, username):
+        """Compte les cartes à réviser aujourd'hui (sans les charger)"""
+    
+    @abstractmethod
+    def get_due_card(self, username, offset=0):
+        """Récupère une seule carte à réviser (la n-ième)"""
+    
+    @abstractmethod
+    def add_srs_card(self, username, front, back):
+        """Ajoute une nouvelle carte SRS"""
+    
+    @abstractmethod
+    def add_srs_cards(self, username, cards):
+        """Ajoute plusieurs cartes en une transaction, retourne le nombre ajouté"""
+    
+    @abstractmethod
+    def get_srs_keys(self, username):
+        """Récupère les paires (face, dos) des cartes de l'utilisateur"""
+    
+    @abstractmethod
+    def update_srs_card(self, username, front, quality):
+        """Met à jour une carte SRS après révision (quality: 0-5)"""
+    
+    @abstractmethod
+    def save_test_result(self, username, level, score, total, duration):
+        """Enregistre un test passé et met à jour les agrégats"""
+    
+    @abstractmethod
+    def get_test_stats(self, username, level):
+        """Récupère les agrégats d'un niveau (ou None)"""
+    
+    @abstractmethod
+    def export_srs_cards(self, username):
+        """
+        Lignes (front, back, interval, easiness, repetitions, next_review, last_review)
+        next_review en numéro de jour, last_review en secondes Unix
+        """
+    
+    @abstractmethod
+    def export_progress(self, username):
+        """Lignes (book_key, lesson_id, completed_at, score), plus récentes d'abord"""
+    
+    @abstractmethod
+    def get_quality_counts(self, username=None):
+        """Nombre de rappels par note {quality: count} (tous les utilisateurs si None)"""
+    
+    @abstractmethod
+    def get_deck_version(self, username):
+        """Version du paquet de l'utilisateur : change à chaque ajout, révision ou suppression de carte"""
+    
+    @abstractmethod
+    def get_global_stats(self):
+        """Statistiques globales : utilisateurs, leçons complétées, cartes"""
+
+class ConnectionPool:
+    """
+    Pool de connexions vers un fichier SQLite. Les connexions sont en mode
+    WAL : les lectures ne bloquent pas l'écrivain du même fichier.
+    """
+    
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = Path(path)
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # pris en compte à la création du fichier
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        """Emprunte une connexion au pool (rendue à la sortie du bloc)"""
+        with self.slots:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self.idle.put(conn)
+    
+    def close(self):
+        """Ferme les connexions inactives"""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+class ShardRouter:
+    """
+    Répartit les utilisateurs entre plusieurs fichiers SQLite (shards) selon
+    un hachage stable du pseudo. La carte des shards (shards.json) fixe leur
+    nombre et leur emplacement : un shard se déplace en changeant son chemin.
+    
+    Un nombre de shards différent de celui en service est refusé : les
+    utilisateurs existants seraient cherchés dans le mauvais fichier. Le
+    changement passe par DatabaseManager.rebalance (manage.py rebalance).
+    shard_count=None : ouvre les shards en service, quel que soit leur nombre.
+    """
+    
+    def __init__(self, db_path, shard_count=1, map_file=SHARD_MAP_FILE):
+        self.map_file = Path(map_file)
+        self.db_path = Path(db_path)
+        
+        if self.map_file.exists():
+            shard_map = json.loads(self.map_file.read_text(encoding='utf-8'))
+            self.paths = [Path(path) for path in shard_map["shards"]]
+        else:
+            # Mode historique : un seul fichier progress.db, pas de carte
+            self.paths = [self.db_path]
+        
+        if shard_count is None or max(shard_count, 1) == len(self.paths):
+            return
+        if self.map_file.exists() or self.db_path.exists():
+            raise ValueError(
+                f"{len(self.paths)} shard(s) en service, {shard_count} demandé(s) : "
+                f"lancer « python manage.py --shards {shard_count} rebalance », app arrêtée"
+            )
+        # Nouvelle installation : rien à redistribuer
+        self.paths = self.plan(shard_count)
+        self.save()
+    
+    def plan(self, shard_count):
+        """
+        Chemins des shards pour un nouveau nombre de shards : les premiers
+        restent en place (le shard 0 reprend progress.db), les nouveaux sont
+        nommés d'après progress.db
+        """
+        return self.paths[:shard_count] + [
+            self.db_path.with_name(f"{self.db_path.stem}_{idx}{self.db_path.suffix}")
+            for idx in range(len(self.paths), shard_count)
+        ]
+    
+    def save(self):
+        """Enregistre la carte des shards"""
+        atomic_write_json(self.map_file, {"shards": [str(path) for path in self.paths]})
+    
+    def shard_for(self, username):
+        """Index du shard d'un utilisateur (stable entre processus et machines)"""
+        digest = hashlib.blake2b(username.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % len(self.paths)
+    
+    def move_shard(self, index, new_path):
+        """
+        Copie un shard vers un nouvel emplacement (API de sauvegarde SQLite,
+        copie cohérente même pendant des écritures) puis met à jour la carte.
+        Les processus de l'application doivent être redémarrés ensuite.
+        """
+        new_path = Path(new_path)
+        source = sqlite3.connect(self.paths[index])
+        target = sqlite3.connect(new_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self.paths[index] = new_path
+        self.save()
+
+# Migrations de schéma : (version, description, étape, requête témoin).
+# Une étape est une requête SQL ou une fonction(conn). Ne jamais modifier une
+# migration publiée : en ajouter une nouvelle à la fin de la liste.
+
+SRS_CARDS_COLUMNS = """
+    username TEXT,
+    front TEXT,
+    back TEXT,
+    interval REAL DEFAULT 1,
+    easiness REAL DEFAULT 2.5,
+    repetitions INTEGER DEFAULT 0,
+    next_review INTEGER,  -- jour (jours depuis le 01/01/1970)
+    last_review INTEGER,  -- horodatage Unix (secondes)
+    PRIMARY KEY (username, front)
+"""
+
+def create_base_tables(conn):
+    """Tables d'origine (IF NOT EXISTS : sans effet sur une base existante)"""
+    cur = conn.cursor()
+    
+    # Table des utilisateurs
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            created_at TEXT,
+            current_level TEXT DEFAULT 'A1'
+        )
+    """)
+    
+    # Table de progression
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS progress (
+            username TEXT,
+            book_key TEXT,
+            lesson_id INTEGER,
+            completed_at TEXT,
+            score INTEGER,
+            PRIMARY KEY (username, book_key, lesson_id)
+        )
+    """)
+    
+    # Table SRS (Spaced Repetition System)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS srs_cards ({SRS_CARDS_COLUMNS})")
+    
+    # Historique des tests de niveau
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS test_results (
+            username TEXT,
+            level TEXT,
+            taken_at TEXT,
+            score INTEGER,
+            total INTEGER,
+            duration_seconds REAL
+        )
+    """)
+    
+    # Agrégats par utilisateur et par niveau (analyse de placement)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS test_stats (
+            username TEXT,
+            level TEXT,
+            attempts INTEGER DEFAULT 0,
+            best_score REAL DEFAULT 0,
+            total_questions INTEGER DEFAULT 0,
+            total_seconds REAL DEFAULT 0,
+            last_taken_at TEXT,
+            PRIMARY KEY (username, level)
+        )
+    """)
+
+def convert_schedule_columns(conn):
+    """
+    Convertit les colonnes de planification ISO (texte) des anciennes bases
+    en entiers : les cartes sont recopiées par lots (mémoire bornée) dans une
+    nouvelle table qui remplace l'ancienne, puis l'index des révisions dues
+    est créé.
+    """
+    types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(srs_cards)")}
+    if types.get("next_review") != "INTEGER":
+        conn.execute(f"CREATE TABLE srs_cards_new ({SRS_CARDS_COLUMNS})")
+        last = 0
+        while True:
+            rows = conn.execute("""
+                SELECT rowid, username, front, back, interval, easiness, repetitions,
+                       next_review, last_review
+                FROM srs_cards WHERE rowid > ? ORDER BY rowid LIMIT ?
+            """, (last, MIGRATION_BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            conn.executemany("""
+                INSERT INTO srs_cards_new
+                (rowid, username, front, back, interval, easiness, repetitions,
+                 next_review, last_review)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [row[:7] + (day_from_iso(row[7]), seconds_from_iso(row[8])) for row in rows])
+            last = rows[-1][0]
+        conn.execute("DROP TABLE srs_cards")
+        conn.execute("ALTER TABLE srs_cards_new RENAME TO srs_cards")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_srs_cards_due ON srs_cards (username, next_review)")
+
+def add_review_log(conn):
+    """État FSRS des cartes, journal des révisions et paramètres par apprenant"""
+    conn.execute("ALTER TABLE srs_cards ADD COLUMN stability REAL")
+    conn.execute("ALTER TABLE srs_cards ADD COLUMN difficulty REAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS srs_reviews (
+            username TEXT,
+            front TEXT,
+            reviewed_at INTEGER,
+            quality INTEGER,
+            elapsed_days INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_srs_reviews_card ON srs_reviews (username, front, reviewed_at)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_params (
+            username TEXT PRIMARY KEY,
+            params TEXT,
+            loss REAL,
+            reviews INTEGER,
+            fitted_at INTEGER
+        )
+    """)
+
+# Tables suivies par row_changes : (colonne de clé texte, colonne de clé entière)
+CHANGE_TRACKED = {
+    "srs_cards": ("front", None),
+    "progress": ("book_key", "lesson_id"),
+}
+
+def add_change_log(conn):
+    """
+    Séquence de modifications pour l'export incrémental : une ligne par
+    enregistrement suivi, remplacée (nouveau seq) à chaque écriture par des
+    triggers. Une suppression laisse une pierre tombale (deleted = 1).
+    Les triggers suppriment puis réinsèrent l'entrée plutôt qu'un INSERT OR
+    REPLACE : la clause de conflit de la requête qui les déclenche (INSERT
+    OR IGNORE, UPSERT) remplacerait la leur, et la modification serait
+    ignorée ou refusée.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS row_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            username TEXT NOT NULL,
+            key_text TEXT NOT NULL,
+            key_int INTEGER NOT NULL DEFAULT 0,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (table_name, username, key_text, key_int)
+        )
+    """)
+    for table, (text_column, int_column) in CHANGE_TRACKED.items():
+        for event, row, deleted in (("INSERT", "NEW", 0), ("UPDATE", "NEW", 0), ("DELETE", "OLD", 1)):
+            key_int = f"{row}.{int_column}" if int_column else "0"
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_changes_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    DELETE FROM row_changes
+                    WHERE table_name = '{table}' AND username = {row}.username
+                      AND key_text = {row}.{text_column} AND key_int = {key_int};
+                    INSERT INTO row_changes (table_name, username, key_text, key_int, deleted)
+                    VALUES ('{table}', {row}.username, {row}.{text_column}, {key_int}, {deleted});
+                END
+            """)
+        # Lignes existantes : exportées par un premier export depuis 0
+        conn.execute(f"""
+            INSERT OR IGNORE INTO row_changes (table_name, username, key_text, key_int)
+            SELECT '{table}', username, {text_column}, {int_column or 0} FROM {table}
+        """)
+
+def add_due_counts(conn):
+    """
+    Nombre de cartes dues par utilisateur, matérialisé pour un jour donné.
+    Recalculé chaque nuit (refresh_due_counts) et tenu à jour dans la
+    journée par des triggers sur srs_cards ; une ligne d'un autre jour est
+    ignorée à la lecture.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS due_counts (
+            username TEXT PRIMARY KEY,
+            day INTEGER,
+            due INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS srs_cards_due_insert AFTER INSERT ON srs_cards BEGIN
+            UPDATE due_counts SET due = due + (NEW.next_review <= day) WHERE username = NEW.username;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS srs_cards_due_update AFTER UPDATE OF next_review ON srs_cards BEGIN
+            UPDATE due_counts SET due = due - (OLD.next_review <= day) + (NEW.next_review <= day)
+            WHERE username = NEW.username;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS srs_cards_due_delete AFTER DELETE ON srs_cards BEGIN
+            UPDATE due_counts SET due = due - (OLD.next_review <= day) WHERE username = OLD.username;
+        END
+    """)
+
+def streak_after(streak, best_streak, last_day, day):
+    """
+    Série de jours d'activité consécutifs après une activité le jour day :
+    inchangée le même jour, +1 le lendemain, 1 après une interruption.
+    Retourne (série, meilleure série).
+    """
+    if last_day == day:
+        streak = streak or 1
+    elif last_day is not None and last_day == day - 1:
+        streak += 1
+    elif last_day is None or day > last_day:
+        streak = 1
+    return streak, max(best_streak, streak)
+
+def add_user_stats(conn):
+    """
+    Totaux par utilisateur (leçons, scores, révisions) et séries de jours
+    d'activité, tenus à jour dans les écritures (mark_lesson_complete,
+    update_srs_card) comme test_stats. Les index servent le classement.
+    Les utilisateurs existants sont recalculés depuis progress et srs_reviews.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            username TEXT PRIMARY KEY,
+            lessons INTEGER DEFAULT 0,
+            score_total INTEGER DEFAULT 0,
+            reviews INTEGER DEFAULT 0,
+            streak INTEGER DEFAULT 0,
+            best_streak INTEGER DEFAULT 0,
+            last_active_day INTEGER,
+            updated_at INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_lessons ON user_stats (lessons DESC, score_total DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_streak ON user_stats (best_streak DESC)")
+    
+    totals = {}
+    for username, lessons, score_total in conn.execute("""
+        SELECT username, COUNT(*), COALESCE(SUM(score), 0) FROM progress GROUP BY username
+    """):
+        totals[username] = [lessons, score_total, 0]
+    for username, reviews in conn.execute("SELECT username, COUNT(*) FROM srs_reviews GROUP BY username"):
+        totals.setdefault(username, [0, 0, 0])[2] = reviews
+    
+    # Jours d'activité (date locale) : leçons complétées et révisions
+    days = conn.execute(f"""
+        SELECT username, CAST(julianday(completed_at) - {EPOCH_JULIAN} AS INTEGER) AS day FROM progress
+        WHERE completed_at IS NOT NULL
+        UNION
+        SELECT username, CAST(julianday(reviewed_at, 'unixepoch', 'localtime') - {EPOCH_JULIAN} AS INTEGER)
+        FROM srs_reviews
+        ORDER BY username, day
+    """)
+    streaks = {}
+    for username, user_days in itertools.groupby(days, key=itemgetter(0)):
+        streak, best_streak, last_day = 0, 0, None
+        for _, day in user_days:
+            streak, best_streak = streak_after(streak, best_streak, last_day, day)
+            last_day = day
+        streaks[username] = (streak, best_streak, last_day)
+    
+    now = epoch_seconds()
+    conn.executemany("""
+        INSERT OR REPLACE INTO user_stats
+        (username, lessons, score_total, reviews, streak, best_streak, last_active_day, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (username, *totals.get(username, (0, 0, 0)), *streaks.get(username, (0, 0, None)), now)
+        for username in set(totals) | set(streaks)
+    ])
+
+def add_recommendations(conn):
+    """
+    File de leçons recommandées par utilisateur (la meilleure en tête par
+    l'index), et version du graphe des leçons avec laquelle elle a été
+    construite : une file d'une autre version est reconstruite à la lecture.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recommendations (
+            username TEXT,
+            book_key TEXT,
+            lesson_id INTEGER,
+            score REAL,
+            reason TEXT,
+            PRIMARY KEY (username, book_key, lesson_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recommendations_rank ON recommendations (username, score DESC)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recommendation_state (
+            username TEXT PRIMARY KEY,
+            version TEXT
+        )
+    """)
+
+MIGRATIONS = [
+    (1, "Tables de base", create_base_tables, None),
+    (2, "Planification SRS en entiers", convert_schedule_columns,
+     "SELECT COUNT(*) FROM srs_cards WHERE username='alice' AND next_review <= 20000"),
+    (3, "Index progress (username, completed_at)",
+     "CREATE INDEX IF NOT EXISTS idx_progress_completed ON progress (username, completed_at)",
+     "SELECT book_key, lesson_id, completed_at, score FROM progress "
+     "WHERE username='alice' ORDER BY completed_at DESC"),
+    (4, "Index srs_cards (username, last_review)",
+     "CREATE INDEX IF NOT EXISTS idx_srs_cards_reviewed ON srs_cards (username, last_review)",
+     "SELECT front, back FROM srs_cards WHERE username='alice' AND last_review >= 1700000000"),
+    (5, "Journal des révisions et paramètres FSRS", add_review_log,
+     "SELECT front, elapsed_days, quality FROM srs_reviews WHERE username='alice' "
+     "ORDER BY front, reviewed_at"),
+    (6, "Index test_results (username, taken_at)",
+     "CREATE INDEX IF NOT EXISTS idx_test_results_taken ON test_results (username, taken_at)",
+     "SELECT 1 FROM test_results WHERE username='alice' AND taken_at >= '2024-01-01'"),
+    (7, "Séquence de modifications (export incrémental)", add_change_log,
+     "SELECT seq, table_name, username, key_text, key_int, deleted FROM row_changes "
+     "WHERE seq > 1000 ORDER BY seq LIMIT 5000"),
+    (8, "Cartes dues matérialisées", add_due_counts,
+     "SELECT due FROM due_counts WHERE username='alice' AND day=20000"),
+    (9, "Classement et séries d'activité matérialisés", add_user_stats,
+     "SELECT username, lessons, score_total FROM user_stats ORDER BY lessons DESC, score_total DESC LIMIT 10"),
+    (10, "File de leçons recommandées", add_recommendations,
+     "SELECT book_key, lesson_id, reason FROM recommendations WHERE username='alice' ORDER BY score DESC LIMIT 3"),
+]
+
+def schema_version(conn):
+    """Dernière migration appliquée sur cette base (0 si aucune)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at INTEGER
+        )
+    """)
+    conn.commit()
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def apply_migrations(conn, target=None):
+    """
+    Applique dans l'ordre les migrations pas encore passées sur cette base
+    (jusqu'à target inclus). Chaque migration tourne dans une transaction
+    BEGIN IMMEDIATE : si plusieurs processus démarrent en même temps, un seul
+    l'applique, les autres attendent puis la trouvent déjà enregistrée.
+    Retourne les versions appliquées.
+    """
+    target = MIGRATIONS[-1][0] if target is None else target
+    if schema_version(conn) >= target:
+        return []
+    
+    applied = []
+    for version, description, step, _ in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT 1 FROM schema_version WHERE version=?", (version,)).fetchone()
+            if not done:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, epoch_seconds())
+                )
+                applied.append(version)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return applied
+
+def explain_migrations():
+    """
+    Plans d'exécution (EXPLAIN QUERY PLAN) de la requête témoin de chaque
+    migration, avant et après son application, sur une base vide en mémoire.
+    Retourne des tuples (version, description, requête, plan avant, plan après).
+    """
+    conn = sqlite3.connect(":memory:")
+    reports = []
+    try:
+        for version, description, _, query in MIGRATIONS:
+            try:
+                before = query and [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+            except sqlite3.OperationalError:
+                before = ["(table créée par cette migration)"]
+            apply_migrations(conn, target=version)
+            if query:
+                after = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+                reports.append((version, description, query, before, after))
+    finally:
+        conn.close()
+    return reports
+
+class DatabaseManager(ProgressRepository):
+    """
+    Gère toutes les opérations de base de données.
+    Chaque utilisateur vit dans un shard SQLite (un verrou d'écriture par
+    fichier) : le débit d'écriture total augmente avec le nombre de shards.
+    """
+    
+    DUE_CONDITION = "username=? AND next_review <= ?"
+    USER_TABLES = (
+        "users", "progress", "srs_cards", "test_results", "test_stats",
+        "srs_reviews", "scheduler_params", "due_counts", "user_stats",
+        "recommendations", "recommendation_state",
+    )
+    # Même règle que streak_after, dans l'UPSERT de user_stats
+    STREAK_AFTER = """
+        CASE WHEN last_active_day = excluded.last_active_day THEN MAX(streak, 1)
+             WHEN last_active_day = excluded.last_active_day - 1 THEN streak + 1
+             WHEN last_active_day IS NULL OR last_active_day < excluded.last_active_day THEN 1
+             ELSE streak END
+    """
+    # Classements : (ORDER BY servi par un index de user_stats, même tri en Python pour la fusion)
+    LEADERBOARD_ORDERS = {
+        "lessons": ("lessons DESC, score_total DESC", lambda row: (-row[1], -row[2])),
+        "streak": ("best_streak DESC", lambda row: -row[5]),
+    }
+    
+    def __init__(self, db_path, shard_count=DB_SHARDS, migrate=True, scheduler=None, archive_dir=ARCHIVE_DIR):
+        self.db_path = db_path
+        self.archive_dir = Path(archive_dir)
+        self.recommendations = None  # RecommendationIndex du contenu en service (posé par main)
+        self.scheduler = scheduler or get_scheduler()
+        self.router = ShardRouter(db_path, shard_count)
+        self.pools = [ConnectionPool(path) for path in self.router.paths]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.pools)) if len(self.pools) > 1 else None
+        if migrate:
+            self.init_database()
+    
+    def connection(self, username):
+        """Connexion (empruntée au pool) vers le shard de l'utilisateur"""
+        return self.pools[self.router.shard_for(username)].connection()
+    
+    def init_database(self):
+        """
+        Applique les migrations de schéma en attente sur chaque shard.
+        Retourne, par shard, la liste des versions appliquées.
+        """
+        applied = []
+        for pool in self.pools:
+            with pool.connection() as conn:
+                applied.append(apply_migrations(conn))
+        return applied
+    
+    def scatter(self, query, params=()):
+        """
+        Exécute une requête en lecture sur tous les shards en parallèle
+        (requêtes d'administration inter-utilisateurs) et concatène les lignes
+        """
+        def run(pool):
+            with pool.connection() as conn:
+                return conn.execute(query, params).fetchall()
+        
+        if self.executor is None:
+            return run(self.pools[0])
+        return [row for rows in self.executor.map(run, self.pools) for row in rows]
+    
+    def get_global_stats(self):
+        """Statistiques globales, tous shards confondus"""
+        rows = self.scatter("""
+            SELECT (SELECT COUNT(*) FROM users),
+                   (SELECT COUNT(*) FROM progress),
+                   (SELECT COUNT(*) FROM srs_cards)
+        """)
+        return {
+            "users": sum(row[0] for row in rows),
+            "completed_lessons": sum(row[1] for row in rows),
+            "srs_cards": sum(row[2] for row in rows),
+        }
+    
+    def rebalance(self, shard_count):
+        """
+        Change le nombre de shards (app arrêtée) : crée les nouveaux shards,
+        déplace chaque utilisateur qui n'est plus dans le sien, puis seulement
+        enregistre la nouvelle carte. Relancer après une interruption reprend
+        là où elle s'est arrêtée. Les shards retirés restent sur disque, vides.
+        Retourne le nombre d'utilisateurs déplacés.
+        """
+        sources = self.pools
+        paths = self.router.plan(max(shard_count, 1))
+        self.pools = sources[:len(paths)] + [ConnectionPool(path) for path in paths[len(sources):]]
+        self.router.paths = paths
+        self.init_database()
+        
+        moved = 0
+        for index, pool in enumerate(sources):
+            with pool.connection() as source:
+                usernames = [row[0] for row in source.execute("SELECT username FROM users")]
+                for username in usernames:
+                    if index < len(paths) and self.router.shard_for(username) == index:
+                        continue
+                    with self.connection(username) as target, target:
+                        for table in self.USER_TABLES:
+                            cur = source.execute(f"SELECT * FROM {table} WHERE username=?", (username,))
+                            columns = ", ".join(column[0] for column in cur.description)
+                            marks = ", ".join("?" for _ in cur.description)
+                            target.executemany(
+                                f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({marks})",
+                                cur.fetchall()
+                            )
+                    with source:
+                        for table in self.USER_TABLES:
+                            source.execute(f"DELETE FROM {table} WHERE username=?", (username,))
+                    moved += 1
+        
+        self.router.save()
+        for pool in sources[len(paths):]:
+            pool.close()
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.executor = ThreadPoolExecutor(max_workers=len(self.pools)) if len(self.pools) > 1 else None
+        return moved
+    
+    def archive_path(self, username):
+        """Fichier d'archive d'un utilisateur (nom haché : tout pseudo est accepté)"""
+        digest = hashlib.blake2b(username.encode('utf-8'), digest_size=16).hexdigest()
+        return self.archive_dir / f"{digest}.json.gz"
+    
+    def inactive_users(self, conn, days=ARCHIVE_AFTER_DAYS):
+        """Utilisateurs d'un shard sans activité (leçon, révision, test) depuis days jours"""
+        since = epoch_seconds() - days * 86400
+        since_iso = datetime.fromtimestamp(since).isoformat()
+        return [row[0] for row in conn.execute("""
+            SELECT username FROM users u
+            WHERE created_at < :iso
+              AND NOT EXISTS (SELECT 1 FROM progress
+                              WHERE username = u.username AND completed_at >= :iso)
+              AND NOT EXISTS (SELECT 1 FROM srs_cards
+                              WHERE username = u.username AND last_review >= :seconds)
+              AND NOT EXISTS (SELECT 1 FROM test_results
+                              WHERE username = u.username AND taken_at >= :iso)
+        """, {"iso": since_iso, "seconds": since})]
+    
+    def archive_inactive_users(self, days=ARCHIVE_AFTER_DAYS, vacuum=True):
+        """
+        Tâche de maintenance : déplace les données des utilisateurs inactifs
+        dans un fichier compressé par utilisateur (archives/), puis rend la
+        place libérée au système par VACUUM incrémental. Les données
+        reviennent dans la base à la reconnexion (create_user).
+        Retourne le nombre d'utilisateurs archivés.
+        """
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        archived = 0
+        for pool in self.pools:
+            with pool.connection() as conn:
+                for username in self.inactive_users(conn, days):
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        # Revérifié sous verrou : l'utilisateur a pu revenir entre-temps
+                        if username in self.inactive_users(conn, days):
+                            self._archive_user(conn, username)
+                            archived += 1
+                        conn.commit()
+                    except BaseException:
+                        conn.rollback()
+                        raise
+                if vacuum:
+                    self.compact(conn)
+        return archived
+    
+    def _archive_user(self, conn, username):
+        """Écrit l'archive d'un utilisateur (fsync) puis supprime ses lignes (transaction en cours)"""
+        tables = {}
+        for table in self.USER_TABLES:
+            cur = conn.execute(f"SELECT * FROM {table} WHERE username=?", (username,))
+            tables[table] = {
+                "columns": [column[0] for column in cur.description],
+                "rows": cur.fetchall(),
+            }
+        path = self.archive_path(username)
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}-", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    f.write(json.dumps({"username": username, "archived_at": epoch_seconds(), "tables": tables},
+                                       ensure_ascii=False).encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+        fsync_directory(path.parent)
+        for table in self.USER_TABLES:
+            conn.execute(f"DELETE FROM {table} WHERE username=?", (username,))
+        # Pas de pierres tombales : l'entrepôt de données garde l'historique archivé
+        conn.execute("DELETE FROM row_changes WHERE username=?", (username,))
+    
+    def _restore_archived_user(self, conn, username):
+        """Réintègre l'archive d'un utilisateur s'il en a une. Retourne True si restauré."""
+        path = self.archive_path(username)
+        if not path.exists():
+            return False
+        with gzip.open(path, 'rb') as f:
+            archive = json.loads(f.read().decode('utf-8'))
+        if archive["username"] != username:
+            return False
+        with conn:
+            for table, content in archive["tables"].items():
+                columns = ", ".join(content["columns"])
+                marks = ", ".join("?" for _ in content["columns"])
+                conn.executemany(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({marks})",
+                                 content["rows"])
+        path.unlink()
+        return True
+    
+    @staticmethod
+    def compact(conn, pages=VACUUM_PAGES_PER_STEP):
+        """
+        Rend au système les pages libres d'un shard, par étapes courtes entre
+        lesquelles les écritures passent. Une base créée avant l'auto_vacuum
+        incrémental est d'abord convertie (un VACUUM complet, une seule fois).
+        Retourne le nombre de pages libérées.
+        """
+        freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            while conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+                conn.commit()
+        # Les pages passent par le WAL : le fichier ne rétrécit qu'au checkpoint
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return freed
+    
+    def create_user(self, username):
+        """Crée un nouvel utilisateur (ou réintègre ses données archivées)"""
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT OR IGNORE INTO users (username, created_at) VALUES (?, ?)",
+                (username, datetime.now().isoformat())
+            )
+            conn.commit()
+            if cur.rowcount:
+                # Pseudo inconnu de la base : peut-être un utilisateur archivé
+                self._restore_archived_user(conn, username)
+    
+    def mark_lesson_complete(self, username, book_key, lesson_id, score=0):
+        """Marque une leçon comme complétée (et met à jour totaux et série)"""
+        with self.connection(username) as conn, conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT score FROM progress WHERE username=? AND book_key=? AND lesson_id=?
+            """, (username, book_key, lesson_id))
+            previous = cur.fetchone()
+            cur.execute("""
+                INSERT OR REPLACE INTO progress 
+                (username, book_key, lesson_id, completed_at, score)
+                VALUES (?, ?, ?, ?, ?)
+            """, (username, book_key, lesson_id, datetime.now().isoformat(), score))
+            # Leçon refaite : seul le nouveau score compte
+            self._record_activity(conn, username, lessons=0 if previous else 1,
+                                  score=score - ((previous[0] or 0) if previous else 0))
+            self._advance_queue(conn, username, (book_key, lesson_id))
+    
+    def _completed_lessons(self, conn, username):
+        return {(row[0], row[1]) for row in conn.execute(
+            "SELECT book_key, lesson_id FROM progress WHERE username=?", (username,)
+        )}
+    
+    def _sync_queue(self, conn, username, index):
+        """
+        Reconstruit la file de recommandations si elle date d'une autre
+        version du graphe des leçons. Retourne True si elle était à jour.
+        """
+        row = conn.execute("SELECT version FROM recommendation_state WHERE username=?", (username,)).fetchone()
+        if row and row[0] == index.version:
+            return True
+        queue = index.initial_queue(self._completed_lessons(conn, username))
+        conn.execute("DELETE FROM recommendations WHERE username=?", (username,))
+        conn.executemany("""
+            INSERT INTO recommendations (username, book_key, lesson_id, score, reason)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(username, *key, score, reason) for key, score, reason in queue])
+        conn.execute("INSERT OR REPLACE INTO recommendation_state (username, version) VALUES (?, ?)",
+                     (username, index.version))
+        return False
+    
+    def _advance_queue(self, conn, username, key):
+        """Retire une leçon complétée de la file et y ajoute celles qu'elle débloque"""
+        index = self.recommendations
+        if index is None or not self._sync_queue(conn, username, index):
+            return  # Pas d'index, ou file reconstruite (complétion déjà prise en compte)
+        conn.execute("DELETE FROM recommendations WHERE username=? AND book_key=? AND lesson_id=?",
+                     (username, *key))
+        unlocked = []
+        if index.dependents.get(key):
+            unlocked = index.unlocked_by(key, self._completed_lessons(conn, username))
+        conn.executemany("""
+            INSERT OR IGNORE INTO recommendations (username, book_key, lesson_id, score, reason)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(username, *dependent, score, reason) for dependent, score, reason in unlocked])
+    
+    def _boost_queue(self, conn, username, front):
+        """Remonte dans la file les leçons qui enseignent le mot d'une carte ratée"""
+        index = self.recommendations
+        row = conn.execute("SELECT back FROM srs_cards WHERE username=? AND front=?", (username, front)).fetchone()
+        if index is None or row is None:
+            return
+        self._sync_queue(conn, username, index)
+        conn.executemany("""
+            INSERT INTO recommendations (username, book_key, lesson_id, score, reason)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (username, book_key, lesson_id) DO UPDATE SET
+                score = score + ?, reason = excluded.reason
+        """, [(username, *key, score, reason, RECOMMEND_REVIEW_BOOST)
+              for key, score, reason in index.review_boosts(front, row[0])])
+    
+    def get_recommendations(self, username, limit=RECOMMEND_SIZE):
+        """Leçons conseillées (tête de la file, lue sur l'index) : [(clé, titre, raison)]"""
+        index = self.recommendations
+        if index is None:
+            return []
+        with self.connection(username) as conn, conn:
+            self._sync_queue(conn, username, index)
+            rows = conn.execute("""
+                SELECT book_key, lesson_id, reason FROM recommendations
+                WHERE username=? ORDER BY score DESC LIMIT ?
+            """, (username, limit)).fetchall()
+        return [((book_key, lesson_id), index.titles.get((book_key, lesson_id), ""), reason)
+                for book_key, lesson_id, reason in rows]
+    
+    def _record_activity(self, conn, username, lessons=0, score=0, reviews=0):
+        """Ajoute aux totaux de user_stats et prolonge la série du jour (transaction en cours)"""
+        conn.execute(f"""
+            INSERT INTO user_stats
+            (username, lessons, score_total, reviews, streak, best_streak, last_active_day, updated_at)
+            VALUES (?, ?, ?, ?, 1, 1, ?, ?)
+            ON CONFLICT (username) DO UPDATE SET
+                lessons = lessons + excluded.lessons,
+                score_total = score_total + excluded.score_total,
+                reviews = reviews + excluded.reviews,
+                streak = {self.STREAK_AFTER},
+                best_streak = MAX(best_streak, {self.STREAK_AFTER}),
+                last_active_day = MAX(COALESCE(last_active_day, 0), excluded.last_active_day),
+                updated_at = excluded.updated_at
+        """, (username, lessons, score, reviews, epoch_day(), epoch_seconds()))
+    
+    def is_lesson_completed(self, username, book_key, lesson_id):
+        """Vérifie si une leçon est complétée"""
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT 1 FROM progress 
+                WHERE username=? AND book_key=? AND lesson_id=?
+            """, (username, book_key, lesson_id))
+            return cur.fetchone() is not None
+    
+    def get_user_stats(self, username):
+        """Récupère les statistiques de l'utilisateur (lecture de user_stats par clé)"""
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT lessons, score_total, reviews, streak, best_streak, last_active_day
+                FROM user_stats WHERE username=?
+            """, (username,))
+            row = cur.fetchone()
+        return user_stats_dict(*(row or (0, 0, 0, 0, 0, None)))
+    
+    def get_leaderboard(self, limit=LEADERBOARD_SIZE, by="lessons"):
+        """
+        Meilleurs utilisateurs, tous shards confondus : les limit premiers de
+        chaque shard (lus sur l'index) sont fusionnés
+        """
+        order, key = self.LEADERBOARD_ORDERS[by]
+        rows = self.scatter(f"""
+            SELECT username, lessons, score_total, reviews, streak, best_streak, last_active_day
+            FROM user_stats ORDER BY {order} LIMIT ?
+        """, (limit,))
+        return [dict(user_stats_dict(*row[1:]), username=row[0]) for row in sorted(rows, key=key)[:limit]]
+    
+    def get_due_cards(self, username):
+        """Récupère les cartes SRS à réviser aujourd'hui"""
+        today = epoch_day()
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT front, back, interval, easiness, repetitions 
+                FROM srs_cards 
+                WHERE {self.DUE_CONDITION}
+            """, (username, today))
+            return [SrsCard(*row) for row in cur]
+    
+    def count_due_cards(self, username):
+        """
+        Compte les cartes à réviser aujourd'hui (sans les charger) : valeur
+        matérialisée du jour si elle existe, sinon comptage sur l'index
+        """
+        today = epoch_day()
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT due FROM due_counts WHERE username=? AND day=?", (username, today))
+            row = cur.fetchone()
+            if row:
+                return row[0]
+            cur.execute(f"SELECT COUNT(*) FROM srs_cards WHERE {self.DUE_CONDITION}", (username, today))
+            return cur.fetchone()[0]
+    
+    def refresh_due_counts(self):
+        """
+        Tâche de nuit : recalcule les cartes dues du jour de chaque utilisateur
+        (shards pas encore à jour seulement). Retourne le nombre de shards recalculés.
+        """
+        today = epoch_day()
+        refreshed = 0
+        for pool in self.pools:
+            with pool.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if conn.execute("SELECT 1 FROM due_counts WHERE day=? LIMIT 1", (today,)).fetchone():
+                        conn.rollback()
+                        continue
+                    conn.execute("DELETE FROM due_counts")
+                    conn.execute("""
+                        INSERT INTO due_counts (username, day, due)
+                        SELECT username, ?, SUM(next_review <= ?) FROM srs_cards GROUP BY username
+                    """, (today, today))
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+                refreshed += 1
+        return refreshed
+    
+    def optimize(self):
+        """Maintenance : met à jour les statistiques du planificateur de requêtes (PRAGMA optimize)"""
+        for pool in self.pools:
+            with pool.connection() as conn:
+                conn.execute("PRAGMA optimize")
+    
+    def get_due_card(self, username, offset=0):
+        """Récupère une seule carte à réviser (la n-ième), sans charger le paquet"""
+        today = epoch_day()
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT front, back, interval, easiness, repetitions
+                FROM srs_cards
+                WHERE {self.DUE_CONDITION}
+                LIMIT 1 OFFSET ?
+            """, (username, today, offset))
+            row = cur.fetchone()
+        return SrsCard(*row) if row else None
+    
+    def add_srs_card(self, username, front, back):
+        """Ajoute une nouvelle carte SRS"""
+        next_review = epoch_day(1)
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            # Mise à jour plutôt que REPLACE : les triggers voient l'ancienne carte
+            cur.execute("""
+                INSERT INTO srs_cards 
+                (username, front, back, next_review, last_review)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (username, front) DO UPDATE SET
+                    back = excluded.back, interval = 1, easiness = 2.5, repetitions = 0,
+                    stability = NULL, difficulty = NULL,
+                    next_review = excluded.next_review, last_review = excluded.last_review
+            """, (username, front, back, next_review, epoch_seconds()))
+            conn.commit()
+    
+    def add_srs_cards(self, username, cards):
+        """
+        Ajoute plusieurs cartes SRS en une seule transaction.
+        Les cartes déjà présentes (même face) sont ignorées.
+        Retourne le nombre de cartes réellement ajoutées.
+        """
+        next_review = epoch_day(1)
+        now = epoch_seconds()
+        with self.connection(username) as conn, conn:
+            cur = conn.executemany("""
+                INSERT OR IGNORE INTO srs_cards
+                (username, front, back, next_review, last_review)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(username, card["front"], card["back"], next_review, now) for card in cards])
+        return cur.rowcount
+    
+    def save_test_result(self, username, level, score, total, duration):
+        """Enregistre un test passé et met à jour les agrégats (une transaction)"""
+        now = datetime.now().isoformat()
+        best = score / total if total else 0
+        with self.connection(username) as conn, conn:
+            conn.execute("""
+                INSERT INTO test_results
+                (username, level, taken_at, score, total, duration_seconds)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (username, level, now, score, total, duration))
+            conn.execute("""
+                INSERT INTO test_stats
+                (username, level, attempts, best_score, total_questions, total_seconds, last_taken_at)
+                VALUES (?, ?, 1, ?, ?, ?, ?)
+                ON CONFLICT (username, level) DO UPDATE SET
+                    attempts = attempts + 1,
+                    best_score = MAX(best_score, excluded.best_score),
+                    total_questions = total_questions + excluded.total_questions,
+                    total_seconds = total_seconds + excluded.total_seconds,
+                    last_taken_at = excluded.last_taken_at
+            """, (username, level, best, total, duration, now))
+    
+    def get_test_stats(self, username, level):
+        """Récupère les agrégats d'un niveau : meilleur score, tentatives, temps par question"""
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT attempts, best_score, total_questions, total_seconds
+                FROM test_stats WHERE username=? AND level=?
+            """, (username, level))
+            row = cur.fetchone()
+        if not row:
+            return None
+        attempts, best_score, total_questions, total_seconds = row
+        return {
+            "attempts": attempts,
+            "best_score": best_score,
+            "seconds_per_question": total_seconds / total_questions if total_questions else 0,
+        }
+    
+    def get_srs_keys(self, username):
+        """Récupère les paires (face, dos) des cartes de l'utilisateur"""
+        with self.connection(username) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT front, back FROM srs_cards WHERE username=?", (username,))
+            return cur.fetchall()
+    
+    def update_srs_card(self, username, front, quality):
+        """
+        Met à jour une carte SRS après révision
+        quality: 0-5 (0=échec total, 5=parfait)
+        Utilise le planificateur configuré (SM-2 par défaut) et journalise
+        la révision (historique utilisé pour ajuster les paramètres FSRS)
+        """
+        with self.connection(username) as conn, conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT interval, easiness, repetitions, stability, difficulty, last_review
+                FROM srs_cards WHERE username=? AND front=?
+            """, (username, front))
+            
+            row = cur.fetchone()
+            if not row:
+                return
+            
+            now = epoch_seconds()
+            elapsed_days = max(0, (now - row[5]) // 86400) if row[5] else 0
+            params = self._scheduler_params(conn, username) if self.scheduler.name == "fsrs" else None
+            state = self.scheduler.review(ReviewState(*row[:5]), quality, elapsed_days, params)
+            
+            # Calculer la prochaine date de révision
+            next_review = epoch_day(state.interval)
+            
+            cur.execute("""
+                UPDATE srs_cards 
+                SET interval=?, easiness=?, repetitions=?, stability=?, difficulty=?,
+                    next_review=?, last_review=?
+                WHERE username=? AND front=?
+            """, (state.interval, state.easiness, state.repetitions, state.stability,
+                  state.difficulty, next_review, now, username, front))
+            cur.execute("""
+                INSERT INTO srs_reviews (username, front, reviewed_at, quality, elapsed_days)
+                VALUES (?, ?, ?, ?, ?)
+            """, (username, front, now, quality, elapsed_days))
+            self._record_activity(conn, username, reviews=1)
+            if quality < RECOMMEND_WEAK_QUALITY:
+                self._boost_queue(conn, username, front)
+    
+    def _scheduler_params(self, conn, username):
+        row = conn.execute("SELECT params FROM scheduler_params WHERE username=?", (username,)).fetchone()
+        return np.array(json.loads(row[0])) if row else None
+    
+    def iter_review_histories(self, min_reviews=FSRS_MIN_REVIEWS):
+        """
+        Historique des révisions de chaque apprenant qui en a assez :
+        (username, [[(elapsed_days, quality), ...] par carte])
+        """
+        for pool in self.pools:
+            with pool.connection() as conn:
+                rows = conn.execute("""
+                    SELECT username, front, elapsed_days, quality FROM srs_reviews
+                    ORDER BY username, front, reviewed_at
+                """)
+                for username, user_rows in itertools.groupby(rows, key=itemgetter(0)):
+                    histories = [
+                        [(row[2], row[3]) for row in card_rows]
+                        for _, card_rows in itertools.groupby(user_rows, key=itemgetter(1))
+                    ]
+                    if sum(len(history) - 1 for history in histories) >= min_reviews:
+                        yield username, histories
+    
+    def save_scheduler_params(self, username, params, loss, reviews):
+        """Enregistre les paramètres FSRS ajustés d'un apprenant"""
+        with self.connection(username) as conn, conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO scheduler_params (username, params, loss, reviews, fitted_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (username, json.dumps(params), loss, reviews, epoch_seconds()))
+    
+    def fit_scheduler_params(self, workers=None, min_reviews=FSRS_MIN_REVIEWS):
+        """
+        Tâche de fond : ajuste les paramètres FSRS de chaque apprenant sur un
+        pool de processus (un apprenant par tâche) et les enregistre.
+        Retourne le nombre d'apprenants ajustés.
+        """
+        fitted = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = executor.map(fit_user_params, self.iter_review_histories(min_reviews), chunksize=4)
+            for username, params, loss, reviews in jobs:
+                self.save_scheduler_params(username, params, loss, reviews)
+                fitted += 1
+        return fitted
+    
+    def export_srs_cards(self, username):
+        """Cartes SRS de l'utilisateur pour l'export"""
+        with self.connection(username) as conn:
+            return conn.execute("""
+                SELECT front, back, interval, easiness, repetitions, next_review, last_review
+                FROM srs_cards WHERE username=?
+            """, (username,)).fetchall()
+    
+    def export_progress(self, username):
+        """Progression de l'utilisateur pour l'export (plus récente d'abord)"""
+        with self.connection(username) as conn:
+            return conn.execute("""
+                SELECT book_key, lesson_id, completed_at, score
+                FROM progress WHERE username=?
+                ORDER BY completed_at DESC
+            """, (username,)).fetchall()
+    
+    def get_quality_counts(self, username=None):
+        """Nombre de rappels par note {quality: count} (tous les utilisateurs si None)"""
+        if username is None:
+            rows = self.scatter("SELECT quality, COUNT(*) FROM srs_reviews GROUP BY quality")
+        else:
+            with self.connection(username) as conn:
+                rows = conn.execute("""
+                    SELECT quality, COUNT(*) FROM srs_reviews WHERE username=? GROUP BY quality
+                """, (username,)).fetchall()
+        counts = Counter()
+        for quality, count in rows:
+            counts[quality] += count
+        return dict(counts)
+    
+    def get_deck_version(self, username):
+        """Dernier seq de row_changes des cartes de l'utilisateur (index unique de row_changes)"""
+        with self.connection(username) as conn:
+            return conn.execute("""
+                SELECT COALESCE(MAX(seq), 0) FROM row_changes
+                WHERE table_name = 'srs_cards' AND username=?
+            """, (username,)).fetchone()[0]
+    
+    def schedule_rows(self):
+        """Planification (next_review, interval, easiness, repetitions) de toutes les cartes"""
+        return self.scatter("SELECT next_review, interval, easiness, repetitions FROM srs_cards")
+    
+    def iter_changes(self, watermarks=None, chunk_size=DELTA_CHUNK_SIZE):
+        """
+        Export incrémental : lignes de srs_cards et progress modifiées depuis
+        les filigranes (dernier seq exporté, un par shard ; None = tout).
+        Produit des (shard, seq, [enregistrements]) par blocs de chunk_size,
+        chacun lu dans une transaction : le seq d'un bloc est le filigrane à
+        enregistrer une fois ce bloc écrit. Un enregistrement supprimé a
+        "op": "delete" et "row": None. Après rebalance(), repartir de zéro.
+        """
+        watermarks = list(watermarks or [0] * len(self.pools))
+        if len(watermarks) != len(self.pools):
+            raise ValueError(f"{len(watermarks)} filigrane(s) pour {len(self.pools)} shard(s)")
+        
+        for shard, pool in enumerate(self.pools):
+            since = watermarks[shard]
+            with pool.connection() as conn:
+                while True:
+                    conn.execute("BEGIN")
+                    try:
+                        records = self._read_changes(conn, since, chunk_size)
+                    finally:
+                        conn.rollback()
+                    if not records:
+                        break
+                    since = records[-1]["seq"]
+                    yield shard, since, records
+    
+    @staticmethod
+    def _read_changes(conn, since, limit):
+        """Un bloc de modifications (seq > since) et l'état actuel des lignes concernées"""
+        changes = conn.execute("""
+            SELECT seq, table_name, username, key_text, key_int, deleted
+            FROM row_changes WHERE seq > ? ORDER BY seq LIMIT ?
+        """, (since, limit)).fetchall()
+        records = []
+        for seq, table, username, key_text, key_int, deleted in changes:
+            text_column, int_column = CHANGE_TRACKED[table]
+            key = {"username": username, text_column: key_text}
+            if int_column:
+                key[int_column] = key_int
+            row = None
+            if not deleted:
+                condition = " AND ".join(f"{column}=?" for column in key)
+                cur = conn.execute(f"SELECT * FROM {table} WHERE {condition}", tuple(key.values()))
+                values = cur.fetchone()
+                row = dict(zip((column[0] for column in cur.description), values)) if values else None
+            records.append({"seq": seq, "table": table, "op": "delete" if row is None else "upsert",
+                            "key": key, "row": row})
+        return records
+
+class InMemoryRepository(ProgressRepository):
+    """
+    Stockage entièrement en mémoire (dictionnaires indexés par utilisateur).
+    Même comportement que SQLite, à la vitesse de la mémoire : tests
+    unitaires et mesures de performance. Rien n'est persisté.
+    """
+    
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler or get_scheduler()
+        self.lock = threading.Lock()
+        self.users = {}         # username -> date de création
+        self.progress = {}      # username -> {(book_key, lesson_id): (completed_at, score)}
+        self.cards = {}         # username -> {front: état de la carte}
+        self.reviews = {}       # username -> [(front, reviewed_at, quality, elapsed_days)]
+        self.params = {}        # username -> paramètres FSRS ajustés
+        self.test_results = {}  # username -> [(level, taken_at, score, total, duration)]
+        self.test_stats = {}    # (username, level) -> agrégats
+        self.user_stats = {}    # username -> totaux et série d'activité
+        self.queues = {}        # username -> (version, {(book_key, lesson_id): [score, raison]})
+        self.deck_versions = {} # username -> numéro de la dernière modification de ses cartes
+        self.deck_changes = itertools.count(1)
+        self.recommendations = None
+    
+    def _record_activity(self, username, lessons=0, score=0, reviews=0):
+        stats = self.user_stats.setdefault(username, {
+            "lessons": 0, "score_total": 0, "reviews": 0, "streak": 0, "best_streak": 0, "last_active_day": None,
+        })
+        stats["lessons"] += lessons
+        stats["score_total"] += score
+        stats["reviews"] += reviews
+        today = epoch_day()
+        stats["streak"], stats["best_streak"] = streak_after(
+            stats["streak"], stats["best_streak"], stats["last_active_day"], today
+        )
+        stats["last_active_day"] = max(stats["last_active_day"] or 0, today)
+    
+    def _stats_row(self, username):
+        stats = self.user_stats.get(username)
+        if stats is None:
+            return (0, 0, 0, 0, 0, None)
+        return (stats["lessons"], stats["score_total"], stats["reviews"],
+                stats["streak"], stats["best_streak"], stats["last_active_day"])
+    
+    def create_user(self, username):
+        with self.lock:
+            self.users.setdefault(username, datetime.now().isoformat())
+    
+    def mark_lesson_complete(self, username, book_key, lesson_id, score=0):
+        with self.lock:
+            lessons = self.progress.setdefault(username, {})
+            previous = lessons.get((book_key, lesson_id))
+            lessons[(book_key, lesson_id)] = (datetime.now().isoformat(), score)
+            self._record_activity(username, lessons=0 if previous else 1,
+                                  score=score - (previous[1] if previous else 0))
+            index = self.recommendations
+            if index is not None and self._sync_queue(username, index):
+                queue = self.queues[username][1]
+                queue.pop((book_key, lesson_id), None)
+                for key, score, reason in index.unlocked_by((book_key, lesson_id), set(lessons)):
+                    queue.setdefault(key, [score, reason])
+    
+    def _sync_queue(self, username, index):
+        version, _ = self.queues.get(username, (None, None))
+        if version == index.version:
+            return True
+        completed = set(self.progress.get(username, {}))
+        self.queues[username] = (index.version, {
+            key: [score, reason] for key, score, reason in index.initial_queue(completed)
+        })
+        return False
+    
+    def get_recommendations(self, username, limit=RECOMMEND_SIZE):
+        index = self.recommendations
+        if index is None:
+            return []
+        with self.lock:
+            self._sync_queue(username, index)
+            queue = self.queues[username][1]
+            best = heapq.nlargest(limit, queue.items(), key=lambda item: item[1][0])
+        return [(key, index.titles.get(key, ""), reason) for key, (_, reason) in best]
+    
+    def is_lesson_completed(self, username, book_key, lesson_id):
+        return (book_key, lesson_id) in self.progress.get(username, {})
+    
+    def get_user_stats(self, username):
+        return user_stats_dict(*self._stats_row(username))
+    
+    def get_leaderboard(self, limit=LEADERBOARD_SIZE, by="lessons"):
+        _, key = DatabaseManager.LEADERBOARD_ORDERS[by]
+        with self.lock:
+            rows = [(username, *self._stats_row(username)) for username in self.user_stats]
+        return [dict(user_stats_dict(*row[1:]), username=row[0]) for row in heapq.nsmallest(limit, rows, key=key)]
+    
+    def _due(self, username):
+        today = epoch_day()
+        for front, card in self.cards.get(username, {}).items():
+            if card["next_review"] <= today:
+                yield SrsCard(front, card["back"], card["interval"], card["easiness"], card["repetitions"])
+    
+    def get_due_cards(self, username):
+        with self.lock:
+            return list(self._due(username))
+    
+    def count_due_cards(self, username):
+        with self.lock:
+            return sum(1 for _ in self._due(username))
+    
+    def get_due_card(self, username, offset=0):
+        with self.lock:
+            return next(itertools.islice(self._due(username), offset, None), None)
+    
+    def _new_card(self, back):
+        return {
+            "back": back,
+            "interval": 1,
+            "easiness": 2.5,
+            "repetitions": 0,
+            "stability": None,
+            "difficulty": None,
+            "next_review": epoch_day(1),
+            "last_review": epoch_seconds(),
+        }
+    
+    def add_srs_card(self, username, front, back):
+        with self.lock:
+            self.cards.setdefault(username, {})[front] = self._new_card(back)
+            self.deck_versions[username] = next(self.deck_changes)
+    
+    def add_srs_cards(self, username, cards):
+        added = 0
+        with self.lock:
+            deck = self.cards.setdefault(username, {})
+            for card in cards:
+                if card["front"] not in deck:
+                    deck[card["front"]] = self._new_card(card["back"])
+                    added += 1
+            if added:
+                self.deck_versions[username] = next(self.deck_changes)
+        return added
+    
+    def get_srs_keys(self, username):
+        return [(front, card["back"]) for front, card in self.cards.get(username, {}).items()]
+    
+    def update_srs_card(self, username, front, quality):
+        with self.lock:
+            card = self.cards.get(username, {}).get(front)
+            if card is None:
+                return
+            now = epoch_seconds()
+            elapsed_days = max(0, (now - card["last_review"]) // 86400)
+            state = self.scheduler.review(
+                ReviewState(*(card[field] for field in ReviewState._fields)),
+                quality, elapsed_days, self.params.get(username)
+            )
+            card.update(state._asdict(), next_review=epoch_day(state.interval), last_review=now)
+            self.reviews.setdefault(username, []).append((front, now, quality, elapsed_days))
+            self.deck_versions[username] = next(self.deck_changes)
+            self._record_activity(username, reviews=1)
+            index = self.recommendations
+            if index is not None and quality < RECOMMEND_WEAK_QUALITY:
+                self._sync_queue(username, index)
+                queue = self.queues[username][1]
+                for key, score, reason in index.review_boosts(front, card["back"]):
+                    if key in queue:
+                        queue[key] = [queue[key][0] + RECOMMEND_REVIEW_BOOST, reason]
+                    else:
+                        queue[key] = [score, reason]
+    
+    def save_test_result(self, username, level, score, total, duration):
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.test_results.setdefault(username, []).append((level, now, score, total, duration))
+            stats = self.test_stats.setdefault((username, level), {
+                "attempts": 0, "best_score": 0, "total_questions": 0, "total_seconds": 0,
+            })
+            stats["attempts"] += 1
+            stats["best_score"] = max(stats["best_score"], score / total if total else 0)
+            stats["total_questions"] += total
+            stats["total_seconds"] += duration
+    
+    def get_test_stats(self, username, level):
+        stats = self.test_stats.get((username, level))
+        if not stats:
+            return None
+        return {
+            "attempts": stats["attempts"],
+            "best_score": stats["best_score"],
+            "seconds_per_question": (
+                stats["total_seconds"] / stats["total_questions"] if stats["total_questions"] else 0
+            ),
+        }
+    
+    def export_srs_cards(self, username):
+        return [
+            (front, card["back"], card["interval"], card["easiness"], card["repetitions"],
+             card["next_review"], card["last_review"])
+            for front, card in self.cards.get(username, {}).items()
+        ]
+    
+    def export_progress(self, username):
+        rows = [
+            (book_key, lesson_id, completed_at, score)
+            for (book_key, lesson_id), (completed_at, score) in self.progress.get(username, {}).items()
+        ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+    
+    def get_quality_counts(self, username=None):
+        logs = [self.reviews.get(username, [])] if username is not None else list(self.reviews.values())
+        return dict(Counter(review[2] for log in logs for review in log))
+    
+    def get_deck_version(self, username):
+        return self.deck_versions.get(username, 0)
+    
+    def get_global_stats(self):
+        return {
+            "users": len(self.users),
+            "completed_lessons": sum(len(lessons) for lessons in self.progress.values()),
+            "srs_cards": sum(len(deck) for deck in self.cards.values()),
+        }
+
+def create_repository(backend=STORAGE_BACKEND):
+    """Instancie le stockage choisi ("sqlite" ou "memory")"""
+    if backend == "memory":
+        return InMemoryRepository()
+    if backend == "sqlite":
+        return DatabaseManager(DB_FILE)
+    raise ValueError(f"Backend de stockage inconnu : {backend}")
+
+@st.cache_resource
+def get_database():
+    """Stockage partagé par toutes les sessions du processus"""
+    return create_repository()
+
+@st.cache_resource
+def get_forecast_cache():
+    """Prévisions de révision partagées par toutes les sessions du processus"""
+    return ForecastCache()
+
+# =============================================================================
+# CLASSE : SAUVEGARDES
+# =============================================================================
+
+class BackupManager:
+    """
+    Sauvegardes à chaud des shards SQLite dans backups/<nom>/ :
+    - complète : API de sauvegarde en ligne, copiée par petits blocs de pages
+      (l'application continue d'écrire entre deux blocs) ;
+    - incrémentale : lignes modifiées depuis la sauvegarde précédente
+      (completed_at, last_review...), en NDJSON, une ligne par enregistrement.
+    Chaque sauvegarde a un manifeste (sha256 des fichiers) vérifié avant
+    toute restauration. Les suppressions de cartes et de leçons sont les
+    pierres tombales de row_changes postérieures au seq noté par la
+    sauvegarde précédente. Les tables dérivées (DERIVED_TABLES) ne sont pas
+    sauvegardées : elles sont vidées après une restauration et se
+    reconstruisent d'elles-mêmes.
+    """
+    
+    # Table -> (colonne de date, format) lue par les sauvegardes incrémentales
+    INCREMENTAL_COLUMNS = {
+        "users": ("created_at", "iso"),
+        "progress": ("completed_at", "iso"),
+        "srs_cards": ("last_review", "seconds"),
+        "srs_reviews": ("reviewed_at", "seconds"),
+        "test_results": ("taken_at", "iso"),
+        "test_stats": ("last_taken_at", "iso"),
+        "user_stats": ("updated_at", "seconds"),
+        "scheduler_params": ("fitted_at", "seconds"),
+    }
+    # Recalculées après restauration : refresh_due_counts (ou comptage sur
+    # l'index en attendant) et reconstruction des files à la lecture suivante
+    DERIVED_TABLES = ("due_counts", "recommendations", "recommendation_state")
+    # Tables sans clé primaire : une ligne déjà présente n'est pas réinsérée
+    APPEND_ONLY = ("srs_reviews", "test_results")
+    MANIFEST = "manifest.json"
+    
+    def __init__(self, paths, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+        self.paths = [Path(path) for path in paths]
+        self.backup_dir = Path(backup_dir)
+        self.keep = keep
+    
+    def list_backups(self):
+        """Manifestes des sauvegardes présentes, de la plus ancienne à la plus récente"""
+        if not self.backup_dir.exists():
+            return []
+        manifests = []
+        for folder in self.backup_dir.iterdir():
+            manifest_file = folder / self.MANIFEST
+            if not folder.name.startswith(".") and manifest_file.exists():
+                manifests.append(json.loads(manifest_file.read_text(encoding='utf-8')))
+        return sorted(manifests, key=itemgetter("created_at", "name"))
+    
+    def snapshot(self, compress=False):
+        """Sauvegarde complète de chaque shard, puis rotation. Retourne le manifeste."""
+        since = epoch_seconds()
+        return self._write("full", since, compress, None, self._copy_shard)
+    
+    def incremental(self, compress=False):
+        """
+        Lignes modifiées depuis la dernière sauvegarde (complète ou
+        incrémentale). Sans sauvegarde complète, en fait une.
+        """
+        backups = self.list_backups()
+        fulls = [backup for backup in backups if backup["kind"] == "full"]
+        if not fulls:
+            return self.snapshot(compress)
+        since = epoch_seconds()
+        base = fulls[-1]["name"]
+        previous = max((backup for backup in backups if backup["name"] == base or backup.get("base") == base),
+                       key=itemgetter("since"))
+        
+        def export(index, target):
+            # Manifeste antérieur aux pierres tombales : toutes celles encore présentes
+            since_seq = previous["files"][index].get("seq", 0)
+            return self._export_changes(index, target, previous["since"], since_seq)
+        
+        return self._write("incremental", since, compress, base, export)
+    
+    def _write(self, kind, since, compress, base, dump):
+        """Écrit une sauvegarde dans un dossier temporaire puis la publie par renommage"""
+        name = datetime.fromtimestamp(since).strftime("%Y%m%d-%H%M%S") + ("-full" if kind == "full" else "-incr")
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        while (self.backup_dir / name).exists():
+            name += "+"
+        work = Path(tempfile.mkdtemp(prefix=f".{name}-", dir=self.backup_dir))
+        try:
+            files = []
+            for index in range(len(self.paths)):
+                raw = work / (f"shard_{index}.db" if kind == "full" else f"shard_{index}.ndjson")
+                rows, seq = dump(index, raw)
+                stored = raw
+                if compress:
+                    stored = raw.with_name(raw.name + ".gz")
+                    with open(raw, 'rb') as source, gzip.open(stored, 'wb') as target:
+                        shutil.copyfileobj(source, target)
+                    raw_digest = file_sha256(raw)
+                    raw.unlink()
+                else:
+                    raw_digest = file_sha256(raw)
+                files.append({
+                    "shard": index,
+                    "file": stored.name,
+                    "sha256": file_sha256(stored),
+                    "raw_sha256": raw_digest,
+                    "size": stored.stat().st_size,
+                    "rows": rows,
+                    "seq": seq,
+                })
+            manifest = {"name": name, "kind": kind, "created_at": epoch_seconds(), "since": since,
+                        "base": base, "compressed": compress, "files": files}
+            atomic_write_json(work / self.MANIFEST, manifest)
+            os.replace(work, self.backup_dir / name)
+        except BaseException:
+            shutil.rmtree(work, ignore_errors=True)
+            raise
+        fsync_directory(self.backup_dir)
+        self.rotate()
+        return manifest
+    
+    @staticmethod
+    def _change_seq(conn):
+        """Dernier seq attribué par row_changes (0 avant la migration 7)"""
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_sequence'").fetchone():
+            return 0
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='row_changes'").fetchone()
+        return row[0] if row else 0
+    
+    def _copy_shard(self, index, target_path):
+        """
+        Copie un shard par blocs de BACKUP_PAGES_PER_STEP pages, avec une pause
+        entre deux blocs. Retourne (None, seq de row_changes de la copie).
+        """
+        source = sqlite3.connect(self.paths[index], timeout=30)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP,
+                          progress=lambda status, remaining, total: time.sleep(BACKUP_STEP_PAUSE))
+            target.execute("PRAGMA journal_mode=DELETE")  # fichier autonome, sans -wal
+            seq = self._change_seq(target)
+        finally:
+            target.close()
+            source.close()
+        return None, seq
+    
+    def _export_changes(self, index, target_path, since, since_seq=0):
+        """
+        Écrit en NDJSON les lignes modifiées depuis since (secondes), puis les
+        pierres tombales de row_changes au-delà de since_seq.
+        Retourne (nombre d'enregistrements, seq de row_changes de l'instantané).
+        """
+        marks = {"seconds": since, "iso": datetime.fromtimestamp(since).isoformat()}
+        count = 0
+        conn = sqlite3.connect(self.paths[index], timeout=30)
+        try:
+            with open(target_path, 'w', encoding='utf-8') as f:
+                # Une seule transaction de lecture : instantané cohérent entre tables
+                conn.execute("BEGIN")
+                tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+                for table, (column, kind) in self.INCREMENTAL_COLUMNS.items():
+                    if table not in tables:
+                        continue
+                    cur = conn.execute(f"SELECT * FROM {table} WHERE {column} >= ?", (marks[kind],))
+                    columns = [description[0] for description in cur.description]
+                    for row in cur:
+                        f.write(json.dumps({"table": table, "row": dict(zip(columns, row))}, ensure_ascii=False))
+                        f.write("\n")
+                        count += 1
+                if "row_changes" in tables:
+                    tombstones = conn.execute("""
+                        SELECT table_name, username, key_text, key_int FROM row_changes
+                        WHERE seq > ? AND deleted = 1 ORDER BY seq
+                    """, (since_seq,))
+                    for table, username, key_text, key_int in tombstones:
+                        text_column, int_column = CHANGE_TRACKED[table]
+                        key = {"username": username, text_column: key_text}
+                        if int_column:
+                            key[int_column] = key_int
+                        f.write(json.dumps({"table": table, "deleted": key}, ensure_ascii=False))
+                        f.write("\n")
+                        count += 1
+                seq = self._change_seq(conn)
+                conn.rollback()
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            conn.close()
+        return count, seq
+    
+    def rotate(self):
+        """Garde les keep dernières sauvegardes complètes et leurs incrémentales"""
+        backups = self.list_backups()
+        fulls = [backup["name"] for backup in backups if backup["kind"] == "full"]
+        kept = set(fulls[-self.keep:]) if self.keep > 0 else set(fulls)
+        removed = []
+        for backup in backups:
+            owner = backup["name"] if backup["kind"] == "full" else backup["base"]
+            if owner not in kept:
+                shutil.rmtree(self.backup_dir / backup["name"], ignore_errors=True)
+                removed.append(backup["name"])
+        return removed
+    
+    def chain(self, name):
+        """Sauvegardes à rejouer pour revenir à l'état de name (complète puis incrémentales)"""
+        backups = {backup["name"]: backup for backup in self.list_backups()}
+        if name not in backups:
+            raise ValueError(f"Sauvegarde introuvable : {name}")
+        wanted = backups[name]
+        if wanted["kind"] == "full":
+            return [wanted]
+        if wanted["base"] not in backups:
+            raise ValueError(f"Sauvegarde complète manquante : {wanted['base']}")
+        increments = [
+            backup for backup in backups.values()
+            if backup.get("base") == wanted["base"] and backup["since"] <= wanted["since"]
+        ]
+        return [backups[wanted["base"]]] + sorted(increments, key=itemgetter("since", "name"))
+    
+    def verify(self, name):
+        """
+        Vérifie les sommes sha256 de toute la chaîne de restauration de name.
+        Lève ValueError au premier fichier absent ou altéré.
+        """
+        chain = self.chain(name)
+        for backup in chain:
+            if len(backup["files"]) != len(self.paths):
+                raise ValueError(f"{backup['name']} : {len(backup['files'])} shard(s) sauvegardé(s), "
+                                 f"{len(self.paths)} configuré(s)")
+            for entry in backup["files"]:
+                stored = self.backup_dir / backup["name"] / entry["file"]
+                if not stored.exists() or file_sha256(stored) != entry["sha256"]:
+                    raise ValueError(f"Somme de contrôle invalide : {backup['name']}/{entry['file']}")
+        return chain
+    
+    @contextmanager
+    def _unpacked(self, backup, entry):
+        """Chemin du fichier décompressé (temporaire) d'une sauvegarde, vérifié"""
+        stored = self.backup_dir / backup["name"] / entry["file"]
+        if not backup["compressed"]:
+            yield stored
+            return
+        fd, tmp_name = tempfile.mkstemp(prefix=".restore-", dir=self.backup_dir)
+        try:
+            with os.fdopen(fd, 'wb') as target, gzip.open(stored, 'rb') as source:
+                shutil.copyfileobj(source, target)
+            if file_sha256(tmp_name) != entry["raw_sha256"]:
+                raise ValueError(f"Somme de contrôle invalide après décompression : {stored}")
+            yield Path(tmp_name)
+        finally:
+            os.remove(tmp_name)
+    
+    def restore(self, name):
+        """
+        Restaure les shards dans l'état de la sauvegarde name : vérification
+        des sommes de contrôle, copie de la sauvegarde complète (API de
+        sauvegarde, en une transaction par shard), rejeu des incrémentales,
+        puis remise à zéro des tables dérivées.
+        Retourne la liste des sauvegardes appliquées.
+        """
+        chain = self.verify(name)
+        full, increments = chain[0], chain[1:]
+        for entry in full["files"]:
+            with self._unpacked(full, entry) as path:
+                source = sqlite3.connect(path)
+                try:
+                    if source.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                        raise ValueError(f"Base corrompue dans {full['name']}/{entry['file']}")
+                    target = sqlite3.connect(self.paths[entry["shard"]], timeout=30)
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+                finally:
+                    source.close()
+        for backup in increments:
+            for entry in backup["files"]:
+                with self._unpacked(backup, entry) as path:
+                    self._apply_changes(self.paths[entry["shard"]], path)
+        for path in self.paths:
+            self._clear_derived(path)
+        return [backup["name"] for backup in chain]
+    
+    def _clear_derived(self, db_path):
+        """Vide les tables dérivées d'un shard restauré (reconstruites ensuite par l'application)"""
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            with conn:
+                tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+                for table in self.DERIVED_TABLES:
+                    if table in tables:
+                        conn.execute(f"DELETE FROM {table}")
+        finally:
+            conn.close()
+    
+    def _apply_changes(self, db_path, changes_path):
+        """Rejoue un fichier NDJSON incrémental sur un shard (une transaction)"""
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            with conn, open(changes_path, encoding='utf-8') as f:
+                for line in f:
+                    change = json.loads(line)
+                    table = change["table"]
+                    if "deleted" in change:
+                        key = change["deleted"]
+                        condition = " AND ".join(f"{column}=?" for column in key)
+                        conn.execute(f"DELETE FROM {table} WHERE {condition}", list(key.values()))
+                        continue
+                    row = change["row"]
+                    columns = ", ".join(row)
+                    marks = ", ".join("?" for _ in row)
+                    if table in self.APPEND_ONLY:
+                        condition = " AND ".join(f"{column} IS ?" for column in row)
+                        conn.execute(
+                            f"INSERT INTO {table} ({columns}) SELECT {marks} "
+                            f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {condition})",
+                            list(row.values()) * 2
+                        )
+                    else:
+                        conn.execute(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({marks})",
+                                     list(row.values()))
+        finally:
+            conn.close()
+
+# =============================================================================
+# CLASSE : GESTIONNAIRE DE DONNÉES
+# =============================================================================
+
+class DataManager:
+    """Gère le chargement et la sauvegarde des données JSON"""
+    
+    def __init__(self, data_file):
+        self.data_file = data_file
+        self.store = ContentStore(data_file)
+        self.version = None
+        self.signature = None
+        self.error = None  # Dernière erreur de chargement (version précédente conservée)
+        self.data = None
+        self._derived = {}
+        self._reload_lock = threading.Lock()
+        self.data = self.load_data()
+    
+    def load_data(self):
+        """
+        Charge et valide les données du fichier JSON. Un fichier illisible ou
+        invalide n'est jamais écrasé : la dernière version valide reste en
+        service (contenu vide en mémoire s'il n'y en a pas encore).
+        """
+        try:
+            data, raw, signature = self.store.read()
+        except FileNotFoundError:
+            return self.create_default_data()
+        except (OSError, ContentError) as e:
+            self.error = str(e)
+            self.signature = self.store.signature()  # pas de nouvel essai avant la prochaine écriture
+            return self.data if self.data is not None else self.default_data()
+        self.signature = signature
+        self.version = hashlib.sha1(raw).hexdigest()[:12]
+        self.error = None
+        return data
+    
+    def reload(self):
+        """Recharge data.json et invalide les index dérivés du contenu"""
+        with self._reload_lock:
+            self._reload()
+    
+    def _reload(self):
+        data = self.load_data()
+        if data is not self.data:
+            # Nouveau dictionnaire plutôt que clear() : une session qui lit
+            # encore l'ancienne version ne mélange pas les deux
+            self.data = data
+            self._derived = {}
+    
+    def refresh(self):
+        """
+        Recharge data.json uniquement s'il a été modifié sur le disque. Si une
+        autre session recharge déjà, la version courante est servie sans attendre.
+        """
+        signature = self.store.signature()
+        if signature is None or signature == self.signature:
+            return
+        if self._reload_lock.acquire(blocking=False):
+            try:
+                self._reload()
+            finally:
+                self._reload_lock.release()
+    
+    def derived(self, name, builder):
+        """
+        Retourne un index calculé à partir du contenu (mémorisé jusqu'au
+        prochain rechargement de data.json)
+        """
+        if name not in self._derived:
+            self._derived[name] = builder(self.data)
+        return self._derived[name]
+    
+    @staticmethod
+    def default_data():
+        """Structure de données par défaut (livres vides)"""
+        return {
+            "meta": {
+                "version": "2.0",
+                "created": datetime.now().isoformat()
+            },
+            "books": {
+                "40_lecons": {"title": "40 Leçons", "lessons": []},
+                "800_expressions": {"title": "800 Expressions", "chapters": []},
+                "etre_pro": {"title": "Être Pro", "fiches": []}
+            },
+            "srs_cards": [],
+            "tests": {}
+        }
+    
+    def create_default_data(self):
+        """Crée data.json avec la structure par défaut, sauf si un autre processus vient de le créer"""
+        self.store.create(self.default_data())
+        return self.load_data()
+    
+    def save_data(self, data):
+        """Sauvegarde les données dans le fichier JSON (verrou d'écriture, écriture atomique)"""
+        self.store.write(data)
+    
+    def get_total_lessons_count(self):
+        """Compte le nombre total de leçons"""
+        total = 0
+        for book in self.data["books"].values():
+            for key, value in book.items():
+                if isinstance(value, list):
+                    total += len(value)
+        return total
+
+@st.cache_resource
+def get_data_manager():
+    """Contenu partagé par toutes les sessions (rechargé si data.json change)"""
+    return DataManager(DATA_FILE)
+
+# =============================================================================
+# CLASSE : IMPORT DE CONTENU EN FLUX
+# =============================================================================
+
+class JsonEventParser:
+    """
+    Parseur JSON incrémental qui produit des événements façon ijson
+    (prefix, event, value). Utilisé lorsque ijson n'est pas installé :
+    la mémoire reste bornée par la taille d'un bloc et d'une valeur scalaire.
+    """
+    
+    NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?")
+    NUMBER_SPAN_RE = re.compile(r"[-+.0-9eE]*")
+    LITERALS = {"true": True, "false": False, "null": None}
+    
+    def __init__(self, stream, chunk_size=IMPORT_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+    
+    def _fill(self):
+        """Lit un bloc supplémentaire, retourne False en fin de flux"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+        return not self.eof
+    
+    def _read_string(self):
+        while True:
+            try:
+                value, self.pos = json.decoder.scanstring(self.buf, self.pos + 1)
+                return value
+            except json.JSONDecodeError as e:
+                truncated = e.msg.startswith("Unterminated") or e.pos >= len(self.buf) - 6
+                if not (truncated and self._fill()):
+                    raise ValueError(f"Chaîne invalide : {e.msg}") from None
+    
+    def _read_number(self):
+        while self.NUMBER_SPAN_RE.match(self.buf, self.pos).end() == len(self.buf) and self._fill():
+            pass
+        match = self.NUMBER_RE.match(self.buf, self.pos)
+        if not match or match.end() != self.NUMBER_SPAN_RE.match(self.buf, self.pos).end():
+            raise ValueError(f"Nombre invalide : {self.buf[self.pos:self.pos + 10]!r}")
+        self.pos = match.end()
+        number, frac, exp = match.group(0), match.group(1), match.group(2)
+        return float(number) if frac or exp else int(number)
+    
+    def _read_literal(self):
+        while len(self.buf) - self.pos < 5 and self._fill():
+            pass
+        for word, value in self.LITERALS.items():
+            if self.buf.startswith(word, self.pos):
+                self.pos += len(word)
+                return value
+        raise ValueError(f"Valeur inattendue : {self.buf[self.pos:self.pos + 10]!r}")
+    
+    def _tokens(self):
+        while True:
+            while True:
+                while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                    self.pos += 1
+                if self.pos < len(self.buf) or not self._fill():
+                    break
+            if self.pos >= len(self.buf):
+                return
+            
+            char = self.buf[self.pos]
+            if char in "{}[]:,":
+                self.pos += 1
+                yield char, None
+            elif char == '"':
+                yield "string", self._read_string()
+            elif char in "-0123456789":
+                yield "number", self._read_number()
+            else:
+                yield "literal", self._read_literal()
+    
+    @staticmethod
+    def _next(tokens):
+        token = next(tokens, None)
+        if token is None:
+            raise ValueError("Fin de fichier inattendue")
+        return token
+    
+    def _value(self, tokens, token, prefix):
+        kind, value = token
+        
+        if kind == "{":
+            yield prefix, "start_map", None
+            token = self._next(tokens)
+            while token[0] != "}":
+                if token[0] != "string":
+                    raise ValueError("Clé attendue dans un objet")
+                key = token[1]
+                yield prefix, "map_key", key
+                if self._next(tokens)[0] != ":":
+                    raise ValueError(f"':' attendu après la clé '{key}'")
+                yield from self._value(tokens, self._next(tokens), f"{prefix}.{key}" if prefix else key)
+                token = self._next(tokens)
+                if token[0] == ",":
+                    token = self._next(tokens)
+                    if token[0] == "}":
+                        raise ValueError("Virgule en trop dans un objet")
+                elif token[0] != "}":
+                    raise ValueError("',' ou '}' attendu dans un objet")
+            yield prefix, "end_map", None
+        
+        elif kind == "[":
+            yield prefix, "start_array", None
+            item_prefix = f"{prefix}.item" if prefix else "item"
+            token = self._next(tokens)
+            while token[0] != "]":
+                yield from self._value(tokens, token, item_prefix)
+                token = self._next(tokens)
+                if token[0] == ",":
+                    token = self._next(tokens)
+                    if token[0] == "]":
+                        raise ValueError("Virgule en trop dans une liste")
+                elif token[0] != "]":
+                    raise ValueError("',' ou ']' attendu dans une liste")
+            yield prefix, "end_array", None
+        
+        elif kind in ("string", "number"):
+            yield prefix, kind, value
+        elif kind == "literal":
+            yield prefix, "null" if value is None else "boolean", value
+        else:
+            raise ValueError(f"Valeur attendue, '{kind}' trouvé")
+    
+    def events(self):
+        """Itère sur les événements du document JSON"""
+        tokens = self._tokens()
+        yield from self._value(tokens, self._next(tokens), "")
+        if next(tokens, None) is not None:
+            raise ValueError("Contenu superflu après la fin du document")
+
+def iter_json_events(stream):
+    """Parse un flux JSON de façon incrémentale (ijson si disponible)"""
+    if ijson is not None:
+        return ijson.parse(stream, use_float=True)
+    return JsonEventParser(stream).events()
+
+def build_json_value(events, event, value):
+    """Reconstruit une valeur complète à partir du flux d'événements"""
+    if event not in ("start_map", "start_array"):
+        return value
+    
+    root = {} if event == "start_map" else []
+    stack, keys = [root], [None]
+    for _, event, value in events:
+        if event == "map_key":
+            keys[-1] = value
+            continue
+        if event in ("end_map", "end_array"):
+            stack.pop()
+            keys.pop()
+            if not stack:
+                return root
+            continue
+        
+        new = {} if event == "start_map" else [] if event == "start_array" else value
+        if isinstance(stack[-1], dict):
+            stack[-1][keys[-1]] = new
+        else:
+            stack[-1].append(new)
+        if event in ("start_map", "start_array"):
+            stack.append(new)
+            keys.append(None)
+    raise ValueError("Fin de fichier inattendue")
+
+class TeeReader:
+    """Recopie tout ce qui est lu d'un flux dans un fichier de sortie"""
+    
+    def __init__(self, stream, out):
+        self.stream = stream
+        self.out = out
+    
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.out.write(chunk)
+        return chunk
+
+class ContentImporter:
+    """
+    Importe un data.json en flux : le fichier est recopié dans un fichier
+    temporaire pendant sa validation (mémoire bornée par la taille d'un
+    élément), puis basculé par renommage atomique après confirmation.
+    """
+    
+    CONTENT_KEYS = ("lessons", "chapters", "fiches")
+    EXERCISE_TYPES = ("qcm", "trous", "transformation", "correction", "production")
+    MAX_ERRORS = 50
+    
+    def __init__(self, data_manager):
+        self.data_manager = data_manager
+        self.temp_path = None
+        self.meta = {}
+        self.errors = []
+        self.hashes = {}  # section -> {clé de l'élément: empreinte}
+        self.hasher = MinHasher()
+        self.dedup_entries = []  # (type, emplacement, libellé) des textes comparés
+        self.signatures = []  # Signature MinHash de chacun (quelques centaines d'octets)
+        self.duplicates = []  # Groupes de quasi-doublons (le premier est l'original)
+    
+    @staticmethod
+    def fingerprint(item):
+        """Empreinte compacte d'un élément (pour le résumé des différences)"""
+        raw = json.dumps(item, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        return hashlib.blake2b(raw, digest_size=8).digest()
+    
+    @classmethod
+    def iter_sections(cls, data):
+        """Itère sur (section, clé, élément) d'un contenu déjà chargé"""
+        for book_key, book in data.get("books", {}).items():
+            for content_key in cls.CONTENT_KEYS:
+                for item in book.get(content_key, []):
+                    yield f"{book_key}/{content_key}", item.get("id"), item
+        for card in data.get("srs_cards", []):
+            yield "srs_cards", card.get("front"), card
+        for level, test in data.get("tests", {}).items():
+            yield "tests", level, test
+    
+    def _error(self, message):
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(message)
+    
+    def _require(self, item, where, fields):
+        """Vérifie la présence et le type des champs obligatoires"""
+        if not isinstance(item, dict):
+            self._error(f"{where} : un objet est attendu")
+            return False
+        ok = True
+        for field, expected_type in fields.items():
+            if not isinstance(item.get(field), expected_type) or isinstance(item.get(field), bool):
+                self._error(f"{where} : champ '{field}' manquant ou invalide")
+                ok = False
+        return ok
+    
+    def _check_list(self, item, key, where, fields):
+        entries = item.get(key, [])
+        if not isinstance(entries, list):
+            self._error(f"{where} : '{key}' doit être une liste")
+            return
+        for idx, entry in enumerate(entries):
+            self._require(entry, f"{where} > {key} {idx + 1}", fields)
+    
+    def _check_exercise(self, exercise, where):
+        if not self._require(exercise, where, {"type": str, "question": str}):
+            return
+        if exercise["type"] not in self.EXERCISE_TYPES:
+            self._error(f"{where} : type d'exercice inconnu '{exercise['type']}'")
+        elif exercise["type"] == "qcm":
+            options = exercise.get("options")
+            answer = exercise.get("answer")
+            if not isinstance(options, list) or not options:
+                self._error(f"{where} : 'options' doit être une liste non vide")
+            elif not isinstance(answer, int) or not 0 <= answer < len(options):
+                self._error(f"{where} : 'answer' doit être l'index d'une option")
+        elif "answer" not in exercise:
+            self._error(f"{where} : champ 'answer' manquant")
+    
+    def _check_item(self, content_key, item, where):
+        """Valide une leçon, un chapitre ou une fiche"""
+        if not self._require(item, where, {"id": int, "title": str}):
+            return
+        if content_key == "lessons":
+            self._check_list(item, "vocabulaire", where, {"word": str, "translation": str})
+            exercises = item.get("exercices", [])
+            if not isinstance(exercises, list):
+                self._error(f"{where} : 'exercices' doit être une liste")
+            else:
+                for idx, exercise in enumerate(exercises):
+                    self._check_exercise(exercise, f"{where} > exercice {idx + 1}")
+        elif content_key == "chapters":
+            self._check_list(item, "expressions", where, {"en": str, "fr": str})
+        else:
+            self._check_list(item, "phrases_cles", where, {"en": str, "fr": str})
+    
+    def _check_test(self, level, test):
+        where = f"Test '{level}'"
+        if not isinstance(test, dict):
+            self._error(f"{where} : un objet est attendu")
+            return
+        self._check_list(test, "questions", where, {"question": str, "answer": str})
+    
+    def _sign(self, entries):
+        """Signatures MinHash des textes d'un élément, calculées pendant la validation"""
+        for kind, where, label, text in entries:
+            self.dedup_entries.append((kind, where, label))
+            self.signatures.append(self.hasher.signature(text))
+    
+    def _record(self, section, key, item):
+        hashes = self.hashes.setdefault(section, {})
+        if key in hashes:
+            self._error(f"{section} : identifiant en double '{key}'")
+        hashes[key] = self.fingerprint(item)
+    
+    def _validate(self, events):
+        """Parcourt les événements et valide chaque élément un par un"""
+        first = next(events, None)
+        if first is None or first[1] != "start_map":
+            self._error("Le document doit être un objet JSON")
+            return
+        
+        root_keys = set()
+        expected_types = {"books": "start_map", "srs_cards": "start_array", "tests": "start_map"}
+        # Chemin suivi ici plutôt que relu dans le préfixe pointé des
+        # événements : une clé contenant un point (livre 'v1.0', niveau 'a.2')
+        # en changerait la profondeur et son contenu échapperait à la validation
+        path = [None]  # Clé courante de chaque objet ouvert ("item" dans une liste)
+        
+        for _, event, value in events:
+            if event == "map_key":
+                path[-1] = value
+                if len(path) == 1:
+                    root_keys.add(value)
+                continue
+            if event in ("end_map", "end_array"):
+                path.pop()
+                continue
+            
+            parts = tuple(path)
+            depth = len(parts)
+            starts = event in ("start_map", "start_array")
+            consumed = starts  # Faux si la valeur n'est pas lue en entier ci-dessous
+            
+            if depth == 1 and starts and parts[0] == "meta":
+                self.meta = build_json_value(events, event, value)
+            
+            elif depth == 1 and parts[0] in expected_types and event != expected_types[parts[0]]:
+                self._error(f"'{parts[0]}' n'a pas le type attendu")
+                build_json_value(events, event, value)
+            
+            elif depth == 2 and parts[0] == "books" and starts and event != "start_map":
+                self._error(f"Livre '{parts[1]}' : un objet est attendu")
+                build_json_value(events, event, value)
+            
+            elif depth == 2 and parts[0] == "srs_cards":
+                card = build_json_value(events, event, value)
+                where = f"Carte SRS {len(self.hashes.get('srs_cards', {})) + 1}"
+                if self._require(card, where, {"front": str, "back": str}):
+                    self._sign([(KIND_CARD, where, f"{card['front']} → {card['back']}", card_text(card))])
+                    self._record("srs_cards", card["front"], card)
+            
+            elif depth == 2 and parts[0] == "tests" and starts:
+                test = build_json_value(events, event, value)
+                self._check_test(parts[1], test)
+                self._record("tests", parts[1], test)
+            
+            elif depth == 3 and parts[0] == "books" and parts[2] in self.CONTENT_KEYS and event != "start_array":
+                self._error(f"Livre '{parts[1]}' : '{parts[2]}' doit être une liste")
+                build_json_value(events, event, value)
+            
+            elif depth == 4 and parts[0] == "books" and parts[2] in self.CONTENT_KEYS and parts[3] == "item":
+                item = build_json_value(events, event, value)
+                section = f"{parts[1]}/{parts[2]}"
+                where = f"{section} {len(self.hashes.get(section, {})) + 1}"
+                self._check_item(parts[2], item, where)
+                if isinstance(item, dict):
+                    position = len(self.hashes.get(section, {}))
+                    self._sign(item_entries(parts[1], parts[2], position, item))
+                    self._record(section, item.get("id"), item)
+            
+            else:
+                consumed = False
+            
+            if starts and not consumed:
+                path.append(None if event == "start_map" else "item")
+        
+        if "books" not in root_keys:
+            self._error("Clé 'books' manquante")
+    
+    def stage(self, stream):
+        """
+        Valide le flux tout en le recopiant dans un fichier temporaire.
+        Retourne True si le fichier peut être importé.
+        """
+        data_dir = self.data_manager.data_file.parent
+        fd, tmp_name = tempfile.mkstemp(prefix=".data-import-", suffix=".json", dir=data_dir)
+        self.temp_path = Path(tmp_name)
+        
+        with os.fdopen(fd, 'wb') as out:
+            try:
+                self._validate(iter(iter_json_events(TeeReader(stream, out))))
+            except Exception as e:
+                self._error(f"JSON invalide : {e}")
+            out.flush()
+            os.fsync(out.fileno())
+        
+        if self.errors:
+            self.discard()
+            return False
+        # Quasi-doublons regroupés une fois (l'aperçu est réaffiché à chaque passage)
+        self.duplicates = near_duplicate_groups(self.dedup_entries, self.signatures)
+        self.dedup_entries, self.signatures = [], []
+        return True
+    
+    def diff_summary(self):
+        """Compare le fichier validé avec le contenu actuel, section par section"""
+        current = {}
+        for section, key, item in self.iter_sections(self.data_manager.data):
+            current.setdefault(section, {})[key] = self.fingerprint(item)
+        
+        rows = []
+        for section in sorted(set(current) | set(self.hashes)):
+            old, new = current.get(section, {}), self.hashes.get(section, {})
+            common = old.keys() & new.keys()
+            rows.append({
+                "Section": section,
+                "Ajoutés": len(new.keys() - old.keys()),
+                "Supprimés": len(old.keys() - new.keys()),
+                "Modifiés": sum(1 for key in common if old[key] != new[key]),
+                "Inchangés": sum(1 for key in common if old[key] == new[key]),
+            })
+        return rows
+    
+    def commit(self):
+        """Remplace data.json par le fichier validé (renommage atomique)"""
+        self.data_manager.store.replace_with(self.temp_path)
+        self.temp_path = None
+        self.data_manager.reload()
+    
+    def discard(self):
+        """Supprime le fichier temporaire d'un import abandonné"""
+        if self.temp_path is not None and self.temp_path.exists():
+            self.temp_path.unlink()
+        self.temp_path = None
+
+# =============================================================================
+# CLASSE : INDEX DE RECHERCHE PLEIN TEXTE
+# =============================================================================
+
+class SearchIndex:
+    """
+    Index inversé (mot → documents) sur les explications des leçons, le
+    vocabulaire, les expressions des chapitres et les phrases clés des fiches.
+    Classement BM25, recherche insensible aux accents, préfixe sur le dernier
+    mot. Mis à jour de façon incrémentale : seuls les éléments dont
+    l'empreinte a changé sont réindexés.
+    """
+    
+    STOP_WORDS = frozenset(
+        "a an the of to is are and or in on at it "
+        "le la les l de des du d un une et ou en au aux est ce"
+        .split()
+    )
+    K1 = 1.2
+    B = 0.75
+    MAX_PREFIX_EXPANSIONS = 50
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.postings = {}   # mot -> {doc_id: fréquence}
+        self.docs = {}       # doc_id -> (longueur, résultat affichable, mots)
+        self.item_docs = {}  # (livre, id de l'élément) -> (empreinte, [doc_ids])
+        self.total_length = 0
+        self.next_doc_id = 0
+        self._terms = None   # Vocabulaire trié, pour la recherche par préfixe
+    
+    @staticmethod
+    def _documents(book, item):
+        """Découpe un élément de contenu en documents indexables"""
+        where = f"{book.get('title', '')} › {item.get('title', 'Sans titre')}"
+        
+        if item.get("explications"):
+            yield item["explications"], {
+                "kind": "📖 Explications",
+                "title": item.get("title", "Sans titre"),
+                "text": item["explications"][:120],
+                "where": where,
+            }
+        
+        for vocab in item.get("vocabulaire", []):
+            text = f"{vocab.get('word', '')} {vocab.get('translation', '')} {vocab.get('example', '')}"
+            yield text, {
+                "kind": "📚 Vocabulaire",
+                "title": f"{vocab.get('word', '')} — {vocab.get('translation', '')}",
+                "text": vocab.get("example", ""),
+                "where": where,
+            }
+        
+        for kind, key in (("💬 Expression", "expressions"), ("💼 Phrase clé", "phrases_cles")):
+            for expression in item.get(key, []):
+                text = f"{expression.get('en', '')} {expression.get('fr', '')} {expression.get('context', '')}"
+                yield text, {
+                    "kind": kind,
+                    "title": f"{expression.get('en', '')} — {expression.get('fr', '')}",
+                    "text": expression.get("context", ""),
+                    "where": where,
+                }
+    
+    def _add(self, text, hit):
+        terms = [t for t in tokenize(text) if t not in self.STOP_WORDS]
+        counts = Counter(terms)
+        doc_id = self.next_doc_id
+        self.next_doc_id += 1
+        
+        for term, count in counts.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self._terms = None
+            self.postings[term][doc_id] = count
+        
+        self.docs[doc_id] = (len(terms), hit, tuple(counts))
+        self.total_length += len(terms)
+        return doc_id
+    
+    def _remove(self, doc_ids):
+        for doc_id in doc_ids:
+            length, _, terms = self.docs.pop(doc_id)
+            self.total_length -= length
+            for term in terms:
+                postings = self.postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self.postings[term]
+                    self._terms = None
+    
+    def update(self, data, version=None):
+        """Synchronise l'index avec le contenu (ne réindexe que ce qui a changé)"""
+        with self.lock:
+            if version is not None and version == self.version:
+                return
+            
+            seen = set()
+            for book_key, book in data.get("books", {}).items():
+                for content_key in ContentImporter.CONTENT_KEYS:
+                    for item in book.get(content_key, []):
+                        key = (book_key, content_key, item.get("id"))
+                        seen.add(key)
+                        fingerprint = ContentImporter.fingerprint([book.get("title"), item])
+                        previous = self.item_docs.get(key)
+                        if previous and previous[0] == fingerprint:
+                            continue
+                        if previous:
+                            self._remove(previous[1])
+                        doc_ids = [self._add(text, hit) for text, hit in self._documents(book, item)]
+                        self.item_docs[key] = (fingerprint, doc_ids)
+            
+            for key in set(self.item_docs) - seen:
+                self._remove(self.item_docs.pop(key)[1])
+            
+            self.version = version
+    
+    def _expand(self, term):
+        """Mots de l'index commençant par `term` (dernier mot de la requête)"""
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        start = bisect.bisect_left(self._terms, term)
+        matches = []
+        for candidate in self._terms[start:start + self.MAX_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+    
+    def search(self, query, limit=SEARCH_MAX_RESULTS):
+        """Retourne les meilleurs résultats pour une requête (classement BM25)"""
+        terms = [t for t in tokenize(query) if t not in self.STOP_WORDS] or tokenize(query)
+        
+        with self.lock:
+            if not terms or not self.docs:
+                return []
+            
+            total_docs = len(self.docs)
+            avg_length = max(1.0, self.total_length / total_docs)
+            scores = {}
+            
+            for position, term in enumerate(terms):
+                matches = self._expand(term) if position == len(terms) - 1 else [term]
+                for match in matches:
+                    postings = self.postings.get(match)
+                    if not postings:
+                        continue
+                    # Un mot complet compte plus qu'un simple préfixe
+                    weight = 1.0 if match == term else 0.5
+                    idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc_id, freq in postings.items():
+                        norm = self.K1 * (1 - self.B + self.B * self.docs[doc_id][0] / avg_length)
+                        score = weight * idf * freq * (self.K1 + 1) / (freq + norm)
+                        scores[doc_id] = scores.get(doc_id, 0.0) + score
+            
+            best = heapq.nlargest(limit, scores.items(), key=lambda entry: entry[1])
+            return [self.docs[doc_id][1] for doc_id, _ in best]
+
+@st.cache_resource
+def get_search_index():
+    """Index de recherche partagé par toutes les sessions du processus"""
+    return SearchIndex()
+
+# =============================================================================
+# CLASSE : DICTIONNAIRE DE VOCABULAIRE
+# =============================================================================
+
+class VocabularyLookup:
+    """
+    Dictionnaire dédupliqué mot anglais → traduction/exemple, précalculé
+    une fois par version du contenu sur tous les livres (vocabulaire des
+    leçons et fiches, expressions, phrases clés).
+    """
+    
+    def __init__(self, data):
+        self.entries = {}
+        for book in data.get("books", {}).values():
+            for content_key in ContentImporter.CONTENT_KEYS:
+                for item in book.get(content_key, []):
+                    for word, translation, example in self.item_pairs(item):
+                        self.entries.setdefault(normalize_key(word), {
+                            "word": word,
+                            "translation": translation,
+                            "example": example,
+                        })
+    
+    @staticmethod
+    def item_pairs(item):
+        """Itère sur les paires (anglais, français, exemple) d'un élément"""
+        for vocab in item.get("vocabulaire", []):
+            if vocab.get("word") and vocab.get("translation"):
+                yield vocab["word"], vocab["translation"], vocab.get("example", "")
+        for key in ("expressions", "phrases_cles"):
+            for expression in item.get(key, []):
+                if expression.get("en") and expression.get("fr"):
+                    yield expression["en"], expression["fr"], expression.get("example", "")
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def get(self, word):
+        """Recherche un mot ou une expression (insensible à la casse et aux accents)"""
+        return self.entries.get(normalize_key(word))
+    
+    def cards_for(self, item):
+        """Cartes SRS (face française, dos anglais) d'une leçon ou d'un chapitre"""
+        cards = {}
+        for word, _, _ in self.item_pairs(item):
+            key = normalize_key(word)
+            entry = self.entries.get(key)
+            if entry and key not in cards:
+                cards[key] = {"front": entry["translation"], "back": entry["word"]}
+        return list(cards.values())
+
+# =============================================================================
+# CLASSE : RECOMMANDATION DE LA PROCHAINE LEÇON
+# =============================================================================
+
+class RecommendationIndex:
+    """
+    Graphe des leçons précalculé une fois par version du contenu :
+    - ordre conseillé : niveau (A1 → C2) puis position dans le livre ;
+    - prérequis : leçons qui introduisent un mot du vocabulaire employé
+      (explications, exemples, exercices) par une leçon plus tardive ;
+    - leçons qui enseignent chaque mot (pour revoir un mot raté en SRS).
+    La file de chaque utilisateur (table recommendations) est ensuite tenue
+    à jour par petites touches à chaque leçon complétée ou carte ratée.
+    """
+    
+    LEVELS = ("A1", "A2", "B1", "B2", "C1", "C2")
+    
+    def __init__(self, data):
+        lessons = []
+        for book_key, book in data.get("books", {}).items():
+            for position, lesson in enumerate(book.get("lessons", [])):
+                level = lesson.get("level", "")
+                rank = self.LEVELS.index(level) if level in self.LEVELS else len(self.LEVELS)
+                lessons.append((rank, position, book_key, lesson))
+        lessons.sort(key=itemgetter(0, 1))
+        
+        self.order = [(book_key, lesson["id"]) for _, _, book_key, lesson in lessons]
+        self.titles = {key: lesson.get("title", "") for key, (*_, lesson) in zip(self.order, lessons)}
+        # Score de base : la première leçon de l'ordre conseillé passe avant les autres
+        self.base_scores = {key: len(self.order) - position for position, key in enumerate(self.order)}
+        
+        # Mot → leçons qui l'enseignent (dans l'ordre conseillé)
+        self.word_lessons = {}
+        for key, (*_, lesson) in zip(self.order, lessons):
+            for vocab in lesson.get("vocabulaire", []):
+                word_key = normalize_key(vocab.get("word", ""))
+                if word_key and key not in self.word_lessons.get(word_key, ()):
+                    self.word_lessons.setdefault(word_key, []).append(key)
+        
+        # Prérequis : n-grammes du texte de la leçon cherchés dans le vocabulaire
+        # (temps linéaire en la taille du texte, pas en celle du vocabulaire)
+        self.position = {key: index for index, key in enumerate(self.order)}
+        self.prerequisites = {key: set() for key in self.order}
+        self.dependents = {key: set() for key in self.order}
+        longest = max((len(word_key.split()) for word_key in self.word_lessons), default=0)
+        for key, (*_, lesson) in zip(self.order, lessons):
+            tokens = tokenize(self.lesson_text(lesson))
+            for size in range(1, longest + 1):
+                for start in range(len(tokens) - size + 1):
+                    teachers = self.word_lessons.get(" ".join(tokens[start:start + size]))
+                    if teachers and self.position[teachers[0]] < self.position[key]:
+                        self.prerequisites[key].add(teachers[0])
+                        self.dependents[teachers[0]].add(key)
+        
+        graph = [(key, sorted(self.prerequisites[key])) for key in self.order]
+        self.version = hashlib.sha1(json.dumps(graph).encode('utf-8')).hexdigest()[:12]
+    
+    @staticmethod
+    def lesson_text(lesson):
+        """Texte d'une leçon où chercher le vocabulaire des leçons précédentes"""
+        parts = [lesson.get("summary", ""), lesson.get("explications", "")]
+        parts.extend(vocab.get("example", "") for vocab in lesson.get("vocabulaire", []))
+        for exercise in lesson.get("exercices", []):
+            parts.append(exercise.get("question", ""))
+            if isinstance(exercise.get("answer"), str):
+                parts.append(exercise["answer"])
+        return " ".join(part for part in parts if isinstance(part, str))
+    
+    def is_ready(self, key, completed):
+        """Vrai si la leçon n'est pas faite et que tous ses prérequis le sont"""
+        return key not in completed and self.prerequisites.get(key, set()) <= completed
+    
+    def initial_queue(self, completed):
+        """File complète d'un utilisateur : [(clé, score, raison)] des leçons prêtes"""
+        return [(key, self.base_scores[key], "suite") for key in self.order if self.is_ready(key, completed)]
+    
+    def unlocked_by(self, key, completed):
+        """Leçons rendues disponibles par la leçon key qui vient d'être complétée"""
+        return [
+            (dependent, self.base_scores[dependent], "suite")
+            for dependent in sorted(self.dependents.get(key, ()), key=self.position.get)
+            if self.is_ready(dependent, completed)
+        ]
+    
+    def review_boosts(self, front, back):
+        """Leçons à revoir après une carte ratée : [(clé, bonus, raison)]"""
+        boosts = {}
+        for text in (back, front):
+            for key in self.word_lessons.get(normalize_key(text), ()):
+                boosts.setdefault(key, (key, RECOMMEND_REVIEW_BOOST + self.base_scores[key], f"revoir « {text} »"))
+        return list(boosts.values())
+
+# =============================================================================
+# CLASSE : FRAGMENTS D'AFFICHAGE DU CONTENU
+# =============================================================================
+
+class ContentFragments:
+    """
+    Fragments Markdown des chapitres et fiches, construits à la demande puis
+    mémorisés par (livre, identifiant) pour une version du contenu : un
+    passage de Streamlit ne refait que les appels à st.markdown, sans
+    reparcourir ni sérialiser les éléments.
+    """
+    
+    def __init__(self, data, page_size=EXPRESSIONS_PAGE_SIZE):
+        self.data = data
+        self.page_size = page_size
+        self.fragments = {}
+    
+    def get(self, book_key, item):
+        """Retourne (en-tête, [(titre de section, [pages Markdown])]) d'un élément"""
+        key = (book_key, item.get("id"))
+        if key not in self.fragments:
+            self.fragments[key] = (self.header(item), list(self.sections(item)))
+        return self.fragments[key]
+    
+    @staticmethod
+    def header(item):
+        """Ligne d'informations (thème, domaine, niveau) d'un élément"""
+        fields = (("Thème", "theme"), ("Domaine", "domaine"), ("Niveau", "niveau"))
+        return " · ".join(f"**{label} :** {item[key]}" for label, key in fields if item.get(key))
+    
+    def sections(self, item):
+        """Itère sur les sections présentes dans l'élément, dans l'ordre d'affichage"""
+        for title, key in (("💬 Expressions", "expressions"), ("💼 Phrases clés", "phrases_cles")):
+            if item.get(key):
+                yield title, self.paginate([self.expression(e) for e in item[key]])
+        if item.get("structure"):
+            yield "🧱 Structure", ["\n\n".join(self.structure_part(p) for p in item["structure"])]
+        if item.get("conseils"):
+            yield "💡 Conseils", ["\n".join(f"- {tip}" for tip in item["conseils"])]
+        if item.get("vocabulaire"):
+            yield "📚 Vocabulaire", self.paginate([self.vocabulary(v) for v in item["vocabulaire"]])
+        if item.get("exercice"):
+            yield "✍️ Exercice", [f"> {item['exercice']}"]
+    
+    def paginate(self, lines):
+        """Regroupe des lignes Markdown en pages de page_size lignes"""
+        return ["\n".join(lines[start:start + self.page_size])
+                for start in range(0, len(lines), self.page_size)]
+    
+    @staticmethod
+    def expression(expression):
+        """Ligne Markdown d'une expression ou phrase clé et de ses compléments"""
+        lines = [f"- **{expression.get('en', '')}** — {expression.get('fr', '')}"]
+        if expression.get("context"):
+            lines.append(f"  *{expression['context']}*")
+        if expression.get("example"):
+            lines.append(f"  Exemple : *{expression['example']}*")
+        if expression.get("variations"):
+            lines.append(f"  Variantes : {', '.join(expression['variations'])}")
+        answers = expression.get("reponses") or ([expression["reponse"]] if expression.get("reponse") else [])
+        if answers:
+            lines.append(f"  Réponses possibles : {' / '.join(answers)}")
+        if expression.get("audio_hint"):
+            lines.append(f"  🔊 {expression['audio_hint']}")
+        return "  \n".join(lines)
+    
+    @staticmethod
+    def structure_part(part):
+        """Bloc Markdown d'une partie de fiche (exemples, conseils ou registres)"""
+        lines = [f"**{part.get('partie') or part.get('etape') or 'Partie'}**"]
+        lines.extend(f"- {example}" for example in part.get("exemples", []))
+        lines.extend(f"- 💡 {tip}" for tip in part.get("conseils", []))
+        for label, key in (("Formel", "formel"), ("Neutre", "neutre"), ("Informel", "informel")):
+            if part.get(key):
+                lines.append(f"- *{label}* : {part[key]}")
+        return "\n".join(lines)
+    
+    @staticmethod
+    def vocabulary(vocab):
+        """Ligne Markdown d'un mot de vocabulaire"""
+        line = f"- **{vocab.get('word', '')}** : {vocab.get('translation', '')}"
+        if vocab.get("example"):
+            line += f"  \n  *Exemple : {vocab['example']}*"
+        return line
+
+# =============================================================================
+# CLASSE : GÉNÉRATEUR D'EXERCICES
+# =============================================================================
+
+class DistractorIndex:
+    """
+    Index de similarité par trigrammes de caractères sur le vocabulaire
+    anglais : les distracteurs d'un QCM sont les entrées à l'orthographe la
+    plus proche de la bonne réponse (tired → tried, tire...), de même longueur
+    en mots, et dont la traduction diffère (pas de synonyme piège).
+    """
+    
+    MAX_POSTING = 500  # Au-delà, un trigramme ne sert plus à trouver des candidats
+    
+    def __init__(self, entries):
+        self.entries = []  # (mot, clé normalisée, traduction normalisée, nb de mots, trigrammes)
+        self.postings = {}
+        for word, translation in entries:
+            key = normalize_key(word)
+            if not key:
+                continue
+            grams = self.trigrams(key)
+            entry_id = len(self.entries)
+            self.entries.append((word, key, normalize_key(translation), len(key.split()), grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(entry_id)
+    
+    @staticmethod
+    def trigrams(key):
+        padded = f"  {key} "
+        return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+    
+    def distractors(self, answer, translation, count=3, seed=0):
+        """Jusqu'à count réponses plausibles mais fausses, les plus proches d'abord"""
+        key, translation_key = normalize_key(answer), normalize_key(translation)
+        grams = self.trigrams(key)
+        words = len(key.split())
+        
+        # Candidats : entrées partageant un trigramme peu fréquent (les
+        # trigrammes courants comme « the » ne discriminent rien et coûtent cher)
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set()
+        for posting in postings:
+            if candidates and len(posting) > self.MAX_POSTING:
+                break
+            candidates.update(posting)
+        
+        def usable(entry):
+            return entry[1] != key and entry[2] != translation_key and abs(entry[3] - words) <= 1
+        
+        def jaccard(entry):
+            common = len(grams & entry[4])
+            return common / (len(grams) + len(entry[4]) - common)
+        
+        ranked = sorted(
+            (-jaccard(self.entries[entry_id]), self.entries[entry_id][1], entry_id)
+            for entry_id in candidates if usable(self.entries[entry_id])
+        )
+        chosen, seen = [], set()
+        for _, entry_key, entry_id in ranked:
+            if entry_key not in seen:
+                seen.add(entry_key)
+                chosen.append(self.entries[entry_id][0])
+            if len(chosen) == count:
+                return chosen
+        
+        # Pas assez de voisins : complété par des entrées du même type, tirage stable
+        rng = random.Random(seed)
+        others = [entry for entry in self.entries if usable(entry) and entry[1] not in seen]
+        for entry in rng.sample(others, min(len(others), count - len(chosen))):
+            chosen.append(entry[0])
+        return chosen
+
+# Index du processus de génération (construit une fois par processus du pool)
+_distractor_index = None
+
+def init_exercise_worker(entries):
+    """Initialisation d'un processus du pool : index des distracteurs"""
+    global _distractor_index
+    _distractor_index = DistractorIndex(entries)
+
+def generate_item_exercises(job):
+    """Tâche du pool de processus : (clé, élément) → (clé, exercices générés)"""
+    key, item = job
+    return key, ExerciseGenerator(_distractor_index).exercises_for(item, seed=key)
+
+class ExerciseGenerator:
+    """
+    Transforme le vocabulaire (avec exemple), les expressions et les
+    phrases clés en exercices « trous » et « qcm » au format de data.json
+    """
+    
+    VERSION = 1  # À incrémenter quand les règles changent : invalide le cache
+    MIN_BLANK_LENGTH = 3
+    
+    def __init__(self, distractor_index):
+        self.index = distractor_index
+    
+    def exercises_for(self, item, seed=""):
+        """Exercices générés pour une leçon, un chapitre ou une fiche (ordre stable)"""
+        exercises = []
+        for vocab in item.get("vocabulaire", []):
+            if vocab.get("word") and vocab.get("translation"):
+                exercises.extend(self.from_vocabulary(vocab, f"{seed}/{vocab['word']}"))
+        for key in ("expressions", "phrases_cles"):
+            for expression in item.get(key, []):
+                if expression.get("en") and expression.get("fr"):
+                    exercises.extend(self.from_expression(expression, f"{seed}/{expression['en']}"))
+        return exercises
+    
+    def qcm(self, question, answer, translation, feedback, seed):
+        options = [answer] + self.index.distractors(answer, translation, seed=seed)
+        if len(options) < 2:
+            return None
+        random.Random(seed).shuffle(options)
+        return {"type": "qcm", "question": question, "options": options,
+                "answer": options.index(answer), "feedback": feedback}
+    
+    @staticmethod
+    def blank(sentence, word):
+        """Phrase avec word remplacé par ___ (None si word n'y figure pas en entier)"""
+        pattern = re.compile(rf"(?<![\w']){re.escape(word)}(?![\w'])", re.IGNORECASE)
+        match = pattern.search(sentence)
+        if not match:
+            return None, None
+        return f"{sentence[:match.start()]}___{sentence[match.end():]}", match.group(0)
+    
+    def from_vocabulary(self, vocab, seed):
+        word, translation = vocab["word"], vocab["translation"]
+        exercises = []
+        question, answer = self.blank(vocab.get("example", ""), word)
+        if question:
+            exercises.append({"type": "trous", "question": question, "answer": answer,
+                              "feedback": f"{word} : {translation}"})
+        qcm = self.qcm(f"Comment dit-on « {translation} » en anglais ?", word, translation,
+                       f"{word} = {translation}", seed)
+        if qcm:
+            exercises.append(qcm)
+        return exercises
+    
+    def from_expression(self, expression, seed):
+        en, fr = expression["en"], expression["fr"]
+        exercises = []
+        qcm = self.qcm(f"Comment dit-on « {fr} » en anglais ?", en, fr,
+                       expression.get("context", "") or f"{en} = {fr}", seed)
+        if qcm:
+            exercises.append(qcm)
+        # Trou sur le mot le plus long (le plus porteur de sens)
+        words = [word for word in re.findall(r"[A-Za-z]+(?:'[A-Za-z]+)*", en)
+                 if len(word) >= self.MIN_BLANK_LENGTH and word.lower() not in SearchIndex.STOP_WORDS]
+        if len(words) > 1 or (words and len(en.split()) > 1):
+            question, answer = self.blank(en, max(words, key=len))
+            if question:
+                exercises.append({"type": "trous", "question": f"{question} ({fr})", "answer": answer,
+                                  "feedback": f"{en} = {fr}"})
+        return exercises
+
+class ExerciseBank:
+    """
+    Exercices générés, construits hors des passages de Streamlit (tâche de
+    fond ou manage.py) et mis en cache dans un fichier JSON associé à la
+    version du contenu : un passage ne fait qu'une recherche dans un dictionnaire.
+    """
+    
+    def __init__(self, path=GENERATED_EXERCISES_FILE):
+        self.path = Path(path)
+        self.signature = None
+        self.version = None
+        self.items = {}
+    
+    @staticmethod
+    def cache_key(version):
+        return f"{version}-v{ExerciseGenerator.VERSION}"
+    
+    @staticmethod
+    def item_key(book_key, item):
+        return f"{book_key}/{item.get('id')}"
+    
+    def refresh(self):
+        """Relit le fichier s'il a changé sur le disque"""
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return
+        if (stat.st_mtime_ns, stat.st_size) == self.signature:
+            return
+        try:
+            cache = json.loads(self.path.read_bytes().decode('utf-8'))
+        except (OSError, ValueError):
+            return  # Fichier en cours de remplacement ou abîmé : on garde l'actuel
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.version, self.items = cache.get("version"), cache.get("items", {})
+    
+    def is_current(self, version):
+        """Vrai si le cache correspond à cette version du contenu"""
+        self.refresh()
+        return self.version == self.cache_key(version)
+    
+    def get(self, book_key, item):
+        """Exercices générés d'un élément (vérifier is_current avant)"""
+        return self.items.get(self.item_key(book_key, item), [])
+    
+    def build(self, data, version, workers=None):
+        """
+        Génère les exercices de tous les éléments sur un pool de processus
+        (l'index des distracteurs est construit une fois par processus) puis
+        écrit le cache de façon atomique. Ne fait rien si le cache est à jour.
+        workers=1 : génération dans le thread appelant (pas de fork du serveur).
+        Retourne le nombre d'exercices générés (None si déjà à jour).
+        """
+        if self.is_current(version):
+            return None
+        vocabulary = VocabularyLookup(data)
+        entries = [(entry["word"], entry["translation"]) for entry in vocabulary.entries.values()]
+        jobs = [
+            (self.item_key(book_key, item), item)
+            for book_key, book in data.get("books", {}).items()
+            for content_key in ContentImporter.CONTENT_KEYS
+            for item in book.get(content_key, [])
+        ]
+        if workers == 1:
+            generator = ExerciseGenerator(DistractorIndex(entries))
+            items = {key: generator.exercises_for(item, seed=key) for key, item in jobs}
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_exercise_worker,
+                                     initargs=(entries,)) as executor:
+                items = dict(executor.map(generate_item_exercises, jobs, chunksize=16))
+        atomic_write_json(self.path, {"version": self.cache_key(version), "items": items})
+        self.refresh()
+        return sum(len(exercises) for exercises in items.values())
+
+@st.cache_resource
+def get_exercise_bank():
+    """Exercices générés partagés par toutes les sessions du processus"""
+    return ExerciseBank()
+
+# =============================================================================
+# CLASSE : COMPARAISON TOLÉRANTE DES RÉPONSES
+# =============================================================================
+
+def bounded_edit_distance(a, b, max_distance):
+    """
+    Distance de Levenshtein entre a et b, ou max_distance + 1 dès qu'elle est
+    dépassée. Algorithme bit-parallèle de Myers/Hyyrö : une colonne de la
+    matrice par caractère de b, codée dans des entiers (a sert de motif).
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    
+    # Le début et la fin communs ne changent pas la distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return max(len(a), len(b))
+    
+    match = {}
+    for i, char in enumerate(a):
+        match[char] = match.get(char, 0) | (1 << i)
+    mask = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    plus, minus, score = mask, 0, len(a)
+    
+    for j, char in enumerate(b):
+        eq = match.get(char, 0)
+        vertical = eq | minus
+        horizontal = (((eq & plus) + plus) ^ plus) | eq
+        h_plus = minus | (~(horizontal | plus) & mask)
+        h_minus = plus & horizontal
+        if h_plus & last:
+            score += 1
+        elif h_minus & last:
+            score -= 1
+        h_plus = (h_plus << 1) | 1
+        h_minus <<= 1
+        plus = (h_minus | ~(vertical | h_plus)) & mask
+        minus = h_plus & vertical
+        # Coupure : chaque caractère restant réduit la distance d'au plus 1
+        if score - (len(b) - j - 1) > max_distance:
+            return max_distance + 1
+    
+    return score
+
+class AnswerMatcher:
+    """
+    Réponses acceptées d'un exercice, classées exact / near_miss / wrong.
+    Les réponses de rejected (la phrase fautive d'une correction recopiée
+    telle quelle) sont toujours fausses, même à une lettre près. Seules les
+    réponses de longueur compatible sont vérifiées par la distance
+    d'édition ; quand elles sont nombreuses, un index de suppressions
+    (toutes les variantes à 1 ou 2 lettres en moins) filtre d'abord les
+    candidates.
+    """
+    
+    EXACT = "exact"
+    NEAR_MISS = "near_miss"
+    WRONG = "wrong"
+    SCAN_LIMIT = 16  # Au-delà, on passe par l'index de suppressions
+    
+    def __init__(self, answers, rejected=()):
+        self.rejected = {self.normalize(answer) for answer in rejected}
+        self.answers = {self.normalize(answer) for answer in answers} - self.rejected
+        self.answers.discard("")
+        self.max_distance = max((self.tolerance(answer) for answer in self.answers), default=0)
+        self.by_length = {}
+        for answer in self.answers:
+            self.by_length.setdefault(len(answer), []).append(answer)
+        self.deletions = {}
+        if len(self.answers) > self.SCAN_LIMIT:
+            for answer in self.answers:
+                for variant in self.variants(answer, self.tolerance(answer)):
+                    self.deletions.setdefault(variant, set()).add(answer)
+    
+    @staticmethod
+    def normalize(answer):
+        return " ".join(str(answer).lower().split())
+    
+    @staticmethod
+    def tolerance(answer):
+        """Fautes de frappe tolérées : aucune pour les mots courts"""
+        if len(answer) <= 3:
+            return 0
+        return 1 if len(answer) <= 8 else 2
+    
+    @staticmethod
+    def variants(text, distance):
+        """text et toutes ses variantes avec jusqu'à distance lettres supprimées"""
+        found = {text}
+        frontier = {text}
+        for _ in range(distance):
+            frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+            found |= frontier
+        return found
+    
+    def classify(self, given):
+        """Classe une réponse : exact, near_miss (faute de frappe) ou wrong"""
+        given = self.normalize(given)
+        if given in self.rejected:
+            return self.WRONG
+        if given in self.answers:
+            return self.EXACT
+        if not given or not self.max_distance:
+            return self.WRONG
+        
+        candidates = [
+            answer
+            for length in range(len(given) - self.max_distance, len(given) + self.max_distance + 1)
+            for answer in self.by_length.get(length, ())
+        ]
+        if len(candidates) > self.SCAN_LIMIT:
+            candidates = {
+                answer
+                for variant in self.variants(given, self.max_distance)
+                for answer in self.deletions.get(variant, ())
+            }
+        
+        for answer in candidates:
+            limit = self.tolerance(answer)
+            if bounded_edit_distance(answer, given, limit) <= limit:
+                return self.NEAR_MISS
+        return self.WRONG
+    
+    def classify_many(self, answers):
+        """Correction groupée de plusieurs saisies pour le même exercice"""
+        return [self.classify(given) for given in answers]
 
-st.set_page_config(
-    page_title=APP_TITLE,
-    page_icon="🇬🇧",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+@functools.lru_cache(maxsize=4096)
+def answer_matcher(answers, rejected=()):
+    """Comparateur d'un exercice (tuples des réponses acceptées et refusées), construit une fois"""
+    return AnswerMatcher(answers, rejected)
 
 # =============================================================================
-# CLASSE : GESTIONNAIRE DE BASE DE DONNÉES
+# CLASSE : CORRECTEUR ORTHOGRAPHIQUE
 # =============================================================================
 
-class DatabaseManager:
-    """Gère toutes les opérations de base de données"""
+class SpellingIndex:
+    """
+    Correcteur orthographique hors ligne (méthode SymSpell) : chaque mot du
+    dictionnaire est indexé sous toutes ses variantes à 1 ou 2 lettres
+    supprimées. Une faute de frappe partage une variante avec le bon mot,
+    la recherche se résume donc à quelques recherches dichotomiques.
     
-    def __init__(self, db_path):
-        self.db_path = db_path
-        self.conn = None
-        self.init_database()
+    L'index est sérialisé dans un fichier binaire (table de hachage triée)
+    ouvert en mmap : chargement instantané, et les pages sont partagées par
+    tous les processus du serveur via le cache du système. Un seul index
+    est ouvert par fichier : load() réutilise celui en service si le
+    dictionnaire n'a pas changé, sinon ferme l'ancien (une session qui le
+    tenait encore obtient une vérification vide plutôt qu'une erreur).
+    """
     
-    def init_database(self):
-        """Initialise la base de données avec les tables nécessaires"""
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        cur = self.conn.cursor()
-        
-        # Table des utilisateurs
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                created_at TEXT,
-                current_level TEXT DEFAULT 'A1'
-            )
-        """)
-        
-        # Table de progression
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS progress (
-                username TEXT,
-                book_key TEXT,
-                lesson_id INTEGER,
-                completed_at TEXT,
-                score INTEGER,
-                PRIMARY KEY (username, book_key, lesson_id)
-            )
-        """)
+    MAGIC = b"SPELLIX1"
+    HEADER = struct.Struct("<8s16sIII")  # magic, signature, distance, mots, entrées
+    MAX_DISTANCE = 2
+    WORD_RE = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)*")
+    SUFFIXES = (
+        ("'s", ""), ("ies", "y"), ("ied", "y"), ("ier", "y"), ("iest", "y"),
+        ("es", ""), ("s", ""), ("ed", ""), ("ed", "e"), ("ing", ""), ("ing", "e"),
+        ("er", ""), ("er", "e"), ("est", ""), ("est", "e"), ("ly", ""), ("ily", "y"),
+    )
+    _open = {}  # chemin absolu -> index en service
+    _open_lock = threading.Lock()
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()  # close() attend la fin des vérifications en cours
+        self.file = open(self.path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = view = memoryview(self.map)
+        _, self.signature, self.max_distance, words, entries = self.HEADER.unpack_from(view)
+        offset = self.HEADER.size
+        self.hashes = view[offset:offset + 4 * entries].cast("I")
+        offset += 4 * entries
+        self.word_ids = view[offset:offset + 4 * entries].cast("I")
+        offset += 4 * entries
+        self.offsets = view[offset:offset + 4 * (words + 1)].cast("I")
+        offset += 4 * (words + 1)
+        self.blob = view[offset:]
+    
+    @property
+    def closed(self):
+        return self.map is None
+    
+    def close(self):
+        """Libère les vues, le mmap et le descripteur de fichier (sans effet si déjà fermé)"""
+        with self.lock:
+            if self.map is None:
+                return
+            for view in (self.hashes, self.word_ids, self.offsets, self.blob, self.view):
+                view.release()
+            self.map.close()
+            self.file.close()
+            self.map = None
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    @staticmethod
+    def key(text):
+        return zlib.crc32(text.encode("utf-8"))
+    
+    @classmethod
+    def dictionary_words(cls, words_file, data):
+        """Mots de la liste fournie puis ceux du vocabulaire et des expressions"""
+        words = {}
+        if Path(words_file).exists():
+            for line in Path(words_file).read_text(encoding="utf-8").splitlines():
+                if line and not line.startswith("#"):
+                    words.setdefault(line.strip().lower(), None)
+        for book in data.get("books", {}).values():
+            for content_key in ContentImporter.CONTENT_KEYS:
+                for item in book.get(content_key, []):
+                    for word, _, example in VocabularyLookup.item_pairs(item):
+                        for token in cls.WORD_RE.findall(f"{word} {example}"):
+                            words.setdefault(token.lower(), None)
+        return list(words)
+    
+    @classmethod
+    def build(cls, words, path, max_distance=MAX_DISTANCE):
+        """Construit l'index et l'écrit de façon atomique (fichier temporaire + renommage)"""
+        signature = hashlib.blake2b("\n".join(words).encode("utf-8"), digest_size=16).digest()
+        entries = set()
+        for word_id, word in enumerate(words):
+            for variant in AnswerMatcher.variants(word, max_distance):
+                entries.add((cls.key(variant), word_id))
+        entries = sorted(entries)
         
-        # Table SRS (Spaced Repetition System)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS srs_cards (
-                username TEXT,
-                front TEXT,
-                back TEXT,
-                interval REAL DEFAULT 1,
-                easiness REAL DEFAULT 2.5,
-                repetitions INTEGER DEFAULT 0,
-                next_review TEXT,
-                last_review TEXT,
-                PRIMARY KEY (username, front)
-            )
-        """)
+        encoded = [word.encode("utf-8") for word in words]
+        offsets = array("I", [0])
+        for word in encoded:
+            offsets.append(offsets[-1] + len(word))
         
-        self.conn.commit()
+        path = Path(path)
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}-", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, signature, max_distance, len(words), len(entries)))
+                f.write(array("I", (entry[0] for entry in entries)).tobytes())
+                f.write(array("I", (entry[1] for entry in entries)).tobytes())
+                f.write(offsets.tobytes())
+                f.write(b"".join(encoded))
+            os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+        return signature
     
-    def create_user(self, username):
-        """Crée un nouvel utilisateur"""
-        cur = self.conn.cursor()
-        cur.execute(
-            "INSERT OR IGNORE INTO users (username, created_at) VALUES (?, ?)",
-            (username, datetime.now().isoformat())
-        )
-        self.conn.commit()
+    @classmethod
+    def load(cls, data, words_file=SPELLING_WORDS_FILE, index_file=SPELLING_INDEX_FILE):
+        """Ouvre l'index sur disque, reconstruit s'il ne correspond plus au dictionnaire"""
+        words = cls.dictionary_words(words_file, data)
+        signature = hashlib.blake2b("\n".join(words).encode("utf-8"), digest_size=16).digest()
+        try:
+            with open(index_file, "rb") as f:
+                header = f.read(cls.HEADER.size)
+            current = len(header) == cls.HEADER.size and cls.HEADER.unpack(header)[:2] == (cls.MAGIC, signature)
+        except OSError:
+            current = False
+        key = Path(index_file).resolve()
+        with cls._open_lock:
+            previous = cls._open.get(key)
+            if previous is not None and not previous.closed and previous.signature == signature:
+                return previous
+            if not current:
+                cls.build(words, index_file)
+            index = cls._open[key] = cls(index_file)
+        if previous is not None:
+            previous.close()
+        return index
     
-    def mark_lesson_complete(self, username, book_key, lesson_id, score=0):
-        """Marque une leçon comme complétée"""
-        cur = self.conn.cursor()
-        cur.execute("""
-            INSERT OR REPLACE INTO progress 
-            (username, book_key, lesson_id, completed_at, score)
-            VALUES (?, ?, ?, ?, ?)
-        """, (username, book_key, lesson_id, datetime.now().isoformat(), score))
-        self.conn.commit()
+    def word(self, word_id):
+        return bytes(self.blob[self.offsets[word_id]:self.offsets[word_id + 1]]).decode("utf-8")
     
-    def is_lesson_completed(self, username, book_key, lesson_id):
-        """Vérifie si une leçon est complétée"""
-        cur = self.conn.cursor()
-        cur.execute("""
-            SELECT 1 FROM progress 
-            WHERE username=? AND book_key=? AND lesson_id=?
-        """, (username, book_key, lesson_id))
-        return cur.fetchone() is not None
+    def _ids(self, variant):
+        key = self.key(variant)
+        position = bisect.bisect_left(self.hashes, key)
+        while position < len(self.hashes) and self.hashes[position] == key:
+            yield self.word_ids[position]
+            position += 1
     
-    def get_user_stats(self, username):
-        """Récupère les statistiques de l'utilisateur"""
-        cur = self.conn.cursor()
-        cur.execute(
-            "SELECT COUNT(*) FROM progress WHERE username=?",
-            (username,)
-        )
-        completed = cur.fetchone()[0]
-        return {"completed_lessons": completed}
+    def contains(self, word):
+        """Le mot exact est-il dans le dictionnaire ?"""
+        return any(self.word(word_id) == word for word_id in self._ids(word))
     
-    def get_due_cards(self, username):
-        """Récupère les cartes SRS à réviser aujourd'hui"""
-        cur = self.conn.cursor()
-        today = datetime.now().date().isoformat()
-        cur.execute("""
-            SELECT front, back, interval, easiness, repetitions 
-            FROM srs_cards 
-            WHERE username=? AND (next_review IS NULL OR next_review <= ?)
-        """, (username, today))
-        
-        cards = []
-        for row in cur.fetchall():
-            cards.append({
-                "front": row[0],
-                "back": row[1],
-                "interval": row[2],
-                "easiness": row[3],
-                "repetitions": row[4]
-            })
-        return cards
+    def known(self, word):
+        """Mot connu, directement ou par une forme fléchie régulière (plurals, -ed, -ing...)"""
+        word = word.lower()
+        if self.contains(word):
+            return True
+        for suffix, replacement in self.SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+                stem = word[:-len(suffix)] + replacement
+                if self.contains(stem):
+                    return True
+                # Consonne doublée : running → run, stopped → stop
+                if (suffix in ("ed", "ing", "er", "est") and len(stem) >= 3
+                        and stem[-1] == stem[-2] and stem[-1] not in "aeiouhkwxy"):
+                    if self.contains(stem[:-1]):
+                        return True
+        return False
     
-    def add_srs_card(self, username, front, back):
-        """Ajoute une nouvelle carte SRS"""
-        cur = self.conn.cursor()
-        next_review = (datetime.now() + timedelta(days=1)).date().isoformat()
-        cur.execute("""
-            INSERT OR REPLACE INTO srs_cards 
-            (username, front, back, next_review, last_review)
-            VALUES (?, ?, ?, ?, ?)
-        """, (username, front, back, next_review, datetime.now().isoformat()))
-        self.conn.commit()
+    @staticmethod
+    def transposed(a, b):
+        """b est-il a avec deux lettres voisines inversées (« teh » pour « the ») ?"""
+        if len(a) != len(b):
+            return False
+        diff = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
     
-    def update_srs_card(self, username, front, quality):
+    def suggest(self, word, limit=3):
         """
-        Met à jour une carte SRS après révision
-        quality: 0-5 (0=échec total, 5=parfait)
-        Utilise l'algorithme SM-2
+        Mots du dictionnaire les plus proches (distance, puis fréquence).
+        Une inversion de deux lettres voisines compte pour une seule faute.
         """
-        cur = self.conn.cursor()
-        cur.execute("""
-            SELECT interval, easiness, repetitions 
-            FROM srs_cards WHERE username=? AND front=?
-        """, (username, front))
-        
-        row = cur.fetchone()
-        if not row:
-            return
-        
-        interval, easiness, reps = row
-        
-        # Calcul du nouveau facteur d'aisance (SM-2)
-        easiness = max(1.3, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
-        
-        # Si la réponse est incorrecte (quality < 3)
-        if quality < 3:
-            reps = 0
-            interval = 1
-        else:
-            reps += 1
-            if reps == 1:
-                interval = 1
-            elif reps == 2:
-                interval = 6
-            else:
-                interval = math.ceil(interval * easiness)
-        
-        # Calculer la prochaine date de révision
-        next_review = (datetime.now() + timedelta(days=interval)).date().isoformat()
-        
-        cur.execute("""
-            UPDATE srs_cards 
-            SET interval=?, easiness=?, repetitions=?, 
-                next_review=?, last_review=?
-            WHERE username=? AND front=?
-        """, (interval, easiness, reps, next_review, datetime.now().isoformat(), username, front))
-        
-        self.conn.commit()
+        word = word.lower()
+        distance = 1 if len(word) <= 4 else self.max_distance
+        found = {}
+        for variant in AnswerMatcher.variants(word, distance):
+            for word_id in self._ids(variant):
+                if word_id in found:
+                    continue
+                candidate = self.word(word_id)
+                gap = 1 if self.transposed(candidate, word) else bounded_edit_distance(candidate, word, distance)
+                found[word_id] = (gap, word_id, candidate)
+        ranked = sorted(match for match in found.values() if match[0] <= distance)
+        return [candidate for _, _, candidate in ranked[:limit]]
+    
+    def check(self, text, limit=3):
+        """
+        Mots mal orthographiés d'un texte : liste de (mot, suggestions).
+        Les mots de moins de 3 lettres et les noms propres (majuscule) sont ignorés.
+        Un index fermé (remplacé par une nouvelle version) ne signale rien.
+        """
+        with self.lock:
+            if self.map is None:
+                return []
+            return self._check(text, limit)
+    
+    def _check(self, text, limit):
+        misspelled = []
+        for match in self.WORD_RE.finditer(text):
+            token = match.group()
+            if len(token) < 3 or self.known(token):
+                continue
+            before = text[:match.start()].rstrip()
+            if token[0].isupper() and before and before[-1] not in ".!?":
+                continue
+            misspelled.append((token, self.suggest(token)))
+            if len(misspelled) >= limit:
+                break
+        return misspelled
 
 # =============================================================================
-# CLASSE : GESTIONNAIRE DE DONNÉES
+# CLASSE : CORRECTION DES TESTS
 # =============================================================================
 
-class DataManager:
-    """Gère le chargement et la sauvegarde des données JSON"""
+class TestGrader:
+    """
+    Correction groupée des tests de niveau : les réponses acceptées de chaque
+    question sont précompilées en comparateurs (une fois par version du
+    contenu), la correction d'un test entier ne reconstruit rien.
+    """
     
-    def __init__(self, data_file):
-        self.data_file = data_file
-        self.data = self.load_data()
+    def __init__(self, data):
+        self.matchers = {}
+        for level, test in data.get("tests", {}).items():
+            self.matchers[level] = [
+                AnswerMatcher([question["answer"], *question.get("alternatives", [])])
+                for question in test.get("questions", [])
+            ]
     
-    def load_data(self):
-        """Charge les données depuis le fichier JSON"""
-        if not self.data_file.exists():
-            return self.create_default_data()
-        
+    def grade(self, level, answers):
+        """
+        Corrige toutes les réponses d'un test.
+        Retourne une liste de verdicts : exact, near_miss ou wrong
+        (seul exact compte dans le score, near_miss n'est qu'un indice)
+        """
+        return [
+            matcher.classify(given)
+            for given, matcher in zip(answers, self.matchers.get(level, []))
+        ]
+
+# =============================================================================
+# CLASSE : ANALYSE LINGUISTIQUE (NLTK)
+# =============================================================================
+
+class NlpAnalyzer:
+    """
+    Niveau d'analyse optionnel basé sur nltk : tokenisation et étiquetage
+    grammatical hors ligne (modèle averaged_perceptron_tagger), pour des
+    vérifications plus fines comme l'accord sujet-verbe du présent simple.
+    
+    Rien n'est chargé à l'import : le modèle est chargé à la première
+    production libre, dans un thread du pool, et partagé par toutes les
+    sessions. Le script Streamlit n'attend jamais plus de NLP_TIMEOUT
+    secondes ; au-delà, l'analyse se termine en arrière-plan et son résultat
+    est en cache pour l'affichage suivant.
+    """
+    
+    RESOURCE = "taggers/averaged_perceptron_tagger"
+    SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+    THIRD_PERSON = {"he", "she", "it"}
+    OTHER_PERSONS = {"i", "you", "we", "they"}
+    IRREGULAR = {"be": "is", "have": "has", "do": "does", "go": "goes"}
+    
+    def __init__(self, workers=NLP_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nlp")
+        self.lock = threading.Lock()
+        self.pending = {}  # texte -> Future de l'analyse en cours
+        self.tagger = None
+        self.tokenizer = None
+        self._available = None
+        self.analyze_sentence = functools.lru_cache(maxsize=NLP_CACHE_SIZE)(self._analyze_sentence)
+    
+    def available(self):
+        """Le modèle d'étiquetage est-il installé ? (vérifié une fois, sans le charger)"""
+        if self._available is None:
+            try:
+                import nltk
+                nltk.data.find(self.RESOURCE)
+                self._available = True
+            except (ImportError, LookupError):
+                self._available = False
+        return self._available
+    
+    def _load(self):
+        with self.lock:
+            if self.tagger is None:
+                from nltk.tag.perceptron import PerceptronTagger
+                from nltk.tokenize import TreebankWordTokenizer
+                self.tokenizer = TreebankWordTokenizer()
+                self.tagger = PerceptronTagger()
+    
+    def warm_up(self):
+        """Lance le chargement du modèle en arrière-plan (sans attendre)"""
+        if self.available() and self.tagger is None:
+            self.executor.submit(self._load)
+    
+    def submit(self, text):
+        """Analyse un texte sur le pool (une seule analyse en cours par texte)"""
+        with self.lock:
+            future = self.pending.get(text)
+            if future is None:
+                future = self.executor.submit(self._analyze, text)
+                self.pending[text] = future
+                future.add_done_callback(lambda _: self.pending.pop(text, None))
+        return future
+    
+    def hints(self, text, timeout=NLP_TIMEOUT):
+        """
+        Suggestions pour un texte, ou None si l'analyse n'est pas prête dans
+        le délai (liste vide si nltk ou son modèle ne sont pas installés)
+        """
+        if not self.available() or not text.strip():
+            return []
         try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            st.error(f"❌ Erreur lors du chargement de {self.data_file}: {e}")
-            return self.create_default_data()
+            return self.submit(text).result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
     
-    def create_default_data(self):
-        """Crée une structure de données par défaut"""
-        default_data = {
-            "meta": {
-                "version": "2.0",
-                "created": datetime.now().isoformat()
-            },
-            "books": {
-                "40_lecons": {"title": "40 Leçons", "lessons": []},
-                "800_expressions": {"title": "800 Expressions", "chapters": []},
-                "etre_pro": {"title": "Être Pro", "fiches": []}
-            },
-            "srs_cards": [],
-            "tests": {}
-        }
-        self.save_data(default_data)
-        return default_data
+    def _analyze(self, text):
+        self._load()
+        hints = []
+        for sentence in self.SENTENCE_RE.split(text.strip()):
+            for hint in self.analyze_sentence(sentence):
+                if hint not in hints:
+                    hints.append(hint)
+        return hints
     
-    def save_data(self, data):
-        """Sauvegarde les données dans le fichier JSON"""
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def _analyze_sentence(self, sentence):
+        tagged = self.tagger.tag(self.tokenizer.tokenize(sentence))
+        hints = []
+        for (subject, _), (verb, tag) in zip(tagged, tagged[1:]):
+            if subject.lower() in self.THIRD_PERSON and tag in ("VBP", "VB"):
+                hints.append(
+                    f"🧩 Accord sujet-verbe : « {subject} {verb} » → « {subject} {self.third_person(verb)} » "
+                    "(-s à la 3e personne du singulier au présent simple)"
+                )
+            elif subject.lower() in self.OTHER_PERSONS and tag == "VBZ":
+                hints.append(
+                    f"🧩 Accord sujet-verbe : « {subject} {verb} » → « {subject} {self.base_form(verb, subject)} » "
+                    "(pas de -s après I, you, we, they)"
+                )
+        # Après does / doesn't, le verbe reste à la base verbale
+        for index, (word, _) in enumerate(tagged):
+            if word.lower() not in ("does", "do", "did"):
+                continue
+            following = tagged[index + 1:index + 3]
+            if following and following[0][0].lower() in ("n't", "not"):
+                following = following[1:]
+            if following and following[0][1] == "VBZ" and following[0][0].lower() not in ("is", "has"):
+                verb = following[0][0]
+                hints.append(
+                    f"🧩 Après « {word} », pas de -s : « {verb} » → « {self.base_form(verb)} »"
+                )
+        return tuple(hints)
     
-    def get_total_lessons_count(self):
-        """Compte le nombre total de leçons"""
-        total = 0
-        for book in self.data["books"].values():
-            for key, value in book.items():
-                if isinstance(value, list):
-                    total += len(value)
-        return total
+    @classmethod
+    def third_person(cls, verb):
+        """Forme de la 3e personne du singulier au présent simple"""
+        lower = verb.lower()
+        if lower in cls.IRREGULAR:
+            return cls.IRREGULAR[lower]
+        if lower.endswith(("s", "sh", "ch", "x", "z", "o")):
+            return verb + "es"
+        if len(lower) > 1 and lower.endswith("y") and lower[-2] not in "aeiou":
+            return verb[:-1] + "ies"
+        return verb + "s"
+    
+    @staticmethod
+    def base_form(verb, subject=""):
+        """Base verbale d'une forme en -s (is → am/are, has → have)"""
+        lower = verb.lower()
+        if lower == "is":
+            return "am" if subject.lower() == "i" else "are"
+        if lower == "has":
+            return "have"
+        if lower == "does":
+            return "do"
+        if lower.endswith("ies"):
+            return verb[:-3] + "y"
+        if lower.endswith(("sses", "shes", "ches", "xes", "zes", "oes")):
+            return verb[:-2]
+        return verb[:-1] if lower.endswith("s") else verb
+
+@st.cache_resource
+def get_nlp_analyzer():
+    """Analyseur nltk partagé par toutes les sessions (modèle chargé à la demande)"""
+    return NlpAnalyzer()
 
 # =============================================================================
 # CLASSE : ANALYSEUR GRAMMATICAL
 # =============================================================================
 
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
 class GrammarAnalyzer:
-    """Analyse simple de grammaire pour feedback"""
+    """
+    Analyse simple de grammaire pour feedback.
+    Les résultats sont mémorisés pour tout le processus (cache LRU borné,
+    thread-safe) : une phrase déjà analysée, même par un autre apprenant,
+    ne repasse pas dans les règles. La clé retient la signature de l'index
+    d'orthographe et non l'index lui-même : les entrées restent valables
+    quand le même vocabulaire est rechargé, et un index fermé n'est pas
+    gardé en mémoire par le cache.
+    """
+    
+    RULES_VERSION = 2  # À incrémenter à chaque modification des règles
+    _cache = {}  # (version des règles, signature de l'orthographe, texte) -> indices
+    _cache_lock = threading.Lock()
+    _hits = _misses = 0
+    
+    @staticmethod
+    def normalize(text):
+        """Clé du cache : espaces superflus retirés (la casse compte pour les règles)"""
+        return " ".join(str(text).split())
+    
+    @classmethod
+    def analyze(cls, text, speller=None):
+        """Analyse un texte (et son orthographe si un SpellingIndex est fourni)"""
+        text = cls.normalize(text)
+        key = (cls.RULES_VERSION, speller.signature if speller is not None else None, text)
+        with cls._cache_lock:
+            hints = cls._cache.pop(key, None)
+            if hints is not None:
+                cls._cache[key] = hints  # Ordre d'insertion : le dernier est le plus récent
+                cls._hits += 1
+                return list(hints)
+            cls._misses += 1
+        
+        hints = cls._analysis(text, speller)
+        if speller is not None and speller.closed:
+            return list(hints)  # Index remplacé pendant l'analyse : orthographe non vérifiée
+        with cls._cache_lock:
+            cls._cache[key] = hints
+            while len(cls._cache) > GRAMMAR_CACHE_SIZE:
+                del cls._cache[next(iter(cls._cache))]
+        return list(hints)
+    
+    @classmethod
+    def cache_info(cls):
+        """Statistiques du cache : hits, misses, maxsize, currsize"""
+        with cls._cache_lock:
+            return CacheInfo(cls._hits, cls._misses, GRAMMAR_CACHE_SIZE, len(cls._cache))
+    
+    @staticmethod
+    def _analysis(text, speller):
+        hints = GrammarAnalyzer.apply_rules(text)
+        if speller is not None:
+            for word, suggestions in speller.check(text):
+                if suggestions:
+                    hints.append(f"🔤 Orthographe : « {word} » → « {' / '.join(suggestions)} » ?")
+                else:
+                    hints.append(f"🔤 Mot inconnu : « {word} »")
+        return tuple(hints)
     
     @staticmethod
-    def analyze(text):
-        """Analyse un texte et retourne des suggestions"""
+    def apply_rules(text):
+        """Applique les règles à un texte (sans cache)"""
         hints = []
         
         # Vérification du pluriel avec 'I am a'
@@ -288,6 +4155,134 @@ class GrammarAnalyzer:
         
         return hints
 
+# =============================================================================
+# CLASSE : TÂCHES DE FOND
+# =============================================================================
+
+class BackgroundScheduler:
+    """
+    Tâches périodiques exécutées par un thread du serveur, pour que les
+    passages de Streamlit ne fassent que lire des résultats précalculés :
+    - dans chaque processus : rechargement de data.json, mise à jour de
+      l'index de recherche, préchauffage des index dérivés du contenu et
+      trace des statistiques du cache d'analyse dans le journal ;
+    - dans un seul processus (élu par un verrou sur scheduler.lock) : cartes
+      dues du jour, exercices générés et PRAGMA optimize sur la base partagée.
+    """
+    
+    # Index dérivés du contenu construits dès qu'une nouvelle version arrive
+    WARM_INDEXES = (
+        ("vocabulary", VocabularyLookup),
+        ("fragments", ContentFragments),
+        ("test_grader", TestGrader),
+        ("spelling", SpellingIndex.load),
+        ("recommendations", RecommendationIndex),
+    )
+    
+    def __init__(self, data_manager, search_index, db=None, exercise_bank=None,
+                 lock_file=SCHEDULER_LOCK_FILE, tick=SCHEDULER_TICK):
+        self.data_manager = data_manager
+        self.search_index = search_index
+        self.exercise_bank = exercise_bank
+        self.leader_lock = ProcessLock(lock_file)
+        self.tick = tick
+        self.jobs = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        
+        self.add_job("contenu", tick, self.refresh_content)
+        self.add_job("statistiques", CACHE_STATS_INTERVAL, self.log_cache_stats)
+        if isinstance(db, DatabaseManager):
+            self.add_job("cartes dues", 10 * 60, db.refresh_due_counts, leader_only=True)
+            self.add_job("optimisation", 6 * 3600, db.optimize, leader_only=True)
+        if exercise_bank is not None:
+            self.add_job("exercices", 60, self.build_exercises, leader_only=True)
+    
+    def add_job(self, name, interval, func, leader_only=False):
+        """Ajoute une tâche exécutée toutes les interval secondes"""
+        self.jobs[name] = {
+            "interval": interval,
+            "func": func,
+            "leader_only": leader_only,
+            "next_run": 0,
+            "last_run": None,
+            "last_error": None,
+            "runs": 0,
+        }
+    
+    @property
+    def is_leader(self):
+        return self.leader_lock.fd is not None
+    
+    def refresh_content(self):
+        """Recharge data.json s'il a changé, puis met à jour et préchauffe les index"""
+        self.data_manager.refresh()
+        self.search_index.update(self.data_manager.data, self.data_manager.version)
+        for name, builder in self.WARM_INDEXES:
+            self.data_manager.derived(name, builder)
+    
+    @staticmethod
+    def log_cache_stats():
+        """Trace l'efficacité du cache d'analyse grammaticale (propre au processus)"""
+        info = GrammarAnalyzer.cache_info()
+        logger.info("Cache d'analyse : %d réutilisation(s), %d analyse(s), %d/%d phrase(s)",
+                    info.hits, info.misses, info.currsize, info.maxsize)
+    
+    def build_exercises(self):
+        """Génère les exercices de la version du contenu en service si besoin"""
+        self.exercise_bank.build(self.data_manager.data, self.data_manager.version, workers=1)
+    
+    def run_pending(self):
+        """Exécute les tâches arrivées à échéance (une erreur n'arrête pas les suivantes)"""
+        leader = self.leader_lock.try_acquire()
+        for name, job in self.jobs.items():
+            now = time.monotonic()
+            if (job["leader_only"] and not leader) or now < job["next_run"]:
+                continue
+            try:
+                job["func"]()
+                job["last_error"] = None
+            except Exception as e:
+                job["last_error"] = f"{type(e).__name__}: {e}"
+                logger.exception("Tâche d'arrière-plan « %s » en échec", name)
+            job["runs"] += 1
+            job["last_run"] = epoch_seconds()
+            job["next_run"] = now + job["interval"]
+    
+    def start(self):
+        """
+        Premier passage immédiat (contenu prêt avant le premier affichage)
+        puis thread en arrière-plan
+        """
+        if self.thread is not None:
+            return
+        self.run_pending()
+        self.thread = threading.Thread(target=self._loop, name="background-jobs", daemon=True)
+        self.thread.start()
+    
+    def _loop(self):
+        while not self.stop_event.wait(self.tick):
+            self.run_pending()
+    
+    def stop(self):
+        """Arrête le thread et cède le rôle de meneur à un autre processus"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.leader_lock.release()
+    
+    def status(self):
+        """État des tâches : (nom, exécutions, dernière exécution, dernière erreur)"""
+        return [(name, job["runs"], job["last_run"], job["last_error"]) for name, job in self.jobs.items()]
+
+@st.cache_resource
+def get_background_scheduler():
+    """Planificateur de tâches de fond du processus (démarré une seule fois)"""
+    scheduler = BackgroundScheduler(get_data_manager(), get_search_index(), get_database(), get_exercise_bank())
+    scheduler.start()
+    return scheduler
+
 # =============================================================================
 # INTERFACE UTILISATEUR
 # =============================================================================
@@ -316,7 +4311,29 @@ def render_sidebar(db):
     st.sidebar.markdown("---")
     return username
 
-def render_dashboard(db, data_manager, username):
+def render_search(search_index):
+    """Affiche la recherche plein texte dans la barre latérale"""
+    query = st.sidebar.text_input("🔎 Rechercher", placeholder="Mot, expression...")
+    
+    if not query.strip():
+        return
+    
+    start = time.perf_counter()
+    hits = search_index.search(query)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    if not hits:
+        st.sidebar.info("Aucun résultat.")
+        return
+    
+    st.sidebar.caption(f"{len(hits)} résultat(s) en {elapsed_ms:.1f} ms")
+    for hit in hits:
+        st.sidebar.markdown(f"{hit['kind']} **{hit['title']}**")
+        if hit["text"]:
+            st.sidebar.caption(hit["text"])
+        st.sidebar.caption(f"📍 {hit['where']}")
+
+def render_dashboard(db, data_manager, username, speller=None):
     """Affiche le tableau de bord"""
     st.title("📊 Tableau de Bord")
     
@@ -334,12 +4351,48 @@ def render_dashboard(db, data_manager, username):
         st.metric("📈 Progression", f"{progress_pct:.1f}%")
     
     with col3:
-        due_cards = len(db.get_due_cards(username))
+        due_cards = db.count_due_cards(username)
         st.metric("🔄 Cartes à réviser", due_cards)
     
     # Barre de progression
     st.progress(min(1.0, progress_pct / 100))
     
+    # Série de jours d'activité (leçon complétée ou carte révisée)
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("🔥 Série en cours", f"{stats['streak']} jour(s)")
+    
+    with col2:
+        st.metric("🏆 Meilleure série", f"{stats['best_streak']} jour(s)")
+    
+    with col3:
+        st.metric("⭐ Score moyen", f"{stats['average_score']:.0f}%")
+    
+    if stats["streak"] and not stats["active_today"]:
+        st.info("🔥 Révise une carte ou termine une leçon aujourd'hui pour prolonger ta série !")
+    
+    # Prochaines leçons conseillées (tête de la file précalculée)
+    recommendations = db.get_recommendations(username)
+    if recommendations:
+        st.subheader("🧭 Et maintenant ?")
+        books = data_manager.data["books"]
+        for (book_key, _), title, reason in recommendations:
+            book_title = books.get(book_key, {}).get("title", book_key)
+            if reason == "suite":
+                st.markdown(f"- 📖 **{title}** ({book_title})")
+            else:
+                st.markdown(f"- 🔁 **{title}** ({book_title}) : {reason}")
+    
+    # Charge de révision à venir (simulation SM-2, recalculée seulement si le paquet a changé)
+    reviews = get_forecast_cache().get(db, username)
+    if reviews is not None:
+        st.subheader(f"📅 Révisions prévues ({FORECAST_DAYS} prochains jours)")
+        chart = pd.DataFrame({"Révisions": reviews}, index=pd.date_range(date.today(), periods=FORECAST_DAYS))
+        st.bar_chart(chart)
+        st.caption(f"Pic : {reviews.max()} révision(s) par jour · moyenne : {reviews.mean():.1f} "
+                   f"(si toutes les cartes dues sont révisées chaque jour)")
+    
     st.markdown("---")
     
     # Auto-évaluation CEFR
@@ -375,7 +4428,7 @@ def render_dashboard(db, data_manager, username):
     
     if st.button("✨ Analyser"):
         if sample_text.strip():
-            hints = GrammarAnalyzer.analyze(sample_text)
+            hints = GrammarAnalyzer.analyze(sample_text, speller)
             
             if hints:
                 st.write("**Suggestions :**")
@@ -435,7 +4488,11 @@ def render_exercise(exercise, idx, key_prefix):
     
     return user_answer
 
-def check_exercise(exercise, user_answer):
+def erroneous_sentence(exercise):
+    """Phrase fautive d'un exercice de correction ("Corrige : I ate a orange.")"""
+    return exercise.get("question", "").split(":", 1)[-1].strip()
+
+def check_exercise(exercise, user_answer, speller=None, nlp=None):
     """Vérifie la réponse d'un exercice"""
     
     if exercise["type"] == "qcm":
@@ -449,32 +4506,137 @@ def check_exercise(exercise, user_answer):
         }
     
     elif exercise["type"] in ["trous", "transformation", "correction"]:
-        expected = str(exercise["answer"]).strip().lower()
-        given = str(user_answer).strip().lower()
+        # Réponse attendue et alternatives ; recopier la phrase à corriger est toujours faux
+        rejected = (erroneous_sentence(exercise),) if exercise["type"] == "correction" else ()
+        matcher = answer_matcher((exercise["answer"], *exercise.get("alternatives", [])), rejected)
+        verdict = matcher.classify(user_answer)
         
-        # Vérifier aussi les alternatives si elles existent
-        alternatives = exercise.get("alternatives", [])
-        is_correct = (given == expected) or (given in [alt.strip().lower() for alt in alternatives])
+        # Une faute de frappe n'est tolérée que pour un mot à compléter : dans une
+        # phrase, une lettre d'écart peut être la faute de grammaire ("She work.")
+        tolerant = exercise["type"] == "trous" and len(exercise["answer"].split()) == 1
         
         return {
-            "correct": is_correct,
+            "correct": verdict == AnswerMatcher.EXACT or (verdict == AnswerMatcher.NEAR_MISS and tolerant),
+            "near_miss": verdict == AnswerMatcher.NEAR_MISS,
             "feedback": exercise.get("feedback", ""),
             "expected": exercise["answer"]
         }
     
     elif exercise["type"] == "production":
         # Pour les productions libres, on utilise l'analyseur grammatical
-        hints = GrammarAnalyzer.analyze(user_answer)
+        hints = GrammarAnalyzer.analyze(user_answer, speller)
+        nlp_hints = nlp.hints(user_answer) if nlp else []
         
         return {
             "correct": None,  # Pas de correction auto
             "feedback": exercise.get("feedback", ""),
-            "hints": hints
+            "hints": hints + (nlp_hints or []),
+            "pending": nlp_hints is None  # Analyse nltk pas encore terminée
         }
     
     return {"correct": False, "feedback": "Type d'exercice non reconnu"}
 
-def render_lesson(lesson, book_key, db, username):
+def add_cards_to_srs(db, username, cards):
+    """
+    Ajoute des cartes au SRS en une seule transaction, en ignorant celles
+    que l'utilisateur possède déjà (comparaison sur les clés normalisées).
+    Les quasi-doublons ne sont pas filtrés ici : ils sont repérés à
+    l'import du contenu et par manage.py dedup.
+    Retourne (ajoutées, ignorées).
+    """
+    known = set()
+    for front, back in db.get_srs_keys(username):
+        known.add(normalize_key(front))
+        known.add(normalize_key(back))
+    
+    new_cards = []
+    for card in cards:
+        front_key, back_key = normalize_key(card["front"]), normalize_key(card["back"])
+        if front_key in known or back_key in known:
+            continue
+        known.update((front_key, back_key))
+        new_cards.append(card)
+    
+    added = db.add_srs_cards(username, new_cards) if new_cards else 0
+    return added, len(cards) - added
+
+def render_bulk_srs_button(db, vocabulary, username, item, key):
+    """Bouton « tout ajouter au SRS » pour une leçon ou un chapitre"""
+    cards = vocabulary.cards_for(item)
+    if not cards:
+        return
+    
+    if st.button(f"➕ Ajouter les {len(cards)} mots au SRS", key=key):
+        added, skipped = add_cards_to_srs(db, username, cards)
+        st.success(f"✅ {added} carte(s) ajoutée(s), {skipped} déjà présente(s)")
+
+def render_practice(exercises, key_prefix, speller=None):
+    """
+    Entraînement sur les exercices générés : PRACTICE_SIZE à la fois, une
+    nouvelle série à la demande. Sans effet sur la validation des leçons.
+    """
+    if not exercises:
+        return
+    
+    st.markdown("#### 🎲 Entraînement")
+    series_key = f"practice_{key_prefix}"
+    series = st.session_state.get(series_key, 0) % math.ceil(len(exercises) / PRACTICE_SIZE)
+    start = series * PRACTICE_SIZE
+    batch = exercises[start:start + PRACTICE_SIZE]
+    
+    answers = [
+        (idx, exercise, render_exercise(exercise, idx, f"{key_prefix}_gen{series}"))
+        for idx, exercise in enumerate(batch)
+    ]
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        submitted = st.button("✅ Vérifier", key=f"{series_key}_check")
+    with col2:
+        if len(exercises) > PRACTICE_SIZE and st.button("🔀 Nouvelle série", key=f"{series_key}_next"):
+            st.session_state[series_key] = series + 1
+            st.rerun()
+    
+    if submitted:
+        correct_count = 0
+        for idx, exercise, user_answer in answers:
+            result = check_exercise(exercise, user_answer, speller)
+            if result["correct"]:
+                correct_count += 1
+                st.success(f"✅ Exercice {idx + 1} : Correct ! {result['feedback']}")
+                if result.get("near_miss"):
+                    st.warning(f"✏️ Attention à l'orthographe : **{result['expected']}**")
+            elif result.get("near_miss"):
+                st.warning(f"✏️ Exercice {idx + 1} : presque ! Vérifie l'orthographe : **{result['expected']}**")
+            else:
+                st.error(f"❌ Exercice {idx + 1} : réponse attendue **{result['expected']}**")
+        st.markdown(f"**🎯 {correct_count}/{len(answers)}**")
+
+def render_content_item(item, book_key, db, username, vocabulary, fragments, exercises=None):
+    """Affiche un chapitre ou une fiche à partir de ses fragments mémorisés"""
+    
+    item_id = item.get("id")
+    header, sections = fragments.get(book_key, item)
+    
+    with st.expander(f"📘 {item.get('title', 'Sans titre')}"):
+        if header:
+            st.markdown(header)
+        
+        for title, pages in sections:
+            st.markdown(f"#### {title}")
+            page = 1
+            if len(pages) > 1:
+                # Un seul bloc envoyé au navigateur, même pour un long chapitre
+                page = st.number_input(f"Page (sur {len(pages)})", min_value=1, max_value=len(pages),
+                                       value=1, step=1, key=f"page_{book_key}_{item_id}_{title}")
+            st.markdown(pages[page - 1])
+        
+        render_bulk_srs_button(db, vocabulary, username, item, f"srs_bulk_{book_key}_{item_id}")
+        
+        if exercises is not None:
+            render_practice(exercises.get(book_key, item), f"{book_key}_{item_id}")
+
+def render_lesson(lesson, book_key, db, username, vocabulary, speller=None, nlp=None, exercises=None):
     """Affiche une leçon complète"""
     
     lesson_id = lesson["id"]
@@ -495,37 +4657,41 @@ def render_lesson(lesson, book_key, db, username):
             for obj in lesson["objectifs"]:
                 st.markdown(f"- {obj}")
         
-        # Explications
+        # Explications (Streamlit n'autorise pas les expanders imbriqués)
         if "explications" in lesson:
-            with st.expander("📖 Explications", expanded=True):
-                st.markdown(lesson["explications"])
+            st.markdown("#### 📖 Explications")
+            st.markdown(lesson["explications"])
         
         # Vocabulaire
         if "vocabulaire" in lesson and lesson["vocabulaire"]:
-            with st.expander("📚 Vocabulaire"):
-                for vocab in lesson["vocabulaire"]:
-                    st.markdown(f"- **{vocab['word']}** : {vocab['translation']}")
-                    if "example" in vocab:
-                        st.markdown(f"  *Exemple : {vocab['example']}*")
+            st.markdown("#### 📚 Vocabulaire")
+            for vocab in lesson["vocabulaire"]:
+                st.markdown(f"- **{vocab['word']}** : {vocab['translation']}")
+                if "example" in vocab:
+                    st.markdown(f"  *Exemple : {vocab['example']}*")
+            render_bulk_srs_button(db, vocabulary, username, lesson, f"srs_bulk_{book_key}_{lesson_id}")
         
         # Exercices
         if "exercices" in lesson and lesson["exercices"]:
             st.markdown("---")
             st.subheader("✍️ Exercices")
             
-            # Stocker les réponses
-            if f"answers_{lesson_id}" not in st.session_state:
-                st.session_state[f"answers_{lesson_id}"] = {}
+            # Réponses de ce passage uniquement : les valeurs des widgets sont
+            # déjà conservées par Streamlit, rien n'est stocké en session
+            answers = {}
+            
+            # Modèle nltk chargé en arrière-plan dès qu'une production libre s'affiche
+            if nlp and any(exercise["type"] == "production" for exercise in lesson["exercices"]):
+                nlp.warm_up()
             
             # Afficher chaque exercice
             for idx, exercise in enumerate(lesson["exercices"]):
                 user_answer = render_exercise(exercise, idx, f"{book_key}_{lesson_id}")
-                st.session_state[f"answers_{lesson_id}"][idx] = (exercise, user_answer)
+                answers[idx] = (exercise, user_answer)
                 st.markdown("---")
             
             # Bouton de soumission
             if st.button(f"✅ Soumettre les exercices", key=f"submit_{lesson_id}"):
-                answers = st.session_state[f"answers_{lesson_id}"]
                 
                 correct_count = 0
                 total_count = 0
@@ -533,16 +4699,21 @@ def render_lesson(lesson, book_key, db, username):
                 st.markdown("### 📝 Résultats :")
                 
                 for idx, (exercise, user_answer) in answers.items():
-                    result = check_exercise(exercise, user_answer)
+                    result = check_exercise(exercise, user_answer, speller, nlp)
                     
                     if result["correct"] is True:
                         correct_count += 1
                         total_count += 1
                         st.success(f"✅ Exercice {idx + 1} : Correct ! {result['feedback']}")
+                        if result.get("near_miss"):
+                            st.warning(f"✏️ Attention à l'orthographe : **{result['expected']}**")
                     
                     elif result["correct"] is False:
                         total_count += 1
-                        st.error(f"❌ Exercice {idx + 1} : Incorrect")
+                        if result.get("near_miss"):
+                            st.warning(f"✏️ Exercice {idx + 1} : presque ! Vérifie l'orthographe")
+                        else:
+                            st.error(f"❌ Exercice {idx + 1} : Incorrect")
                         st.info(f"💡 Réponse attendue : **{result['expected']}**")
                         st.write(result['feedback'])
                     
@@ -552,6 +4723,8 @@ def render_lesson(lesson, book_key, db, username):
                             st.write("**Suggestions :**")
                             for hint in result["hints"]:
                                 st.write(hint)
+                        if result.get("pending"):
+                            st.caption("⏳ Analyse approfondie en cours, resoumets dans un instant.")
                 
                 # Score final
                 if total_count > 0:
@@ -566,13 +4739,19 @@ def render_lesson(lesson, book_key, db, username):
                     else:
                         st.warning("💪 Continue ! Refais les exercices pour atteindre 50% minimum.")
         
+        # Exercices générés automatiquement (vocabulaire, expressions)
+        if exercises is not None:
+            st.markdown("---")
+            render_practice(exercises.get(book_key, lesson), f"{book_key}_{lesson_id}", speller)
+        
         # Activités orales
         if "orales" in lesson and lesson["orales"]:
-            with st.expander("🎤 Activités Orales"):
-                for oral in lesson["orales"]:
-                    st.markdown(f"- {oral}")
+            st.markdown("#### 🎤 Activités Orales")
+            for oral in lesson["orales"]:
+                st.markdown(f"- {oral}")
 
-def render_book_content(book_key, data, db, username):
+def render_book_content(book_key, data, db, username, vocabulary, speller=None, nlp=None, fragments=None,
+                        exercises=None):
     """Affiche le contenu d'un livre"""
     
     book = data["books"].get(book_key, {})
@@ -601,11 +4780,11 @@ def render_book_content(book_key, data, db, username):
     # Afficher chaque item
     for item in items:
         if content_key == "lessons":
-            render_lesson(item, book_key, db, username)
+            render_lesson(item, book_key, db, username, vocabulary, speller, nlp, exercises)
         else:
-            # Pour chapters et fiches, affichage simplifié
-            st.subheader(item.get("title", "Sans titre"))
-            st.write(item)
+            if fragments is None:
+                fragments = ContentFragments(data)
+            render_content_item(item, book_key, db, username, vocabulary, fragments, exercises)
 
 def render_srs_page(db, data_manager, username):
     """Affiche la page SRS (Répétition Espacée)"""
@@ -619,31 +4798,31 @@ def render_srs_page(db, data_manager, username):
     
     # Import depuis data.json
     if st.button("📥 Importer les cartes depuis data.json"):
-        cards_imported = 0
-        for card in data_manager.data.get("srs_cards", []):
-            db.add_srs_card(username, card["front"], card["back"])
-            cards_imported += 1
-        st.success(f"✅ {cards_imported} carte(s) importée(s) !")
+        cards_imported, skipped = add_cards_to_srs(db, username, data_manager.data.get("srs_cards", []))
+        st.success(f"✅ {cards_imported} carte(s) importée(s), {skipped} déjà présente(s) !")
     
     st.markdown("---")
     
     # Cartes à réviser
-    due_cards = db.get_due_cards(username)
+    due_count = db.count_due_cards(username)
     
-    if due_cards:
-        st.subheader(f"📚 {len(due_cards)} carte(s) à réviser aujourd'hui")
+    if due_count:
+        st.subheader(f"📚 {due_count} carte(s) à réviser aujourd'hui")
         
-        # Sélectionner une carte aléatoire
-        if "current_srs_card" not in st.session_state or st.session_state.get("srs_refresh", False):
-            st.session_state["current_srs_card"] = random.choice(due_cards)
+        # Sélectionner une carte aléatoire (une seule ligne chargée)
+        if st.session_state.get("current_srs_card") is None or st.session_state.get("srs_refresh", False):
+            st.session_state["current_srs_card"] = db.get_due_card(username, random.randrange(due_count))
             st.session_state["srs_show_answer"] = False
             st.session_state["srs_refresh"] = False
         
         card = st.session_state["current_srs_card"]
+        if card is None:
+            # Le paquet a changé entre le comptage et la sélection
+            st.rerun()
         
         # Afficher la carte
         st.markdown("### Question :")
-        st.info(f"**{card['front']}**")
+        st.info(f"**{card.front}**")
         
         user_answer = st.text_input("Ta réponse :", key="srs_answer")
         
@@ -655,7 +4834,7 @@ def render_srs_page(db, data_manager, username):
         
         if st.session_state.get("srs_show_answer", False):
             st.markdown("### Réponse correcte :")
-            st.success(f"**{card['back']}**")
+            st.success(f"**{card.back}**")
             
             st.markdown("**Comment as-tu trouvé cette carte ?**")
             
@@ -663,19 +4842,19 @@ def render_srs_page(db, data_manager, username):
             
             with col1:
                 if st.button("❌ Difficile (0)"):
-                    db.update_srs_card(username, card["front"], 0)
+                    db.update_srs_card(username, card.front, 0)
                     st.session_state["srs_refresh"] = True
                     st.rerun()
             
             with col2:
                 if st.button("🤔 Moyen (3)"):
-                    db.update_srs_card(username, card["front"], 3)
+                    db.update_srs_card(username, card.front, 3)
                     st.session_state["srs_refresh"] = True
                     st.rerun()
             
             with col3:
                 if st.button("✅ Facile (5)"):
-                    db.update_srs_card(username, card["front"], 5)
+                    db.update_srs_card(username, card.front, 5)
                     st.session_state["srs_refresh"] = True
                     st.rerun()
     
@@ -698,7 +4877,37 @@ def render_srs_page(db, data_manager, username):
             else:
                 st.error("❌ Remplis les deux champs !")
 
-def render_tests_page(data_manager):
+def render_leaderboard_page(db, username):
+    """Affiche le classement des utilisateurs (totaux matérialisés)"""
+    st.title("🏆 Classement")
+    
+    rankings = {"📚 Leçons complétées": "lessons", "🔥 Meilleure série": "streak"}
+    ranking = st.radio("Classer par", list(rankings.keys()), horizontal=True)
+    leaders = db.get_leaderboard(LEADERBOARD_SIZE, by=rankings[ranking])
+    
+    if not leaders:
+        st.info("📭 Personne n'a encore complété de leçon ou révisé de carte.")
+        return
+    
+    st.dataframe(pd.DataFrame([
+        {
+            "Rang": rank,
+            "Pseudo": f"👉 {leader['username']}" if leader["username"] == username else leader["username"],
+            "Leçons": leader["completed_lessons"],
+            "Score moyen": f"{leader['average_score']:.0f}%",
+            "Révisions": leader["reviews"],
+            "Série": leader["streak"],
+            "Meilleure série": leader["best_streak"],
+        }
+        for rank, leader in enumerate(leaders, start=1)
+    ]), hide_index=True)
+    
+    if all(leader["username"] != username for leader in leaders):
+        stats = db.get_user_stats(username)
+        st.caption(f"Toi : {stats['completed_lessons']} leçon(s), score moyen {stats['average_score']:.0f}%, "
+                   f"meilleure série {stats['best_streak']} jour(s)")
+
+def render_tests_page(db, data_manager, username):
     """Affiche la page des tests de niveau"""
     
     st.title("📝 Tests de Niveau")
@@ -730,33 +4939,54 @@ def render_tests_page(data_manager):
         st.warning("Ce test ne contient pas encore de questions.")
         return
     
+    stats = db.get_test_stats(username, selected_level)
+    if stats:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("🏆 Meilleur score", f"{stats['best_score'] * 100:.0f}%")
+        col2.metric("🔁 Tentatives", stats["attempts"])
+        col3.metric("⏱️ Temps par question", f"{stats['seconds_per_question']:.0f} s")
+    
     st.markdown("---")
     
-    score = 0
+    # Test en cours : un niveau d'une version du contenu. Le chronomètre
+    # repart à zéro en changeant de niveau, de contenu ou de page (main)
     total = len(questions)
+    version = data_manager.version
+    run = st.session_state.get("test_run")
+    if run is None or run["test"] != (selected_level, version):
+        st.session_state["test_run"] = {"test": (selected_level, version), "started_at": time.time()}
     
-    for idx, question in enumerate(questions):
-        st.markdown(f"**Question {idx + 1}/{total}**")
-        st.write(question["question"])
-        
-        user_answer = st.text_input(
-            "Ta réponse :",
-            key=f"test_{selected_level}_{idx}"
-        )
-        
-        if st.button("Vérifier", key=f"check_{selected_level}_{idx}"):
-            expected = question["answer"].strip().lower()
-            given = user_answer.strip().lower()
-            
-            alternatives = question.get("alternatives", [])
-            
-            if given == expected or given in [alt.strip().lower() for alt in alternatives]:
-                st.success("✅ Correct !")
-                score += 1
-            else:
-                st.error(f"❌ Incorrect. Réponse attendue : **{question['answer']}**")
+    # Un seul formulaire : aucune relance du script tant que le test n'est pas soumis
+    with st.form(f"test_form_{selected_level}_{version}"):
+        answers = []
+        for idx, question in enumerate(questions):
+            st.markdown(f"**Question {idx + 1}/{total}**")
+            st.write(question["question"])
+            answers.append(st.text_input("Ta réponse :", key=f"test_{selected_level}_{version}_{idx}"))
+            st.markdown("---")
         
-        st.markdown("---")
+        submitted = st.form_submit_button("✅ Terminer le test")
+    
+    if not submitted:
+        return
+    
+    duration = time.time() - st.session_state.pop("test_run")["started_at"]
+    grader = data_manager.derived("test_grader", TestGrader)
+    results = grader.grade(selected_level, answers)
+    score = sum(verdict == AnswerMatcher.EXACT for verdict in results)
+    
+    db.save_test_result(username, selected_level, score, total, duration)
+    
+    st.markdown("### 📝 Résultats :")
+    for idx, (question, verdict) in enumerate(zip(questions, results)):
+        if verdict == AnswerMatcher.EXACT:
+            st.success(f"✅ Question {idx + 1} : Correct !")
+        elif verdict == AnswerMatcher.NEAR_MISS:
+            st.warning(f"✏️ Question {idx + 1} : presque ! Vérifie l'orthographe : **{question['answer']}**")
+        else:
+            st.error(f"❌ Question {idx + 1} : Incorrect. Réponse attendue : **{question['answer']}**")
+    
+    st.markdown(f"### 🎯 Score : {score}/{total} ({score / total * 100:.0f}%)")
 
 def render_import_page(data_manager):
     """Page d'import de fichier JSON"""
@@ -771,20 +5001,61 @@ def render_import_page(data_manager):
     
     uploaded_file = st.file_uploader("Choisis un fichier JSON", type=["json"])
     
-    if uploaded_file:
+    staged = st.session_state.get("staged_import")
+    
+    if not uploaded_file:
+        # Fichier retiré : on nettoie l'import en attente
+        if staged:
+            staged[1].discard()
+            del st.session_state["staged_import"]
+        return
+    
+    # Validation en flux, une seule fois par fichier envoyé
+    if staged is None or staged[0] != uploaded_file.file_id:
+        if staged:
+            staged[1].discard()
+        importer = ContentImporter(data_manager)
+        with st.spinner("🔍 Validation du fichier..."):
+            importer.stage(uploaded_file)
+        staged = (uploaded_file.file_id, importer)
+        st.session_state["staged_import"] = staged
+    
+    importer = staged[1]
+    
+    if importer.errors:
+        st.error(f"❌ Fichier invalide ({len(importer.errors)} erreur(s)) :")
+        for error in importer.errors:
+            st.write(f"- {error}")
+        return
+    
+    if importer.temp_path is None:
+        st.success("✅ Fichier importé avec succès !")
+        return
+    
+    # Aperçu des données
+    st.subheader("📋 Aperçu du fichier")
+    st.json(importer.meta)
+    
+    st.subheader("🔀 Différences avec le contenu actuel")
+    st.dataframe(pd.DataFrame(importer.diff_summary()), hide_index=True)
+    
+    duplicates = importer.duplicates
+    if duplicates:
+        st.warning(f"🪞 {len(duplicates)} groupe(s) de quasi-doublons dans le fichier")
+        st.dataframe(pd.DataFrame([
+            {
+                "Type": group[0][0],
+                "Original": f"{group[0][2]} ({group[0][1]})",
+                "Doublon(s)": ", ".join(f"{label} ({where})" for _, where, label in group[1:]),
+            }
+            for group in duplicates
+        ]), hide_index=True)
+    
+    if st.button("✅ Confirmer l'import"):
         try:
-            new_data = json.load(uploaded_file)
-            
-            # Aperçu des données
-            st.subheader("📋 Aperçu du fichier")
-            st.json(new_data.get("meta", {}))
-            
-            if st.button("✅ Confirmer l'import"):
-                data_manager.save_data(new_data)
-                data_manager.data = new_data
-                st.success("✅ Fichier importé avec succès ! Recharge la page.")
-        
-        except Exception as e:
+            importer.commit()
+            st.success("✅ Fichier importé avec succès !")
+        except OSError as e:
             st.error(f"❌ Erreur lors de l'import : {e}")
 
 def render_export_page(db, username):
@@ -794,19 +5065,17 @@ def render_export_page(db, username):
     
     st.markdown("### 📊 Export des cartes SRS")
     
-    cur = db.conn.cursor()
-    cur.execute("""
-        SELECT front, back, interval, easiness, repetitions, next_review, last_review
-        FROM srs_cards WHERE username=?
-    """, (username,))
-    
-    rows = cur.fetchall()
+    rows = db.export_srs_cards(username)
+    progress_rows = db.export_progress(username)
     
     if rows:
         df = pd.DataFrame(rows, columns=[
             "Front", "Back", "Interval", "Easiness", 
             "Repetitions", "Next Review", "Last Review"
         ])
+        # Planification stockée en entiers : dates lisibles pour l'export
+        df["Next Review"] = pd.to_datetime(df["Next Review"], unit="D").dt.date
+        df["Last Review"] = pd.to_datetime(df["Last Review"], unit="s")
         
         st.dataframe(df)
         
@@ -823,14 +5092,6 @@ def render_export_page(db, username):
     st.markdown("---")
     st.markdown("### 📈 Export de la progression")
     
-    cur.execute("""
-        SELECT book_key, lesson_id, completed_at, score
-        FROM progress WHERE username=?
-        ORDER BY completed_at DESC
-    """, (username,))
-    
-    progress_rows = cur.fetchall()
-    
     if progress_rows:
         progress_df = pd.DataFrame(progress_rows, columns=[
             "Book", "Lesson ID", "Completed At", "Score"
@@ -855,9 +5116,33 @@ def render_export_page(db, username):
 def main():
     """Fonction principale de l'application"""
     
+    st.set_page_config(
+        page_title=APP_TITLE,
+        page_icon="🇬🇧",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
     # Initialiser les managers
-    db = DatabaseManager(DB_FILE)
-    data_manager = DataManager(DATA_FILE)
+    db = get_database()
+    data_manager = get_data_manager()
+    search_index = get_search_index()
+    if BACKGROUND_JOBS:
+        # Contenu rechargé et index reconstruits par le thread de fond
+        get_background_scheduler()
+    else:
+        data_manager.refresh()
+        search_index.update(data_manager.data, data_manager.version)
+    if data_manager.error:
+        st.error(f"❌ data.json n'a pas pu être rechargé, version précédente conservée : {data_manager.error}")
+    vocabulary = data_manager.derived("vocabulary", VocabularyLookup)
+    db.recommendations = data_manager.derived("recommendations", RecommendationIndex)
+    speller = data_manager.derived("spelling", SpellingIndex.load)
+    nlp = get_nlp_analyzer()
+    # Exercices générés hors passage (tâche de fond ou manage.py build-exercises)
+    exercise_bank = get_exercise_bank()
+    if not exercise_bank.is_current(data_manager.version):
+        exercise_bank = None
     
     # Sidebar et gestion utilisateur
     username = render_sidebar(db)
@@ -866,6 +5151,8 @@ def main():
         st.warning("👈 Entre ton pseudo dans la barre latérale pour commencer !")
         st.stop()
     
+    render_search(search_index)
+    
     # Navigation
     st.sidebar.markdown("---")
     st.sidebar.title("📚 Navigation")
@@ -877,6 +5164,7 @@ def main():
         "💼 Être Pro": "etre_pro",
         "🔄 SRS": "srs",
         "📝 Tests": "tests",
+        "🏆 Classement": "leaderboard",
         "📥 Importer JSON": "import",
         "📤 Exporter CSV": "export"
     }
@@ -884,20 +5172,28 @@ def main():
     selected_page = st.sidebar.radio("Sections", list(pages.keys()))
     page_key = pages[selected_page]
     
+    # Le temps passé ailleurs ne compte pas dans la durée d'un test en cours
+    if page_key != "tests":
+        st.session_state.pop("test_run", None)
+    
     # Afficher la page sélectionnée
     if page_key == "dashboard":
-        render_dashboard(db, data_manager, username)
+        render_dashboard(db, data_manager, username, speller)
     
     elif page_key in ["40_lecons", "800_expressions", "etre_pro"]:
         book_title = data_manager.data["books"][page_key].get("title", selected_page)
         st.title(f"📚 {book_title}")
-        render_book_content(page_key, data_manager.data, db, username)
+        render_book_content(page_key, data_manager.data, db, username, vocabulary, speller, nlp,
+                            data_manager.derived("fragments", ContentFragments), exercise_bank)
     
     elif page_key == "srs":
         render_srs_page(db, data_manager, username)
     
     elif page_key == "tests":
-        render_tests_page(data_manager)
+        render_tests_page(db, data_manager, username)
+    
+    elif page_key == "leaderboard":
+        render_leaderboard_page(db, username)
     
     elif page_key == "import":
         render_import_page(data_manager)
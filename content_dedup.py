@@ -0,0 +1,207 @@
+"""
+Détection des quasi-doublons du contenu (MinHash + LSH), partagée par
+l'app, manage.py et scrape_content.py (sans streamlit)
+
+- Chaque texte (carte SRS, expression, leçon/chapitre/fiche) est normalisé
+  puis réduit à une signature MinHash : la proportion de valeurs égales
+  entre deux signatures estime la similarité de Jaccard de leurs
+  trigrammes de caractères.
+- Les signatures sont découpées en bandes ; deux textes ne sont comparés
+  que s'ils partagent une bande (LSH), d'où un temps à peu près linéaire
+  en la taille du corpus au lieu d'une comparaison de toutes les paires.
+"""
+
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from text_normalize import normalize_key
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEDUP_THRESHOLD = 0.8  # Similarité (Jaccard estimée) à partir de laquelle deux textes sont des doublons
+NUM_PERM = 64  # Taille des signatures MinHash
+BANDS = 16  # Bandes LSH (4 valeurs chacune) : candidat dès ~50 % de similarité
+SHINGLE_SIZE = 3  # Trigrammes de caractères
+SIGNATURE_CHUNK = 2000  # Textes par tâche du pool de processus
+MERSENNE_PRIME = (1 << 31) - 1
+
+# Types d'entrées comparées entre elles (jamais d'un type à l'autre)
+KIND_CARD = "carte"
+KIND_EXPRESSION = "expression"
+KIND_ITEM = "élément"
+
+CONTENT_KEYS = ("lessons", "chapters", "fiches")
+
+# =============================================================================
+# TEXTES COMPARÉS
+# =============================================================================
+
+def card_text(card):
+    """Texte d'une carte SRS : face et dos"""
+    return f"{card.get('front', '')} {card.get('back', '')}"
+
+def item_text(value):
+    """Toutes les chaînes d'une leçon, d'un chapitre ou d'une fiche (sauf les identifiants)"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return " ".join(item_text(field) for key, field in value.items() if key != "id")
+    if isinstance(value, list):
+        return " ".join(item_text(field) for field in value)
+    return ""
+
+def item_entries(book_key, content_key, index, item):
+    """Entrées (type, emplacement, libellé, texte) d'un élément et de ses expressions"""
+    where = f"books/{book_key}/{content_key}/{index}"
+    yield KIND_ITEM, where, item.get("title", ""), item_text(item)
+    for key in ("expressions", "phrases_cles"):
+        for position, expression in enumerate(item.get(key, [])):
+            if isinstance(expression, dict) and expression.get("en"):
+                yield KIND_EXPRESSION, f"{where}/{key}/{position}", expression["en"], expression["en"]
+
+def corpus_entries(data):
+    """Entrées (type, emplacement, libellé, texte) de tout un data.json"""
+    for index, card in enumerate(data.get("srs_cards", [])):
+        yield KIND_CARD, f"srs_cards/{index}", f"{card.get('front')} → {card.get('back')}", card_text(card)
+    for book_key, book in data.get("books", {}).items():
+        for content_key in CONTENT_KEYS:
+            for index, item in enumerate(book.get(content_key, [])):
+                yield from item_entries(book_key, content_key, index, item)
+
+# =============================================================================
+# SIGNATURES MINHASH
+# =============================================================================
+
+class MinHasher:
+    """Signatures MinHash (NUM_PERM permutations universelles, graine fixe)"""
+    
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, num_perm).astype(np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, num_perm).astype(np.uint64)
+    
+    @staticmethod
+    def shingles(text, size=SHINGLE_SIZE):
+        """Empreintes (crc32) des n-grammes de caractères du texte normalisé (normalize_key)"""
+        text = f" {normalize_key(text)} "
+        grams = {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+        return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams))
+    
+    def signature(self, text):
+        hashes = self.shingles(text)
+        # (a·h + b) mod p pour chaque permutation, minimum sur les n-grammes
+        return ((np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME).min(axis=0).astype(np.uint32)
+
+def _signature_chunk(texts):
+    """Tâche du pool de processus : signatures d'un bloc de textes"""
+    hasher = MinHasher()
+    return np.array([hasher.signature(text) for text in texts], dtype=np.uint32).reshape(-1, NUM_PERM)
+
+def compute_signatures(texts, workers=None):
+    """
+    Signatures d'une liste de textes (matrice len(texts) × NUM_PERM), par
+    blocs répartis sur un pool de processus quand il y en a plusieurs.
+    workers=1 : calcul dans le processus appelant.
+    """
+    chunks = [texts[start:start + SIGNATURE_CHUNK] for start in range(0, len(texts), SIGNATURE_CHUNK)]
+    if workers == 1 or len(chunks) <= 1:
+        parts = [_signature_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(_signature_chunk, chunks))
+    return np.vstack(parts) if parts else np.empty((0, NUM_PERM), dtype=np.uint32)
+
+def similarity(first, second):
+    """Similarité de Jaccard estimée entre deux signatures"""
+    return float(np.mean(first == second))
+
+# =============================================================================
+# CLASSE : INDEX LSH
+# =============================================================================
+
+class DuplicateIndex:
+    """
+    Index LSH des signatures déjà vues, par type d'entrée : find() ne
+    compare une signature qu'aux entrées qui partagent au moins une bande.
+    """
+    
+    def __init__(self, threshold=DEDUP_THRESHOLD, bands=BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.buckets = {}  # (type, bande, valeurs) -> [numéros d'entrées]
+        self.signatures = []
+        self.labels = []
+    
+    def _band_keys(self, kind, signature):
+        for band in range(self.bands):
+            yield kind, band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+    
+    def find(self, kind, signature):
+        """Numéro de l'entrée la plus proche au-delà du seuil (None si aucune)"""
+        candidates = set()
+        for key in self._band_keys(kind, signature):
+            candidates.update(self.buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        for entry in sorted(candidates):
+            score = similarity(signature, self.signatures[entry])
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+    
+    def add(self, kind, signature, label=""):
+        """Ajoute une entrée, retourne son numéro"""
+        entry = len(self.signatures)
+        self.signatures.append(signature)
+        self.labels.append(label)
+        for key in self._band_keys(kind, signature):
+            self.buckets.setdefault(key, []).append(entry)
+        return entry
+    
+    def add_unique(self, kind, text, label=""):
+        """
+        Ajoute un texte s'il n'est le quasi-doublon d'aucune entrée.
+        Retourne le libellé de l'entrée existante qu'il reprend (None si ajouté).
+        """
+        signature = _signature_chunk([text])[0]
+        match = self.find(kind, signature)
+        if match is not None:
+            return self.labels[match]
+        self.add(kind, signature, label)
+        return None
+    
+    @classmethod
+    def from_entries(cls, entries, threshold=DEDUP_THRESHOLD, workers=None):
+        """Index de toutes les entrées (type, emplacement, libellé, texte)"""
+        entries = list(entries)
+        index = cls(threshold)
+        signatures = compute_signatures([entry[3] for entry in entries], workers)
+        for (kind, _, label, _), signature in zip(entries, signatures):
+            index.add(kind, signature, label)
+        return index
+
+def near_duplicate_groups(entries, signatures, threshold=DEDUP_THRESHOLD):
+    """
+    Regroupe les quasi-doublons : entries [(type, emplacement, libellé, ...)]
+    et leurs signatures. Chaque entrée est rattachée à la plus proche des
+    entrées précédentes. Retourne des listes d'entrées (la première gardée).
+    """
+    index = DuplicateIndex(threshold)
+    root_of, groups = {}, {}
+    for position, ((kind, *_), signature) in enumerate(zip(entries, signatures)):
+        match = index.find(kind, signature)
+        index.add(kind, signature)
+        root = position if match is None else root_of[match]
+        root_of[position] = root
+        groups.setdefault(root, []).append(position)
+    return [[entries[member] for member in members] for members in groups.values() if len(members) > 1]
+
+def find_near_duplicates(data, threshold=DEDUP_THRESHOLD, workers=None):
+    """Quasi-doublons de tout un data.json (signatures calculées en parallèle)"""
+    entries = list(corpus_entries(data))
+    signatures = compute_signatures([entry[3] for entry in entries], workers)
+    return near_duplicate_groups([entry[:3] for entry in entries], signatures, threshold)
@@ -0,0 +1,205 @@
+"""
+Accès concurrent à data.json, partagé par l'app et scrape_content.py
+(bibliothèque standard uniquement : utilisable sans streamlit)
+
+- Les écritures passent par un fichier temporaire renommé (atomique) : un
+  lecteur voit toujours l'ancienne ou la nouvelle version complète, jamais
+  un fichier à moitié écrit. Les lectures ne prennent donc aucun verrou.
+- Les écrivains (app, import, scraper) se sérialisent par un verrou
+  consultatif sur un fichier voisin (data.json.lock) : deux
+  lecture-modification-écriture ne s'écrasent pas.
+"""
+
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl  # POSIX
+except ImportError:
+    fcntl = None
+    import msvcrt  # Windows
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+LOCK_TIMEOUT = 30  # Attente maximale (s) du verrou d'écriture
+LOCK_POLL = 0.05  # Intervalle (s) entre deux tentatives de verrouillage
+
+# =============================================================================
+# VERROUS ET ÉCRITURES ATOMIQUES
+# =============================================================================
+
+def fsync_directory(directory):
+    """Force l'écriture sur disque d'un renommage dans un dossier"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return  # Windows : pas de fsync possible sur un dossier
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _try_lock(fd):
+    """Tente de poser le verrou exclusif sans attendre. Retourne True si obtenu."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """
+    Verrou consultatif exclusif associé à path (fichier path.lock), entre
+    processus. Lève TimeoutError si le verrou n'est pas obtenu à temps.
+    """
+    lock_path = Path(f"{path}.lock")
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + timeout
+        while not _try_lock(fd):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Verrou {lock_path} toujours tenu après {timeout} s")
+            time.sleep(LOCK_POLL)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+class ProcessLock:
+    """
+    Verrou consultatif tenu sans limite de durée, par exemple pour élire le
+    processus qui exécute les tâches de fond. Le système le libère si le
+    processus meurt : un autre peut alors le prendre.
+    """
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.fd = None
+    
+    def try_acquire(self):
+        """Prend le verrou s'il est libre (sans attendre). Retourne True s'il est tenu."""
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not _try_lock(fd):
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+    
+    def release(self):
+        """Libère le verrou s'il est tenu"""
+        if self.fd is not None:
+            _unlock(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+def atomic_write_json(path, data):
+    """
+    Écrit un fichier JSON de façon atomique : fichier temporaire dans le même
+    dossier, fsync, puis renommage. Un crash ne laisse jamais un fichier tronqué.
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}-", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+    fsync_directory(path.parent)
+
+# =============================================================================
+# CLASSE : FICHIER DE CONTENU PARTAGÉ
+# =============================================================================
+
+class ContentError(ValueError):
+    """Fichier de contenu illisible ou invalide"""
+
+class ContentStore:
+    """Lecture validée et écritures sérialisées d'un fichier de contenu JSON"""
+    
+    def __init__(self, path):
+        self.path = Path(path)
+    
+    def signature(self):
+        """(date de modification, taille) du fichier, ou None s'il n'existe pas"""
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    @staticmethod
+    def validate(data):
+        """Contrôle minimal avant de remplacer une version en service"""
+        if not isinstance(data, dict) or not isinstance(data.get("books"), dict):
+            raise ContentError("structure invalide (objet avec une clé 'books' attendu)")
+        return data
+    
+    def read(self):
+        """
+        Lit et valide le fichier. Retourne (données, octets bruts, signature).
+        Lève FileNotFoundError s'il n'existe pas, ContentError s'il est invalide.
+        """
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            raw = f.read()
+        try:
+            data = json.loads(raw.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ContentError(f"{self.path} : JSON invalide ({e})") from None
+        return self.validate(data), raw, (stat.st_mtime_ns, stat.st_size)
+    
+    def write(self, data):
+        """Remplace le fichier (verrou d'écriture + renommage atomique)"""
+        with file_lock(self.path):
+            atomic_write_json(self.path, self.validate(data))
+    
+    def create(self, data):
+        """Crée le fichier s'il n'existe pas encore. Retourne False s'il existait déjà."""
+        with file_lock(self.path):
+            if self.path.exists():
+                return False
+            atomic_write_json(self.path, self.validate(data))
+            return True
+    
+    def update(self, change):
+        """
+        Lecture-modification-écriture sous verrou : change(data) modifie la
+        version la plus récente du fichier, pas une copie lue plus tôt.
+        Retourne les données écrites.
+        """
+        with file_lock(self.path):
+            data, _, _ = self.read()
+            change(data)
+            atomic_write_json(self.path, self.validate(data))
+            return data
+    
+    def replace_with(self, staged_path):
+        """Remplace le fichier par un fichier déjà validé du même dossier"""
+        with file_lock(self.path):
+            os.replace(staged_path, self.path)
+            fsync_directory(self.path.parent)
@@ -0,0 +1,293 @@
+"""
+Outils de maintenance de la base de progression (en ligne de commande)
+Usage : python manage.py <commande> [options]
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from app import (
+    ARCHIVE_AFTER_DAYS, BACKUP_DIR, BACKUP_KEEP, DATA_FILE, DB_FILE, DB_SHARDS, DELTA_CHUNK_SIZE,
+    FORECAST_DAYS, FSRS_MIN_REVIEWS, GENERATED_EXERCISES_FILE, ROWS_WRITTEN_PER_REVIEW, BackupManager,
+    DatabaseManager, DataManager, ExerciseBank, atomic_write_json, explain_migrations, forecast_reviews,
+    quality_probabilities, schedule_from_export,
+)
+
+from content_dedup import DEDUP_THRESHOLD, find_near_duplicates
+
+try:
+    import pyarrow as pa  # Export Parquet (installé avec streamlit)
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# =============================================================================
+# COMMANDES
+# =============================================================================
+
+def migrate(args):
+    """Applique les migrations de schéma en attente (ou affiche leurs plans)"""
+    if args.explain:
+        for version, description, query, before, after in explain_migrations():
+            print(f"\n🔧 Migration {version} : {description}")
+            print(f"   {query}")
+            print(f"   Avant : {' / '.join(before)}")
+            print(f"   Après : {' / '.join(after)}")
+        return
+    
+    db = DatabaseManager(args.db, args.shards, migrate=False)
+    for path, applied in zip(db.router.paths, db.init_database()):
+        if applied:
+            print(f"✅ {path} : migration(s) {', '.join(map(str, applied))} appliquée(s)")
+        else:
+            print(f"✅ {path} : déjà à jour")
+
+def rebalance(args):
+    """Change le nombre de shards et redistribue les utilisateurs (app arrêtée)"""
+    db = DatabaseManager(args.db, None)  # Shards en service, quel que soit --shards
+    before = len(db.pools)
+    start = time.perf_counter()
+    moved = db.rebalance(args.shards)
+    print(f"✅ {before} → {len(db.pools)} shard(s) : {moved} utilisateur(s) déplacé(s) "
+          f"en {time.perf_counter() - start:.1f} s")
+    for path in db.router.paths:
+        print(f"   {path}")
+
+def fit_scheduler(args):
+    """Ajuste les paramètres FSRS de chaque apprenant sur son historique"""
+    db = DatabaseManager(args.db, args.shards)
+    fitted = db.fit_scheduler_params(workers=args.workers, min_reviews=args.min_reviews)
+    print(f"✅ Paramètres FSRS ajustés pour {fitted} apprenant(s)")
+
+def forecast(args):
+    """Prévision des révisions et des écritures en base des prochains jours"""
+    db = DatabaseManager(args.db, args.shards)
+    if args.user:
+        schedule = schedule_from_export(db.export_srs_cards(args.user))
+    else:
+        schedule = db.schedule_rows()
+    probabilities = quality_probabilities(db.get_quality_counts(args.user))
+    
+    start = time.perf_counter()
+    reviews = forecast_reviews(schedule, args.days, probabilities, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    
+    print(f"📅 {len(schedule)} carte(s), simulation de {args.days} jours en {elapsed:.2f} s")
+    print(f"   Notes supposées : {', '.join(f'{q} → {p:.0%}' for q, p in probabilities.items())}")
+    print(f"\n{'Jour':<12}{'Révisions':>12}{'Lignes écrites':>16}")
+    for offset, count in enumerate(reviews):
+        day = date.today() + timedelta(days=offset)
+        print(f"{day.isoformat():<12}{count:>12}{count * ROWS_WRITTEN_PER_REVIEW:>16}")
+    print(f"\nPic : {reviews.max()} révisions/jour ({reviews.max() * ROWS_WRITTEN_PER_REVIEW} lignes écrites), "
+          f"moyenne : {reviews.mean():.0f} révisions/jour")
+
+def build_exercises(args):
+    """Génère les exercices « trous » et « qcm » du contenu (mis en cache)"""
+    data_manager = DataManager(args.data)
+    if data_manager.error:
+        sys.exit(f"❌ {data_manager.error}")
+    start = time.perf_counter()
+    generated = ExerciseBank(args.output).build(data_manager.data, data_manager.version, workers=args.workers)
+    if generated is None:
+        print(f"✅ {args.output} déjà à jour (contenu {data_manager.version})")
+    else:
+        print(f"✅ {generated} exercice(s) générés en {time.perf_counter() - start:.1f} s → {args.output}")
+
+def dedup(args):
+    """Rapport des quasi-doublons de data.json (MinHash + LSH)"""
+    data_manager = DataManager(args.data)
+    if data_manager.error:
+        sys.exit(f"❌ {data_manager.error}")
+    start = time.perf_counter()
+    groups = find_near_duplicates(data_manager.data, threshold=args.threshold, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    for group in groups:
+        kind, where, label = group[0]
+        print(f"\n🪞 {kind} « {label} » ({where})")
+        for _, where, label in group[1:]:
+            print(f"   ≈ « {label} » ({where})")
+    print(f"\n✅ {len(groups)} groupe(s) de quasi-doublons "
+          f"({sum(len(group) - 1 for group in groups)} en trop), analyse en {elapsed:.1f} s")
+
+def archive(args):
+    """Archive les utilisateurs inactifs puis compacte les shards"""
+    db = DatabaseManager(args.db, args.shards)
+    archived = db.archive_inactive_users(days=args.days, vacuum=not args.no_vacuum)
+    print(f"✅ {archived} utilisateur(s) inactif(s) archivé(s) dans {db.archive_dir}")
+
+def backup(args):
+    """Sauvegarde à chaud (complète ou incrémentale) de tous les shards"""
+    db = DatabaseManager(args.db, args.shards)
+    backups = BackupManager(db.router.paths, args.backup_dir, args.keep)
+    if args.incremental:
+        manifest = backups.incremental(compress=args.compress)
+    else:
+        manifest = backups.snapshot(compress=args.compress)
+    size = sum(entry["size"] for entry in manifest["files"]) / 1024
+    print(f"✅ Sauvegarde {manifest['name']} ({manifest['kind']}, {size:.0f} Ko)")
+    if manifest["kind"] == "incremental":
+        print(f"   {sum(entry['rows'] for entry in manifest['files'])} ligne(s) modifiée(s) ou supprimée(s)")
+
+def list_backups(args):
+    """Liste les sauvegardes disponibles"""
+    manifests = BackupManager([args.db], args.backup_dir).list_backups()
+    if not manifests:
+        print("📭 Aucune sauvegarde")
+    for manifest in manifests:
+        base = f" (base : {manifest['base']})" if manifest["base"] else ""
+        print(f"{manifest['name']}  {manifest['kind']}{base}")
+
+def restore(args):
+    """Vérifie puis restaure une sauvegarde (et les incrémentales qui la précèdent)"""
+    db = DatabaseManager(args.db, args.shards, migrate=False)
+    backups = BackupManager(db.router.paths, args.backup_dir)
+    if args.check:
+        chain = backups.verify(args.name)
+        print(f"✅ Sommes de contrôle valides : {', '.join(backup['name'] for backup in chain)}")
+        return
+    applied = backups.restore(args.name)
+    print(f"✅ Restauré depuis : {', '.join(applied)}")
+
+def write_ndjson(chunks, stream):
+    """Écrit les blocs de modifications en NDJSON (une ligne par enregistrement)"""
+    for shard, _, records in chunks:
+        for record in records:
+            stream.write(json.dumps(dict(record, shard=shard), ensure_ascii=False))
+            stream.write("\n")
+        yield shard, records
+
+def write_parquet(chunks, path):
+    """Écrit les blocs de modifications en Parquet (un groupe de lignes par bloc)"""
+    schema = pa.schema([
+        ("shard", pa.int32()), ("seq", pa.int64()), ("table", pa.string()),
+        ("op", pa.string()), ("key", pa.string()), ("row", pa.string()),
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        for shard, _, records in chunks:
+            writer.write_table(pa.table({
+                "shard": [shard] * len(records),
+                "seq": [record["seq"] for record in records],
+                "table": [record["table"] for record in records],
+                "op": [record["op"] for record in records],
+                "key": [json.dumps(record["key"], ensure_ascii=False) for record in records],
+                "row": [record["row"] and json.dumps(record["row"], ensure_ascii=False) for record in records],
+            }, schema=schema))
+            yield shard, records
+
+def export_delta(args):
+    """Exporte les lignes modifiées depuis la dernière synchronisation"""
+    if args.format == "parquet" and pa is None:
+        sys.exit("❌ L'export Parquet nécessite pyarrow (pip install pyarrow)")
+    if args.format == "parquet" and args.output == "-":
+        sys.exit("❌ L'export Parquet nécessite un fichier de sortie (--output)")
+    
+    db = DatabaseManager(args.db, args.shards)
+    watermarks = [0] * len(db.pools)
+    if args.state and args.state.exists():
+        watermarks = json.loads(args.state.read_text(encoding='utf-8'))["watermarks"]
+    
+    changes = db.iter_changes(watermarks, args.chunk_size)
+    exported = 0
+    
+    def track(written):
+        nonlocal exported
+        for shard, records in written:
+            watermarks[shard] = records[-1]["seq"]
+            exported += len(records)
+    
+    if args.format == "parquet":
+        track(write_parquet(changes, args.output))
+    elif args.output == "-":
+        track(write_ndjson(changes, sys.stdout))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            track(write_ndjson(changes, f))
+    
+    # Filigranes avancés seulement une fois la sortie complète
+    if args.state:
+        atomic_write_json(args.state, {"watermarks": watermarks})
+    print(f"✅ {exported} modification(s) exportée(s)", file=sys.stderr)
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def main():
+    """Analyse la ligne de commande et lance la commande demandée"""
+    parser = argparse.ArgumentParser(description="Maintenance de la base de progression")
+    parser.add_argument("--db", type=Path, default=DB_FILE, help="Base SQLite (shard 0)")
+    parser.add_argument("--shards", type=int, default=DB_SHARDS, help="Nombre de shards")
+    parser.add_argument("--backup-dir", type=Path, default=BACKUP_DIR, help="Dossier des sauvegardes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    migration = commands.add_parser("migrate", help="Applique les migrations de schéma en attente")
+    migration.add_argument("--explain", action="store_true",
+                           help="Affiche les plans de requête avant/après chaque migration")
+    migration.set_defaults(func=migrate)
+    
+    sharding = commands.add_parser("rebalance", help="Passe au nombre de shards --shards (app arrêtée)")
+    sharding.set_defaults(func=rebalance)
+    
+    fit = commands.add_parser("fit-scheduler", help="Ajuste les paramètres FSRS par apprenant")
+    fit.add_argument("--workers", type=int, default=None, help="Processus en parallèle (défaut : nb de CPU)")
+    fit.add_argument("--min-reviews", type=int, default=FSRS_MIN_REVIEWS,
+                     help="Rappels minimum pour ajuster un apprenant")
+    fit.set_defaults(func=fit_scheduler)
+    
+    delta = commands.add_parser("export-delta", help="Exporte les modifications depuis la dernière synchro")
+    delta.add_argument("--state", type=Path, default=None,
+                       help="Fichier des filigranes (lu puis mis à jour ; absent = export complet)")
+    delta.add_argument("--format", choices=("ndjson", "parquet"), default="ndjson")
+    delta.add_argument("--output", default="-", help="Fichier de sortie (défaut : sortie standard, NDJSON)")
+    delta.add_argument("--chunk-size", type=int, default=DELTA_CHUNK_SIZE, help="Modifications lues par bloc")
+    delta.set_defaults(func=export_delta)
+    
+    prevision = commands.add_parser("forecast", help="Prévision de la charge de révision (SM-2)")
+    prevision.add_argument("--user", default=None, help="Un seul apprenant (défaut : tous)")
+    prevision.add_argument("--days", type=int, default=FORECAST_DAYS, help="Horizon en jours")
+    prevision.add_argument("--seed", type=int, default=0, help="Graine du tirage des notes")
+    prevision.set_defaults(func=forecast)
+    
+    generate = commands.add_parser("build-exercises", help="Génère les exercices à trous et QCM du contenu")
+    generate.add_argument("--data", type=Path, default=DATA_FILE, help="Fichier de contenu")
+    generate.add_argument("--output", type=Path, default=GENERATED_EXERCISES_FILE, help="Cache des exercices")
+    generate.add_argument("--workers", type=int, default=None, help="Processus en parallèle (défaut : nb de CPU)")
+    generate.set_defaults(func=build_exercises)
+    
+    duplicates = commands.add_parser("dedup", help="Liste les quasi-doublons du contenu")
+    duplicates.add_argument("--data", type=Path, default=DATA_FILE, help="Fichier de contenu")
+    duplicates.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD,
+                            help="Similarité minimale (0-1) entre deux textes")
+    duplicates.add_argument("--workers", type=int, default=None, help="Processus en parallèle (défaut : nb de CPU)")
+    duplicates.set_defaults(func=dedup)
+    
+    archiving = commands.add_parser("archive", help="Archive les utilisateurs inactifs et compacte la base")
+    archiving.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                           help="Jours sans activité avant archivage")
+    archiving.add_argument("--no-vacuum", action="store_true", help="Ne pas compacter la base ensuite")
+    archiving.set_defaults(func=archive)
+    
+    save = commands.add_parser("backup", help="Sauvegarde à chaud de la base de progression")
+    save.add_argument("--incremental", action="store_true",
+                      help="Seulement les lignes modifiées depuis la dernière sauvegarde")
+    save.add_argument("--compress", action="store_true", help="Compresse les fichiers (gzip)")
+    save.add_argument("--keep", type=int, default=BACKUP_KEEP, help="Sauvegardes complètes conservées")
+    save.set_defaults(func=backup)
+    
+    listing = commands.add_parser("backups", help="Liste les sauvegardes disponibles")
+    listing.set_defaults(func=list_backups)
+    
+    load = commands.add_parser("restore", help="Restaure une sauvegarde après vérification")
+    load.add_argument("name", help="Nom de la sauvegarde (voir la commande backups)")
+    load.add_argument("--check", action="store_true", help="Vérifie seulement les sommes de contrôle")
+    load.set_defaults(func=restore)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,15 @@ Script de scraping pour enrichir automatiquement data.json
 Ajoute du contenu depuis diverses sources web
 """
 
-import json
 import requests
 from bs4 import BeautifulSoup
 from pathlib import Path
 from datetime import datetime
 import time
 
+from content_dedup import KIND_CARD, KIND_EXPRESSION, KIND_ITEM, DuplicateIndex, card_text, corpus_entries, item_text
+from content_store import ContentError, ContentStore
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
@@ -22,18 +24,64 @@ USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
 # =============================================================================
 
 def load_data():
-    """Charge le fichier data.json"""
-    if DATA_FILE.exists():
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return None
+    """Charge le fichier data.json (None s'il est absent ou invalide)"""
+    try:
+        data, _, _ = ContentStore(DATA_FILE).read()
+    except FileNotFoundError:
+        return None
+    except ContentError as e:
+        print(f"❌ {e}")
+        return None
+    return data
 
-def save_data(data):
-    """Sauvegarde dans data.json"""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def save_data(change):
+    """
+    Applique change(data) à la version la plus récente de data.json, sous
+    verrou et par écriture atomique : un import fait dans l'app pendant le
+    scraping n'est pas écrasé, et l'app ne lit jamais un fichier incomplet.
+    """
+    ContentStore(DATA_FILE).update(change)
     print(f"✅ Données sauvegardées dans {DATA_FILE}")
 
+def merge_new_content(data, cards=(), lessons=(), fiches=(), chapters=()):
+    """
+    Ajoute le contenu généré à data en écartant les quasi-doublons (MinHash)
+    du contenu existant et du lot lui-même : cartes, expressions des
+    chapitres, phrases clés des fiches et éléments entiers. Affiche ce qui
+    a été écarté.
+    """
+    index = DuplicateIndex.from_entries(corpus_entries(data))
+    skipped = []
+    
+    def unique(kind, text, label):
+        match = index.add_unique(kind, text, label)
+        if match is not None:
+            skipped.append(f"{kind} « {label} » ≈ « {match} »")
+        return match is None
+    
+    for card in cards:
+        if unique(KIND_CARD, card_text(card), f"{card['front']} → {card['back']}"):
+            data["srs_cards"].append(card)
+    
+    targets = (("40_lecons", "lessons", lessons), ("etre_pro", "fiches", fiches),
+               ("800_expressions", "chapters", chapters))
+    for book_key, content_key, items in targets:
+        for item in items:
+            emptied = False  # Toutes ses expressions étaient déjà présentes
+            for key in ("expressions", "phrases_cles"):
+                if key in item:
+                    kept = [expression for expression in item[key]
+                            if unique(KIND_EXPRESSION, expression["en"], expression["en"])]
+                    emptied = emptied or (bool(item[key]) and not kept)
+                    item[key] = kept
+            if not emptied and unique(KIND_ITEM, item_text(item), item.get("title", "")):
+                data["books"][book_key][content_key].append(item)
+    
+    for message in skipped:
+        print(f"   ⏭️  Quasi-doublon écarté : {message}")
+    if skipped:
+        print(f"🪞 {len(skipped)} quasi-doublon(s) écarté(s)")
+
 def fetch_page(url):
     """Récupère le contenu HTML d'une page"""
     try:
@@ -456,47 +504,39 @@ def main():
     
     choice = input("\nTon choix (0-5) : ").strip()
     
-    # Traiter le choix
+    # Traiter le choix (contenu généré d'abord, data.json verrouillé seulement à l'écriture)
     if choice == "1":
         new_cards = scrape_basic_vocabulary()
-        data["srs_cards"].extend(new_cards)
-        save_data(data)
+        save_data(lambda data: merge_new_content(data, cards=new_cards))
     
     elif choice == "2":
         new_lessons = generate_grammar_lessons()
-        data["books"]["40_lecons"]["lessons"].extend(new_lessons)
-        save_data(data)
+        save_data(lambda data: merge_new_content(data, lessons=new_lessons))
     
     elif choice == "3":
         new_fiches = generate_professional_fiches()
-        data["books"]["etre_pro"]["fiches"].extend(new_fiches)
-        save_data(data)
+        save_data(lambda data: merge_new_content(data, fiches=new_fiches))
     
     elif choice == "4":
         new_chapters = add_expressions_chapter()
-        data["books"]["800_expressions"]["chapters"].extend(new_chapters)
-        save_data(data)
+        save_data(lambda data: merge_new_content(data, chapters=new_chapters))
     
     elif choice == "5":
         print("\n🔄 Ajout de tout le contenu...")
         
         # Vocabulaire
         new_cards = scrape_basic_vocabulary()
-        data["srs_cards"].extend(new_cards)
         
         # Leçons
         new_lessons = generate_grammar_lessons()
-        data["books"]["40_lecons"]["lessons"].extend(new_lessons)
         
         # Fiches pro
         new_fiches = generate_professional_fiches()
-        data["books"]["etre_pro"]["fiches"].extend(new_fiches)
         
         # Expressions
         new_chapters = add_expressions_chapter()
-        data["books"]["800_expressions"]["chapters"].extend(new_chapters)
         
-        save_data(data)
+        save_data(lambda data: merge_new_content(data, new_cards, new_lessons, new_fiches, new_chapters))
         print("\n✅ Tout le contenu a été ajouté !")
     
     elif choice == "0":
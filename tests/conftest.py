@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Les modules de l'application sont à la racine du dépôt
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Base SQLite neuve (un shard) dans un dossier temporaire"""
+    from app import DatabaseManager
+    
+    monkeypatch.chdir(tmp_path)  # shards.json et verrous restent dans le dossier du test
+    manager = DatabaseManager(str(tmp_path / "progress.db"), shard_count=1, archive_dir=tmp_path / "archives")
+    yield manager
+    for pool in manager.pools:
+        pool.close()
@@ -0,0 +1,95 @@
+"""Comparaison tolérante des réponses et correction des exercices"""
+
+import random
+
+import pytest
+
+from app import AnswerMatcher, bounded_edit_distance, check_exercise
+
+
+def levenshtein(a, b):
+    """Distance de référence (programmation dynamique)"""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def test_bounded_edit_distance_matches_levenshtein():
+    rng = random.Random(7)
+    for _ in range(3000):
+        a = "".join(rng.choice("abcd ") for _ in range(rng.randint(0, 12)))
+        b = "".join(rng.choice("abcd ") for _ in range(rng.randint(0, 12)))
+        limit = rng.randint(0, 4)
+        expected = levenshtein(a, b)
+        assert bounded_edit_distance(a, b, limit) == (expected if expected <= limit else limit + 1)
+
+
+def test_bounded_edit_distance_long_words():
+    # Au-delà de 64 caractères, les vecteurs de bits dépassent un mot machine
+    a = "internationalisation" * 5
+    b = a[:40] + "x" + a[41:]
+    assert bounded_edit_distance(a, b, 2) == 1
+
+
+def test_matcher_uses_deletion_index_for_many_answers():
+    answers = [f"answer{i:03d}" for i in range(100)]
+    matcher = AnswerMatcher(answers)
+    assert matcher.classify("answer042") == AnswerMatcher.EXACT
+    assert matcher.classify("answr042") == AnswerMatcher.NEAR_MISS
+    assert matcher.classify("completely different") == AnswerMatcher.WRONG
+
+
+def test_qcm():
+    exercise = {"type": "qcm", "question": "?", "options": ["a", "an", "the"], "answer": 1}
+    assert check_exercise(exercise, "an")["correct"] is True
+    assert check_exercise(exercise, "the")["correct"] is False
+
+
+@pytest.mark.parametrize("given, correct, near_miss", [
+    ("plays", True, False),
+    ("PLAYS ", True, False),
+    ("plais", True, True),
+    ("played", False, False),
+])
+def test_trous_tolerates_typos(given, correct, near_miss):
+    exercise = {"type": "trous", "question": "She ___ (play) piano.", "answer": "plays"}
+    result = check_exercise(exercise, given)
+    assert result["correct"] is correct
+    assert result["near_miss"] is near_miss
+
+
+def test_trous_with_several_words_does_not_accept_typos():
+    exercise = {"type": "trous", "question": "___ a student.", "answer": "I am"}
+    result = check_exercise(exercise, "I an")
+    assert result["correct"] is False
+
+
+def test_transformation_near_miss_is_only_feedback():
+    exercise = {"type": "transformation", "question": "She work. (3e personne)",
+                "answer": "She works.", "alternatives": ["He works."]}
+    assert check_exercise(exercise, "He works.")["correct"] is True
+    result = check_exercise(exercise, "She work.")
+    assert result["correct"] is False
+    assert result["near_miss"] is True
+
+
+def test_correction_rejects_the_erroneous_sentence():
+    exercise = {"type": "correction", "question": "Corrige : I am a students.", "answer": "I am a student."}
+    assert check_exercise(exercise, "I am a student.")["correct"] is True
+    result = check_exercise(exercise, "I am a students.")
+    assert result["correct"] is False
+    assert result["near_miss"] is False
+
+
+def test_correction_without_question_is_not_accepted_on_near_miss():
+    exercise = {"type": "correction", "answer": "I am a student."}
+    assert check_exercise(exercise, "I am a students.")["correct"] is False
+
+
+def test_production_is_not_graded():
+    exercise = {"type": "production", "question": "Décris ta journée."}
+    assert check_exercise(exercise, "I goes to school.")["correct"] is None
@@ -0,0 +1,79 @@
+"""Archivage des utilisateurs inactifs et retour à la connexion"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+
+def age_user(db, username, days):
+    """Recule toute l'activité d'un utilisateur de days jours"""
+    old = datetime.now() - timedelta(days=days)
+    with db.connection(username) as conn, conn:
+        conn.execute("UPDATE users SET created_at=? WHERE username=?", (old.isoformat(), username))
+        conn.execute("UPDATE progress SET completed_at=? WHERE username=?", (old.isoformat(), username))
+        conn.execute("UPDATE srs_cards SET last_review=? WHERE username=?", (int(old.timestamp()), username))
+
+
+def user_rows(db, username):
+    with db.connection(username) as conn:
+        return {
+            table: sorted(conn.execute(f"SELECT * FROM {table} WHERE username=?", (username,)).fetchall())
+            for table in db.USER_TABLES
+        }
+
+
+def test_archive_inactive_users_and_restore_on_login(db):
+    for username in ("idle", "active"):
+        db.create_user(username)
+        db.add_srs_cards(username, [{"front": "chat", "back": "cat"}, {"front": "chien", "back": "dog"}])
+        db.mark_lesson_complete(username, "40_lecons", 1, 90)
+        db.update_srs_card(username, "chat", 4)
+        db.save_test_result(username, "a2", 1, 2, 20.0)
+    age_user(db, "idle", 400)
+    with db.connection("idle") as conn, conn:
+        conn.execute("UPDATE test_results SET taken_at='2020-01-01T00:00:00' WHERE username='idle'")
+    before = user_rows(db, "idle")
+    
+    assert db.archive_inactive_users(days=180) == 1
+    
+    assert db.archive_path("idle").exists()
+    assert all(rows == [] for rows in user_rows(db, "idle").values())
+    assert user_rows(db, "active")["srs_cards"]
+    with db.connection("idle") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM row_changes WHERE username='idle'").fetchone()[0] == 0
+    
+    # Reconnexion : toutes les lignes reviennent, l'archive disparaît
+    db.create_user("idle")
+    assert user_rows(db, "idle") == before
+    assert not db.archive_path("idle").exists()
+    assert db.get_user_stats("idle")["completed_lessons"] == 1
+
+
+def test_recent_activity_prevents_archiving(db):
+    db.create_user("back")
+    db.add_srs_card("back", "maison", "house")
+    age_user(db, "back", 400)
+    db.update_srs_card("back", "maison", 5)
+    assert db.archive_inactive_users(days=180) == 0
+    assert not db.archive_path("back").exists()
+
+
+def test_unknown_user_creation_does_not_touch_archives(db):
+    db.create_user("new")
+    assert user_rows(db, "new")["users"]
+    assert not db.archive_dir.exists() or not any(db.archive_dir.iterdir())
+
+
+def test_compaction_shrinks_the_shard(db):
+    for index in range(200):
+        username = f"user{index}"
+        db.create_user(username)
+        db.add_srs_cards(username, [{"front": f"mot{n}", "back": "x" * 200} for n in range(20)])
+        age_user(db, username, 400)
+    size = sqlite3.connect(db.router.paths[0]).execute("PRAGMA page_count").fetchone()[0]
+    
+    assert db.archive_inactive_users(days=180) == 200
+    
+    conn = sqlite3.connect(db.router.paths[0])
+    assert conn.execute("PRAGMA page_count").fetchone()[0] < size
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    conn.close()
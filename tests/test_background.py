@@ -0,0 +1,23 @@
+"""Tâches d'arrière-plan : une tâche en échec est journalisée sans bloquer les autres"""
+
+import app
+from app import BackgroundScheduler
+
+
+def test_failing_job_is_logged(tmp_path, monkeypatch):
+    logged = []
+    monkeypatch.setattr(app.logger, "exception", lambda message, *args: logged.append(message % args))
+    scheduler = BackgroundScheduler(None, None, lock_file=tmp_path / "scheduler.lock")
+    scheduler.jobs.clear()
+    ran = []
+    
+    def fail():
+        raise RuntimeError("data.json illisible")
+    
+    scheduler.add_job("contenu", 60, fail)
+    scheduler.add_job("optimisation", 60, lambda: ran.append(True), leader_only=True)
+    scheduler.run_pending()
+    
+    assert logged == ["Tâche d'arrière-plan « contenu » en échec"]
+    assert scheduler.jobs["contenu"]["last_error"] == "RuntimeError: data.json illisible"
+    assert ran == [True]
@@ -0,0 +1,90 @@
+"""Sauvegardes complètes et incrémentales, restauration"""
+
+import json
+import sqlite3
+
+import pytest
+
+from app import BackupManager
+
+
+def state(db, username):
+    with db.connection(username) as conn:
+        params = conn.execute("SELECT params, loss FROM scheduler_params WHERE username=?", (username,)).fetchall()
+    return sorted(db.export_srs_cards(username)), sorted(db.export_progress(username)), params
+
+
+def table_count(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def backups(db, tmp_path):
+    return BackupManager(db.router.paths, tmp_path / "backups")
+
+
+def test_full_incremental_restore_round_trip(db, backups):
+    db.create_user("alice")
+    db.add_srs_cards("alice", [{"front": f"word{i}", "back": f"mot{i}"} for i in range(5)])
+    db.mark_lesson_complete("alice", "40_lecons", 1, 80)
+    full = backups.snapshot()
+    
+    # Modifications couvertes par l'incrémentale, dont une suppression
+    db.update_srs_card("alice", "word0", 5)
+    db.add_srs_card("alice", "extra", "en plus")
+    db.mark_lesson_complete("alice", "40_lecons", 2, 60)
+    db.save_scheduler_params("alice", [1.0, 2.0], 0.5, 42)
+    with db.connection("alice") as conn, conn:
+        conn.execute("DELETE FROM srs_cards WHERE username='alice' AND front='word4'")
+        conn.execute("DELETE FROM progress WHERE username='alice' AND lesson_id=1")
+    db.refresh_due_counts()
+    expected = state(db, "alice")
+    incremental = backups.incremental(compress=True)
+    assert incremental["base"] == full["name"]
+    assert incremental["files"][0]["seq"] > full["files"][0]["seq"]
+    
+    # Après la sauvegarde : perdu à la restauration
+    db.add_srs_card("alice", "later", "plus tard")
+    db.update_srs_card("alice", "word1", 0)
+    
+    applied = backups.restore(incremental["name"])
+    
+    assert applied == [full["name"], incremental["name"]]
+    assert state(db, "alice") == expected
+    assert all(front != "word4" for front, *_ in expected[0])
+    # Tables dérivées vidées : comptage sur l'index en attendant le recalcul
+    assert table_count(db.router.paths[0], "due_counts") == 0
+    assert db.count_due_cards("alice") == 0
+
+
+def test_incremental_only_exports_new_tombstones(db, backups):
+    db.create_user("bob")
+    db.add_srs_cards("bob", [{"front": "a", "back": "b"}, {"front": "c", "back": "d"}])
+    with db.connection("bob") as conn, conn:
+        conn.execute("DELETE FROM srs_cards WHERE front='a'")
+    backups.snapshot()
+    first = backups.incremental()
+    with db.connection("bob") as conn, conn:
+        conn.execute("DELETE FROM srs_cards WHERE front='c'")
+    second = backups.incremental()
+    
+    def tombstones(manifest):
+        lines = (backups.backup_dir / manifest["name"] / manifest["files"][0]["file"]).read_text().splitlines()
+        return [json.loads(line)["deleted"] for line in lines if '"deleted"' in line]
+    
+    # La suppression de "a" date d'avant la sauvegarde complète
+    assert tombstones(first) == []
+    assert tombstones(second) == [{"username": "bob", "front": "c"}]
+
+
+def test_restore_refuses_tampered_backup(db, backups):
+    db.create_user("carol")
+    manifest = backups.snapshot()
+    stored = backups.backup_dir / manifest["name"] / manifest["files"][0]["file"]
+    stored.write_bytes(stored.read_bytes()[:-1] + b"x")
+    with pytest.raises(ValueError):
+        backups.restore(manifest["name"])
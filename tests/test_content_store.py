@@ -0,0 +1,75 @@
+"""Écritures verrouillées et atomiques de data.json"""
+
+import json
+import multiprocessing
+import threading
+
+import pytest
+
+from content_store import ContentError, ContentStore
+
+
+def append_items(path, prefix, count):
+    store = ContentStore(path)
+    for index in range(count):
+        store.update(lambda data: data["books"]["main"]["lessons"].append(f"{prefix}{index}"))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContentStore(tmp_path / "data.json")
+    assert store.create({"books": {"main": {"lessons": []}}})
+    return store
+
+
+def test_create_does_not_overwrite(store):
+    assert not store.create({"books": {}})
+    assert store.read()[0] == {"books": {"main": {"lessons": []}}}
+
+
+def test_concurrent_updates_are_not_lost(store):
+    threads = [threading.Thread(target=append_items, args=(store.path, f"t{n}-", 25)) for n in range(4)]
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=append_items, args=(store.path, f"p{n}-", 25)) for n in range(2)]
+    for worker in threads + processes:
+        worker.start()
+    for worker in threads + processes:
+        worker.join()
+    
+    lessons = store.read()[0]["books"]["main"]["lessons"]
+    assert len(lessons) == 150 and len(set(lessons)) == 150
+
+
+def test_failed_update_keeps_the_previous_version(store):
+    before = store.path.read_bytes()
+    
+    def break_structure(data):
+        data["books"] = []
+    
+    def fail(data):
+        data["books"]["main"]["lessons"].append("half")
+        raise RuntimeError("interrompu")
+    
+    with pytest.raises(ContentError):
+        store.update(break_structure)
+    with pytest.raises(RuntimeError):
+        store.update(fail)
+    
+    assert store.path.read_bytes() == before
+    assert [path.name for path in store.path.parent.iterdir() if path.name.endswith(".tmp")] == []
+
+
+def test_read_rejects_invalid_json(store):
+    store.path.write_text('{"books": {', encoding="utf-8")
+    with pytest.raises(ContentError):
+        store.read()
+    store.path.write_text(json.dumps({"lessons": []}), encoding="utf-8")
+    with pytest.raises(ContentError):
+        store.read()
+
+
+def test_signature_changes_with_each_write(store):
+    first = store.signature()
+    store.write({"books": {"main": {"lessons": ["a"]}}})
+    assert store.signature() != first
+    assert store.read()[2] == store.signature()
@@ -0,0 +1,80 @@
+"""Quasi-doublons du contenu (MinHash + LSH) et dédoublonnage des cartes SRS"""
+
+import random
+
+from app import InMemoryRepository, add_cards_to_srs
+from content_dedup import (
+    KIND_CARD, KIND_EXPRESSION, DuplicateIndex, MinHasher, compute_signatures,
+    find_near_duplicates, near_duplicate_groups, similarity,
+)
+from text_normalize import normalize_key
+
+WORDS = ("apple", "river", "window", "garden", "yellow", "market", "silent", "travel",
+         "number", "pocket", "winter", "castle", "butter", "planet", "forest", "ticket")
+
+
+def sentence(rng, length=8):
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 999)) for _ in range(length))
+
+
+def test_signature_ignores_case_accents_and_punctuation():
+    hasher = MinHasher()
+    assert normalize_key("Café, s'il VOUS plaît !") == "cafe s il vous plait"
+    assert similarity(hasher.signature("Café au lait !"), hasher.signature("cafe AU lait")) == 1.0
+
+
+def test_near_duplicate_groups_finds_planted_copies():
+    rng = random.Random(5)
+    texts = [sentence(rng) for _ in range(300)]
+    planted = {}
+    for original in range(0, 300, 30):
+        planted[len(texts)] = original
+        texts.append(texts[original] + "!")  # même texte normalisé, ponctuation en plus
+    entries = [(KIND_EXPRESSION, f"#{i}", texts[i]) for i in range(len(texts))]
+    
+    groups = near_duplicate_groups(entries, compute_signatures(texts, workers=1))
+    
+    found = {group[-1][1]: group[0][1] for group in groups}
+    assert found == {f"#{copy}": f"#{original}" for copy, original in planted.items()}
+
+
+def test_near_duplicate_groups_compares_within_kind():
+    texts = ["the cat is on the table", "the cat is on the table"]
+    entries = [(KIND_CARD, "a", texts[0]), (KIND_EXPRESSION, "b", texts[1])]
+    assert near_duplicate_groups(entries, compute_signatures(texts, workers=1)) == []
+
+
+def test_parallel_signatures_match_serial():
+    rng = random.Random(2)
+    texts = [sentence(rng, 4) for _ in range(4500)]
+    assert (compute_signatures(texts, workers=1) == compute_signatures(texts, workers=2)).all()
+
+
+def test_find_near_duplicates_in_data():
+    data = {
+        "srs_cards": [{"front": "How are you?", "back": "Comment vas-tu ?"},
+                      {"front": "how are you", "back": "comment vas tu"},
+                      {"front": "Good night", "back": "Bonne nuit"}],
+        "books": {},
+    }
+    groups = find_near_duplicates(data, workers=1)
+    assert [[where for _, where, _ in group] for group in groups] == [["srs_cards/0", "srs_cards/1"]]
+
+
+def test_add_unique_reports_the_kept_entry():
+    index = DuplicateIndex()
+    assert index.add_unique(KIND_CARD, "break the ice briser la glace", "break the ice") is None
+    assert index.add_unique(KIND_CARD, "Break the ice! Briser la glace.", "copie") == "break the ice"
+
+
+def test_add_cards_to_srs_only_skips_exact_keys():
+    db = InMemoryRepository()
+    db.create_user("alice")
+    db.add_srs_card("alice", "to look forward to", "avoir hâte de")
+    cards = [
+        {"front": "To look forward to!", "back": "avoir hate de"},      # même clé normalisée
+        {"front": "to look forward to it", "back": "en avoir hâte"},    # quasi-doublon : gardé
+        {"front": "to look forward to it", "back": "en avoir hâte"},    # répété dans le lot
+    ]
+    assert add_cards_to_srs(db, "alice", cards) == (1, 2)
+    assert sorted(front for front, _ in db.get_srs_keys("alice")) == ["to look forward to", "to look forward to it"]
@@ -0,0 +1,57 @@
+"""Export incrémental (row_changes) des cartes SRS et de la progression"""
+
+
+def export(db, watermarks=None):
+    """Enregistrements exportés et nouveaux filigranes"""
+    watermarks = list(watermarks or [0] * len(db.pools))
+    records = []
+    for shard, seq, chunk in db.iter_changes(watermarks, chunk_size=2):
+        watermarks[shard] = seq
+        records.extend(chunk)
+    return records, watermarks
+
+
+def summary(records):
+    return [(record["table"], record["op"], record["key"].get("front") or record["key"].get("lesson_id"))
+            for record in records]
+
+
+def test_iter_changes_follows_writes(db):
+    db.create_user("alice")
+    db.add_srs_cards("alice", [{"front": "chat", "back": "cat"}, {"front": "chien", "back": "dog"}])
+    db.mark_lesson_complete("alice", "40_lecons", 1, 60)
+    records, watermarks = export(db)
+    assert summary(records) == [("srs_cards", "upsert", "chat"), ("srs_cards", "upsert", "chien"),
+                                ("progress", "upsert", 1)]
+    assert records[0]["row"]["back"] == "cat"
+    assert export(db, watermarks)[0] == []
+    
+    # INSERT OR IGNORE : la carte déjà présente ne change pas, la nouvelle est exportée
+    db.add_srs_cards("alice", [{"front": "chat", "back": "cat"}, {"front": "oiseau", "back": "bird"}])
+    db.update_srs_card("alice", "chien", 5)
+    db.mark_lesson_complete("alice", "40_lecons", 1, 90)
+    records, watermarks = export(db, watermarks)
+    assert summary(records) == [("srs_cards", "upsert", "oiseau"), ("srs_cards", "upsert", "chien"),
+                                ("progress", "upsert", 1)]
+    assert records[1]["row"]["repetitions"] == 1
+    assert records[2]["row"]["score"] == 90
+
+
+def test_deleted_then_readded_card_is_exported_again(db):
+    db.create_user("bob")
+    db.add_srs_cards("bob", [{"front": "chat", "back": "cat"}])
+    _, watermarks = export(db)
+    with db.connection("bob") as conn, conn:
+        conn.execute("DELETE FROM srs_cards WHERE username='bob' AND front='chat'")
+    records, watermarks = export(db, watermarks)
+    assert summary(records) == [("srs_cards", "delete", "chat")]
+    assert records[0]["row"] is None
+    
+    # La pierre tombale ne doit pas masquer la carte ajoutée de nouveau (INSERT OR IGNORE, puis UPSERT)
+    db.add_srs_cards("bob", [{"front": "chat", "back": "cat"}])
+    records, watermarks = export(db, watermarks)
+    assert summary(records) == [("srs_cards", "upsert", "chat")]
+    db.add_srs_card("bob", "chat", "kitty")
+    records, _ = export(db, watermarks)
+    assert summary(records) == [("srs_cards", "upsert", "chat")]
+    assert records[0]["row"]["back"] == "kitty"
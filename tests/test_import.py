@@ -0,0 +1,58 @@
+"""Validation en flux des imports de data.json"""
+
+import io
+import json
+
+import pytest
+
+from app import ContentImporter, DataManager, JsonEventParser
+
+
+@pytest.fixture
+def importer(tmp_path):
+    data_file = tmp_path / "data.json"
+    data_file.write_text(json.dumps({"books": {}}), encoding='utf-8')
+    importer = ContentImporter(DataManager(data_file))
+    yield importer
+    importer.discard()
+
+
+def stage(importer, document):
+    return importer.stage(io.BytesIO(json.dumps(document).encode('utf-8')))
+
+
+@pytest.mark.parametrize("book_key, level", [("v10", "a2"), ("v1.0", "a.2")])
+def test_dotted_keys_are_validated(importer, book_key, level):
+    document = {
+        "books": {book_key: {"lessons": [{"id": "notint", "title": 5}]}},
+        "tests": {level: {"questions": 3}},
+    }
+    assert not stage(importer, document)
+    assert any("champ 'id'" in error for error in importer.errors)
+    assert any("champ 'title'" in error for error in importer.errors)
+    assert f"Test '{level}' : 'questions' doit être une liste" in importer.errors
+
+
+def test_dotted_keys_are_recorded(importer):
+    document = {
+        "meta": {"version": "1.2"},
+        "books": {"v1.0": {"lessons": [{"id": 1, "title": "Intro", "vocabulaire": [{"word": "a.b", "translation": "x"}]}]}},
+        "tests": {"a.2": {"questions": [{"question": "1 + 1 ?", "answer": "2"}]}},
+        "srs_cards": [{"front": "e.g.", "back": "par exemple"}],
+    }
+    assert stage(importer, document), importer.errors
+    assert importer.meta == {"version": "1.2"}
+    assert set(importer.hashes) == {"v1.0/lessons", "tests", "srs_cards"}
+    assert set(importer.hashes["tests"]) == {"a.2"}
+
+
+def test_section_types_are_checked(importer):
+    assert not stage(importer, {"books": 5, "srs_cards": {"front": "a"}})
+    assert "'books' n'a pas le type attendu" in importer.errors
+    assert "'srs_cards' n'a pas le type attendu" in importer.errors
+
+
+def test_event_parser_keeps_dotted_keys_in_map_key_events():
+    events = list(JsonEventParser(io.BytesIO(b'{"v1.0": [1]}'), chunk_size=3).events())
+    assert ("", "map_key", "v1.0") in events
+    assert [event for _, event, _ in events] == ["start_map", "map_key", "start_array", "number", "end_array", "end_map"]
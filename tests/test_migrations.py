@@ -0,0 +1,105 @@
+"""Chaîne de migrations appliquée à une base historique (dates ISO)"""
+
+import sqlite3
+from datetime import date, datetime
+
+from app import MIGRATIONS, DatabaseManager, EPOCH_ORDINAL, schema_version
+
+LEGACY_SCHEMA = """
+    CREATE TABLE users (
+        username TEXT PRIMARY KEY,
+        created_at TEXT,
+        current_level TEXT DEFAULT 'A1'
+    );
+    CREATE TABLE progress (
+        username TEXT,
+        book_key TEXT,
+        lesson_id INTEGER,
+        completed_at TEXT,
+        score INTEGER,
+        PRIMARY KEY (username, book_key, lesson_id)
+    );
+    CREATE TABLE srs_cards (
+        username TEXT,
+        front TEXT,
+        back TEXT,
+        interval REAL DEFAULT 1,
+        easiness REAL DEFAULT 2.5,
+        repetitions INTEGER DEFAULT 0,
+        next_review TEXT,
+        last_review TEXT,
+        PRIMARY KEY (username, front)
+    );
+"""
+
+
+def legacy_database(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO users (username, created_at) VALUES (?, ?)", [
+        ("alice", "2023-01-02T10:00:00"), ("bob", "2023-02-03T11:00:00"),
+    ])
+    conn.executemany("INSERT INTO progress VALUES (?, ?, ?, ?, ?)", [
+        ("alice", "40_lecons", 1, "2023-03-01T09:00:00", 80),
+        ("alice", "40_lecons", 2, "2023-03-02T09:00:00", 60),
+        ("bob", "40_lecons", 1, "2023-03-05T09:00:00", 100),
+    ])
+    conn.executemany("INSERT INTO srs_cards VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+        ("alice", "chat", "cat", 6, 2.6, 2, "2023-03-10", "2023-03-04T08:30:00"),
+        ("alice", "chien", "dog", 1, 2.5, 0, None, None),
+        ("bob", "maison", "house", 1, 2.5, 1, "2999-01-01", "2023-03-05T10:00:00"),
+    ])
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_database_is_migrated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "progress.db"
+    legacy_database(path)
+    
+    db = DatabaseManager(str(path), shard_count=1, archive_dir=tmp_path / "archives")
+    
+    conn = sqlite3.connect(path)
+    assert schema_version(conn) == MIGRATIONS[-1][0]
+    types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(srs_cards)")}
+    assert types["next_review"] == "INTEGER" and types["last_review"] == "INTEGER"
+    cards = {row[0]: row[1:] for row in conn.execute(
+        "SELECT front, next_review, last_review FROM srs_cards WHERE username='alice'")}
+    assert cards["chat"] == (date(2023, 3, 10).toordinal() - EPOCH_ORDINAL,
+                             int(datetime(2023, 3, 4, 8, 30).timestamp()))
+    assert cards["chien"] == (0, None)
+    # Toutes les lignes existantes sont dans le journal de l'export incrémental
+    assert conn.execute("SELECT COUNT(*) FROM row_changes").fetchone()[0] == 6
+    conn.close()
+    
+    # Totaux matérialisés recalculés depuis la progression
+    stats = db.get_user_stats("alice")
+    assert stats["completed_lessons"] == 2
+    assert stats["average_score"] == 70
+    assert db.count_due_cards("alice") == 2
+    assert db.count_due_cards("bob") == 0
+    assert [row["username"] for row in db.get_leaderboard(by="lessons")] == ["alice", "bob"]
+    
+    # L'application continue de fonctionner sur la base migrée
+    db.update_srs_card("alice", "chien", 5)
+    assert db.count_due_cards("alice") == 1
+    for pool in db.pools:
+        pool.close()
+
+
+def test_migrations_are_applied_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "progress.db"
+    legacy_database(path)
+    first = DatabaseManager(str(path), shard_count=1)
+    again = DatabaseManager(str(path), shard_count=1, migrate=False)
+    
+    assert again.init_database() == [[]]
+    conn = sqlite3.connect(path)
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    conn.close()
+    assert versions == [migration[0] for migration in MIGRATIONS]
+    for manager in (first, again):
+        for pool in manager.pools:
+            pool.close()
@@ -0,0 +1,145 @@
+"""Planificateurs SM-2 / FSRS et prévision de la charge de révision"""
+
+import numpy as np
+
+from app import (
+    FSRSScheduler, ForecastCache, InMemoryRepository, ReviewState, SM2Scheduler,
+    epoch_day, forecast_reviews, sm2_review, sm2_review_many,
+)
+
+
+def new_state():
+    return ReviewState(interval=1, easiness=2.5, repetitions=0, stability=None, difficulty=None)
+
+
+def test_sm2_intervals():
+    interval, easiness, repetitions = 1, 2.5, 0
+    intervals = []
+    for _ in range(4):
+        interval, easiness, repetitions = sm2_review(interval, easiness, repetitions, 5)
+        intervals.append(interval)
+    assert intervals == [1, 6, 17, 50]
+    failed = sm2_review(interval, easiness, repetitions, 2)
+    assert failed[::2] == (1, 0)
+    assert np.isclose(failed[1], easiness - 0.32)
+
+
+def test_sm2_easiness_floor():
+    _, easiness, _ = sm2_review(10, 1.3, 5, 0)
+    assert easiness == 1.3
+
+
+def test_sm2_vectorised_matches_scalar():
+    rng = np.random.default_rng(3)
+    interval = rng.integers(1, 100, 500).astype(float)
+    easiness = rng.uniform(1.3, 3.0, 500)
+    repetitions = rng.integers(0, 6, 500).astype(float)
+    quality = rng.integers(0, 6, 500).astype(float)
+    many = sm2_review_many(interval, easiness, repetitions, quality)
+    for i in range(500):
+        expected = sm2_review(interval[i], easiness[i], repetitions[i], quality[i])
+        assert many[0][i] == expected[0]
+        assert np.isclose(many[1][i], expected[1])
+        assert many[2][i] == expected[2]
+
+
+def test_sm2_scheduler_keeps_fsrs_fields():
+    state = SM2Scheduler().review(new_state()._replace(stability=3.0, difficulty=5.0), 4, 1)
+    assert (state.interval, state.repetitions) == (1, 1)
+    assert (state.stability, state.difficulty) == (3.0, 5.0)
+
+
+def test_fsrs_interval_targets_retention():
+    scheduler = FSRSScheduler(desired_retention=0.9)
+    # Par définition de la stabilité, le rappel tombe à 90 % après stability jours
+    assert scheduler.next_interval(20.0) == 20
+    assert np.isclose(FSRSScheduler.retrievability(20.0, 20.0), 0.9)
+
+
+def test_fsrs_success_grows_and_failure_resets():
+    scheduler = FSRSScheduler()
+    state = scheduler.review(new_state(), 4, 0)
+    assert state.repetitions == 1 and state.stability > 0
+    good = scheduler.review(state, 4, state.interval)
+    assert good.stability > state.stability and good.interval >= state.interval
+    failed = scheduler.review(good, 0, good.interval)
+    assert failed.repetitions == 0
+    assert failed.stability <= good.stability
+    assert failed.difficulty > good.difficulty
+
+
+def test_fsrs_uses_learner_params():
+    params = FSRSScheduler.DEFAULT_PARAMS.copy()
+    params[2] *= 2  # stabilité initiale d'une note « bien »
+    default = FSRSScheduler().review(new_state(), 4, 0)
+    fitted = FSRSScheduler().review(new_state(), 4, 0, params)
+    assert np.isclose(fitted.stability, 2 * default.stability)
+
+
+def sample_schedule(today, size=2000):
+    rng = np.random.default_rng(1)
+    return [
+        (today + int(rng.integers(-5, 20)), int(rng.integers(1, 30)), float(rng.uniform(1.3, 2.8)),
+         int(rng.integers(0, 5)))
+        for _ in range(size)
+    ]
+
+
+def test_forecast_is_deterministic():
+    today = 20000
+    schedule = sample_schedule(today)
+    first = forecast_reviews(schedule, days=30, today=today, seed=4)
+    assert np.array_equal(first, forecast_reviews(schedule, days=30, today=today, seed=4))
+    assert len(first) == 30
+
+
+def test_forecast_counts_due_cards():
+    today = 20000
+    schedule = sample_schedule(today)
+    reviews = forecast_reviews(schedule, days=30, today=today)
+    # Le jour 0 reprend les cartes en retard, chaque carte passe au moins une fois
+    assert reviews[0] == sum(1 for row in schedule if row[0] <= today)
+    assert reviews.sum() >= len(schedule)
+    # Toujours réussies : SM-2 n'écourte jamais un intervalle
+    perfect = forecast_reviews(schedule, days=30, quality_probs={5: 1.0}, today=today)
+    assert perfect.sum() <= reviews.sum()
+
+
+def test_forecast_cache_recomputes_on_deck_change():
+    db = InMemoryRepository()
+    db.create_user("alice")
+    cache = ForecastCache()
+    assert cache.get(db, "alice") is None
+    
+    db.add_srs_cards("alice", [{"front": "cat", "back": "chat"}, {"front": "dog", "back": "chien"}])
+    first = cache.get(db, "alice")
+    assert first.sum() >= 2 and first[1] == 2
+    assert cache.get(db, "alice") is first
+    
+    db.update_srs_card("alice", "cat", 5)
+    assert cache.get(db, "alice") is not first
+    assert cache.entries["alice"][0] == (epoch_day(), db.get_deck_version("alice"))
+
+
+def test_forecast_cache_is_bounded():
+    db = InMemoryRepository()
+    cache = ForecastCache(max_users=2)
+    for username in ("a", "b", "c"):
+        db.create_user(username)
+        cache.get(db, username)
+    assert list(cache.entries) == ["b", "c"]
+
+
+def test_sqlite_deck_version_follows_card_changes(db):
+    db.create_user("alice")
+    assert db.get_deck_version("alice") == 0
+    db.add_srs_cards("alice", [{"front": "cat", "back": "chat"}])
+    added = db.get_deck_version("alice")
+    assert added > 0
+    db.update_srs_card("alice", "cat", 4)
+    reviewed = db.get_deck_version("alice")
+    assert reviewed > added
+    # Les cartes d'un autre apprenant ne changent pas la version
+    db.create_user("bob")
+    db.add_srs_cards("bob", [{"front": "dog", "back": "chien"}])
+    assert db.get_deck_version("alice") == reviewed
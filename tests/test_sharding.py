@@ -0,0 +1,66 @@
+"""Changement du nombre de shards : refus au démarrage et redistribution"""
+
+import json
+
+import pytest
+
+from app import DatabaseManager
+
+USERS = ("alice", "bob", "carol", "dave", "eve", "frank")
+
+
+def open_db(tmp_path, shard_count):
+    return DatabaseManager(str(tmp_path / "progress.db"), shard_count, archive_dir=tmp_path / "archives")
+
+
+def close(db):
+    for pool in db.pools:
+        pool.close()
+
+
+def test_upgrade_from_single_file_to_shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = open_db(tmp_path, 1)
+    for username in USERS:
+        db.create_user(username)
+        db.add_srs_cards(username, [{"front": f"mot de {username}", "back": "word"}])
+        db.mark_lesson_complete(username, "40_lecons", 1, 80)
+    close(db)
+    
+    # Sans redistribution, les utilisateurs existants seraient cherchés dans des shards vides
+    with pytest.raises(ValueError, match="rebalance"):
+        open_db(tmp_path, 4)
+    assert not (tmp_path / "shards.json").exists()
+    
+    db = open_db(tmp_path, None)
+    assert db.rebalance(4) > 0
+    close(db)
+    assert len(json.loads((tmp_path / "shards.json").read_text(encoding='utf-8'))["shards"]) == 4
+    
+    db = open_db(tmp_path, 4)
+    assert len(db.pools) == 4
+    for username in USERS:
+        assert db.get_srs_keys(username) == [(f"mot de {username}", "word")]
+        assert db.router.shard_for(username) in range(4)
+    assert db.get_global_stats() == {"users": len(USERS), "completed_lessons": len(USERS), "srs_cards": len(USERS)}
+    
+    # Le nombre de shards en service ne change plus sans rebalance
+    with pytest.raises(ValueError, match="4 shard"):
+        open_db(tmp_path, 8)
+    with pytest.raises(ValueError):
+        open_db(tmp_path, 1)
+    
+    # Retour à un seul shard : les shards retirés sont vidés
+    assert db.rebalance(1) > 0
+    close(db)
+    db = open_db(tmp_path, 1)
+    assert all(db.get_srs_keys(username) == [(f"mot de {username}", "word")] for username in USERS)
+    close(db)
+
+
+def test_new_install_creates_shard_map(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = open_db(tmp_path, 3)
+    assert [path.name for path in db.router.paths] == ["progress.db", "progress_1.db", "progress_2.db"]
+    close(db)
+    close(open_db(tmp_path, 3))
@@ -0,0 +1,69 @@
+"""Correcteur orthographique (index SymSpell en mmap)"""
+
+import gc
+import os
+import weakref
+
+from app import GrammarAnalyzer, SpellingIndex
+
+
+def lesson_data(*words):
+    vocabulary = [{"word": word, "translation": word} for word in words]
+    return {"books": {"40_lecons": {"lessons": [{"id": 1, "title": "Test", "vocabulaire": vocabulary}]}}}
+
+
+def open_descriptors():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def test_check_and_suggest(tmp_path):
+    words = tmp_path / "words.txt"
+    words.write_text("the\nhouse\nhas\nwindow\nbeautiful\n", encoding="utf-8")
+    index = SpellingIndex.load({}, words, tmp_path / "spelling.idx")
+    
+    assert index.known("houses") and index.known("windows")
+    assert index.check("The hous has a beatiful window.") == [("hous", ["house"]), ("beatiful", ["beautiful"])]
+    assert index.suggest("teh") == ["the"]
+    index.close()
+
+
+def test_reload_reuses_or_closes_the_mapping(tmp_path):
+    words, path = tmp_path / "words.txt", tmp_path / "spelling.idx"
+    words.write_text("the\nhouse\n", encoding="utf-8")
+    first = SpellingIndex.load(lesson_data("garden"), words, path)
+    # Nouvelle version du contenu, même dictionnaire : même index ouvert
+    assert SpellingIndex.load(lesson_data("garden"), words, path) is first
+    
+    descriptors = open_descriptors()
+    for round_ in range(20):
+        current = SpellingIndex.load(lesson_data("garden", f"word{round_}"), words, path)
+    
+    assert first.closed and not current.closed
+    assert first.check("the hous") == []
+    assert current.check("the hous") == [("hous", ["house"])]
+    assert open_descriptors() <= descriptors + 1
+    current.close()
+    current.close()
+
+
+def test_grammar_cache_is_keyed_on_the_index_signature(tmp_path):
+    words, path = tmp_path / "words.txt", tmp_path / "spelling.idx"
+    words.write_text("the\nhouse\n", encoding="utf-8")
+    first = SpellingIndex.load(lesson_data("garden"), words, path)
+    hints = GrammarAnalyzer.analyze("the  hous", first)
+    assert any("hous" in hint for hint in hints)
+    
+    # Même vocabulaire rouvert : les analyses déjà faites restent valables
+    first.close()
+    again = SpellingIndex.load(lesson_data("garden"), words, path)
+    assert again is not first and again.signature == first.signature
+    hits = GrammarAnalyzer.cache_info().hits
+    assert GrammarAnalyzer.analyze("the hous", again) == hints
+    assert GrammarAnalyzer.cache_info().hits == hits + 1
+    
+    # Le cache ne retient aucun index (un index fermé peut être libéré)
+    closed = weakref.ref(first)
+    del first
+    gc.collect()
+    assert closed() is None
+    again.close()
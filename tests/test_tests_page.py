@@ -0,0 +1,22 @@
+"""Enregistrement des tests de niveau et agrégats par niveau"""
+
+import pytest
+
+from app import InMemoryRepository
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def repo(request, db):
+    return db if request.param == "sqlite" else InMemoryRepository()
+
+
+def test_test_stats_aggregate_attempts(repo):
+    repo.create_user("alice")
+    repo.save_test_result("alice", "a2", 1, 3, 9.0)
+    repo.save_test_result("alice", "a2", 2, 3, 6.0)
+    
+    stats = repo.get_test_stats("alice", "a2")
+    assert stats["attempts"] == 2
+    assert stats["best_score"] == pytest.approx(2 / 3)
+    assert stats["seconds_per_question"] == pytest.approx(15 / 6)
+    assert repo.get_test_stats("alice", "b1") is None
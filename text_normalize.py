@@ -0,0 +1,26 @@
+"""
+Normalisation des textes, partagée par l'app et content_dedup.py
+(bibliothèque standard uniquement : utilisable sans streamlit)
+
+Une seule définition des clés de comparaison : la recherche, le
+dédoublonnage des cartes SRS et la détection des quasi-doublons voient
+les mêmes mots.
+"""
+
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def normalize_text(text):
+    """Met un texte en minuscules et retire les accents (é → e, ç → c)"""
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def tokenize(text):
+    """Découpe un texte FR/EN en mots normalisés (sans accents)"""
+    return TOKEN_RE.findall(normalize_text(text))
+
+def normalize_key(text):
+    """Clé de comparaison insensible à la casse, aux accents et à la ponctuation"""
+    return " ".join(tokenize(text))